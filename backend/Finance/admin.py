@@ -1,11 +1,23 @@
 from django.contrib import admin
-from .models import Invoice, Payment, RevenueEntry, ExpenseEntry
+from .models import Invoice, InvoiceLine, Payment, RevenueEntry, ExpenseEntry, FinancialPeriodSnapshot
+
+class InvoiceLineInline(admin.TabularInline):
+	# Read-only: edits go through the API so subtotal/total are recomputed
+	model = InvoiceLine
+	fields = ('position','code','name','medicine','quantity','unit_price','amount')
+	readonly_fields = fields
+	extra = 0
+	can_delete = False
+
+	def has_add_permission(self, request, obj=None):
+		return False
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
 	list_display = ('id','patient','total','status','created_at')
 	search_fields = ('patient__name','patient__medical_id')
 	list_filter = ('status','created_at')
+	inlines = [InvoiceLineInline]
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -24,4 +36,9 @@ class RevenueEntryAdmin(admin.ModelAdmin):
 class ExpenseEntryAdmin(admin.ModelAdmin):
 	list_display = ('id','occurred_on','category','vendor','amount','recorded_by')
 	search_fields = ('vendor','description','reference')
-	list_filter = ('category','occurred_on')
\ No newline at end of file
+	list_filter = ('category','occurred_on')
+
+@admin.register(FinancialPeriodSnapshot)
+class FinancialPeriodSnapshotAdmin(admin.ModelAdmin):
+	list_display = ('month','cash_collected','computed_at')
+	readonly_fields = ('month','revenue_by_category','expenses_by_category','cash_collected','computed_at')
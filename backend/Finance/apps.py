@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FinanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Finance'
+
+    def ready(self):
+        from .models import connect_signals
+        connect_signals()
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:32
+
+import django.db.models.expressions
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_paid(apps, schema_editor):
+    Invoice = apps.get_model('Finance', 'Invoice')
+    Payment = apps.get_model('Finance', 'Payment')
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk'))
+        .order_by().values('invoice').annotate(total=Sum('amount')).values('total')
+    )
+    Invoice.objects.update(
+        amount_paid=Coalesce(Subquery(paid, output_field=models.DecimalField()), Decimal('0'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Finance', '0006_financial_period_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_amount_paid, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='invoice',
+            name='balance',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('total'), '-', models.F('amount_paid')), output_field=models.DecimalField(decimal_places=2, max_digits=12)),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['balance'], name='invoice_balance_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:36
+
+import re
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MEDICINE_CODE = re.compile(r'^MED-(\d+)$')
+QUANTITY_SUFFIX = re.compile(r'\(x(\d+)\)\s*$')
+BATCH_SIZE = 2000
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def services_to_lines(apps, schema_editor):
+    """Copy each invoice's services JSON into InvoiceLine rows (entries with no usable amount are dropped, as recalc skipped them)."""
+    Invoice = apps.get_model('Finance', 'Invoice')
+    InvoiceLine = apps.get_model('Finance', 'InvoiceLine')
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    medicine_ids = set(Medicine.objects.values_list('id', flat=True))
+
+    batch = []
+    for invoice_id, services in Invoice.objects.order_by('pk').values_list('id', 'services').iterator(chunk_size=BATCH_SIZE):
+        for position, item in enumerate(services if isinstance(services, list) else []):
+            if not isinstance(item, dict):
+                continue
+            amount = _decimal(item.get('amount') or 0)
+            if amount is None:
+                continue
+            code = str(item.get('code') or '')[:50]
+            name = str(item.get('name') or '')[:255]
+            medicine_id = None
+            quantity = 1
+            match = MEDICINE_CODE.match(code)
+            if match and int(match.group(1)) in medicine_ids:
+                medicine_id = int(match.group(1))
+                suffix = QUANTITY_SUFFIX.search(name)
+                if suffix and int(suffix.group(1)) > 0:
+                    quantity = int(suffix.group(1))
+            batch.append(InvoiceLine(
+                invoice_id=invoice_id,
+                position=position,
+                code=code,
+                name=name,
+                medicine_id=medicine_id,
+                quantity=quantity,
+                unit_price=(amount / quantity).quantize(Decimal('0.01')),
+                amount=amount,
+            ))
+        if len(batch) >= BATCH_SIZE:
+            InvoiceLine.objects.bulk_create(batch)
+            batch = []
+    InvoiceLine.objects.bulk_create(batch)
+
+
+def lines_to_services(apps, schema_editor):
+    Invoice = apps.get_model('Finance', 'Invoice')
+    InvoiceLine = apps.get_model('Finance', 'InvoiceLine')
+    services = {}
+    for invoice_id, code, name, amount in InvoiceLine.objects.order_by('invoice', 'position').values_list(
+        'invoice_id', 'code', 'name', 'amount'
+    ).iterator(chunk_size=BATCH_SIZE):
+        services.setdefault(invoice_id, []).append({'code': code, 'name': name, 'amount': float(amount)})
+    for invoice_id, items in services.items():
+        Invoice.objects.filter(pk=invoice_id).update(services=items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Finance', '0007_invoice_amount_paid_balance'),
+        ('pharmacy', '0013_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('code', models.CharField(blank=True, max_length=50)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='Finance.invoice')),
+                ('medicine', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice_lines', to='pharmacy.medicine')),
+            ],
+            options={
+                'ordering': ['invoice', 'position'],
+                'indexes': [models.Index(fields=['code', 'invoice'], name='invoiceline_code_idx'), models.Index(condition=models.Q(('medicine__isnull', False)), fields=['medicine', 'invoice'], name='invoiceline_medicine_idx')],
+            },
+        ),
+        migrations.RunPython(services_to_lines, lines_to_services),
+        migrations.RemoveField(
+            model_name='invoice',
+            name='services',
+        ),
+    ]
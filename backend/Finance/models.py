@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from decimal import Decimal
 from django.utils import timezone
 from django.core.validators import MinValueValidator
+from datetime import datetime
 
 # Create your models here.
 
@@ -10,37 +14,160 @@ class Invoice(models.Model):
 	patient = models.ForeignKey('patients.Patient', on_delete=models.CASCADE, related_name='invoices')
 	prescription = models.ForeignKey('patients.Prescription', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
 	created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='created_invoices')
-	services = models.JSONField(default=list)  # [{code, name, amount}]
+	# Line items live in InvoiceLine; subtotal is their sum (set_lines)
 	subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	# Sum of this invoice's payments, kept by Payment.save/delete with F() updates
+	# (see apply_payment); reconcile_invoice_balances checks it against the payments.
+	amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+	balance = models.GeneratedField(
+		expression=F('total') - F('amount_paid'),
+		output_field=models.DecimalField(max_digits=12, decimal_places=2),
+		db_persist=True,
+	)
 	status = models.CharField(max_length=20, choices=[('DUE','Due'),('PAID','Paid'),('VOID','Void')], default='DUE')
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	class Meta:
+		indexes = [
+			# PAID-invoice gate in PrescriptionDispenseSerializer.validate
+			models.Index(fields=['prescription', 'status'], name='invoice_presc_status_idx'),
+			models.Index(fields=['status', '-created_at'], name='invoice_status_created_idx'),
+			models.Index(fields=['-created_at', '-id'], name='invoice_created_id_idx'),
+			# accounts receivable and the DUE worklists
+			models.Index(fields=['-created_at'], name='invoice_due_created_idx', condition=models.Q(status='DUE')),
+			# outstanding / balance filters on the invoice list
+			models.Index(fields=['balance'], name='invoice_balance_idx'),
+		]
+
 	def recalc(self):
 		# Ensure arithmetic uses Decimal consistently
-		subtotal = Decimal('0')
-		for s in (self.services or []):
-			amt = s.get('amount', 0) or 0
-			# Convert any float/int/string to Decimal safely
-			try:
-				subtotal += Decimal(str(amt))
-			except Exception:
-				# Skip invalid amounts rather than breaking invoice save
-				continue
-		self.subtotal = subtotal
+		subtotal = self.subtotal if isinstance(self.subtotal, Decimal) else Decimal(str(self.subtotal or 0))
 		discount = self.discount if isinstance(self.discount, Decimal) else Decimal(str(self.discount or 0))
-		total = self.subtotal - discount
+		total = subtotal - discount
 		self.total = total if total > Decimal('0') else Decimal('0')
 
+	@property
+	def services(self):
+		"""The line items in the old ``[{code, name, amount}]`` shape (uses prefetched lines)."""
+		return [
+			{'code': line.code, 'name': line.name, 'amount': line.amount, 'quantity': line.quantity,
+			 'unit_price': line.unit_price, 'medicine': line.medicine_id}
+			for line in self.lines.all()
+		]
+
+	def set_lines(self, lines):
+		"""
+		Replace this invoice's line items with ``lines`` (unsaved InvoiceLine
+		instances) and recompute subtotal/total from them with one SUM.
+		"""
+		with transaction.atomic():
+			self.lines.all().delete()
+			for position, line in enumerate(lines):
+				line.invoice = self
+				line.position = position
+				if line.amount is None:
+					line.amount = line.unit_price * line.quantity
+			InvoiceLine.objects.bulk_create(lines)
+			self.subtotal = self.lines.aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total']
+			self.save(update_fields=['subtotal', 'total', 'updated_at'])
+		getattr(self, '_prefetched_objects_cache', {}).pop('lines', None)
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._stored_status = instance.__dict__.get('status')
+		return instance
+
+	def _status_update(self):
+		"""
+		The status to write when saving an existing invoice, as an expression on
+		the row being updated. VOID is kept (or set when asked for); otherwise it
+		is PAID once the stored amount_paid covers the new total, like
+		apply_payment, so a status loaded before a concurrent payment is never
+		written back.
+		"""
+		if self.status == 'VOID':
+			return Value('VOID')
+		paid_or_due = Case(
+			When(amount_paid__gte=self.total, then=Value('PAID')),
+			default=Value('DUE'),
+		)
+		if self.status != getattr(self, '_stored_status', self.status):
+			# Explicitly taken out of VOID (or set to DUE/PAID): follow the amounts
+			return paid_or_due
+		return Case(When(status='VOID', then=Value('VOID')), default=paid_or_due)
+
 	def save(self, *args, **kwargs):
 		self.recalc()
+		update_fields = kwargs.get('update_fields')
+		if not self._state.adding:
+			if update_fields is None:
+				# amount_paid is only ever changed in the database (apply_payment); writing
+				# back the value loaded with this instance could undo a concurrent payment.
+				# status depends on it, so it is derived in the same UPDATE instead.
+				update_fields = [
+					f.name for f in self._meta.concrete_fields
+					if not f.primary_key and not f.generated and f.name not in ('amount_paid', 'status')
+				]
+			update_fields = set(update_fields)
+			if update_fields & {'subtotal', 'discount', 'total', 'status'} or kwargs.get('update_fields') is None:
+				self.status = self._status_update()
+				update_fields.add('status')
+			kwargs['update_fields'] = update_fields
 		super().save(*args, **kwargs)
+		if not isinstance(self.status, str):
+			self.refresh_from_db(fields=['status', 'amount_paid', 'balance'])
+			self._stored_status = self.status
+
+	@classmethod
+	def apply_payment(cls, invoice_id, amount):
+		"""
+		Add ``amount`` (negative to take a payment back) to the invoice's amount_paid
+		in one UPDATE, flipping DUE to PAID once it covers the total (and back).
+		The row lock taken by the UPDATE serializes concurrent payments.
+		"""
+		paid = F('amount_paid') + amount
+		return cls.objects.filter(pk=invoice_id).update(
+			amount_paid=paid,
+			status=Case(
+				When(status='DUE', total__lte=paid, then=Value('PAID')),
+				When(status='PAID', total__gt=paid, then=Value('DUE')),
+				default=F('status'),
+			),
+			updated_at=timezone.now(),
+		)
 
 	def __str__(self):
 		return f"Invoice #{self.id} for {self.patient}"
 
+class InvoiceLine(models.Model):
+	"""
+	One billed item. Amounts are gross, before the invoice-level discount, so
+	per-code / per-medicine revenue (Finance/reports.py) is a SUM over this table.
+	"""
+	invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='lines')
+	position = models.PositiveSmallIntegerField(default=0)
+	code = models.CharField(max_length=50, blank=True)  # e.g. MED-<id>, ADD-CHARGE, CONS
+	name = models.CharField(max_length=255, blank=True)
+	medicine = models.ForeignKey('pharmacy.Medicine', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoice_lines')
+	quantity = models.PositiveIntegerField(default=1)
+	unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+	class Meta:
+		ordering = ['invoice', 'position']
+		indexes = [
+			models.Index(fields=['code', 'invoice'], name='invoiceline_code_idx'),
+			models.Index(fields=['medicine', 'invoice'], name='invoiceline_medicine_idx', condition=models.Q(medicine__isnull=False)),
+		]
+
+	def __str__(self):
+		return f"{self.name or self.code} on Invoice #{self.invoice_id}"
+
+
 class Payment(models.Model):
 	invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
 	recorded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='recorded_payments')
@@ -49,11 +176,51 @@ class Payment(models.Model):
 	reference = models.CharField(max_length=100, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['-created_at', '-id'], name='payment_created_id_idx'),
+		]
+
 	def __str__(self):
 		return f"Payment {self.amount} on Invoice #{self.invoice_id}"
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._stored = (instance.__dict__.get('invoice_id'), instance.__dict__.get('amount'))
+		return instance
+
+	def save(self, *args, **kwargs):
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			old_invoice, old_amount = getattr(self, '_stored', (None, None))
+			if old_invoice is not None and (old_invoice, old_amount) != (self.invoice_id, self.amount):
+				Invoice.apply_payment(old_invoice, -old_amount)
+			if (old_invoice, old_amount) != (self.invoice_id, self.amount):
+				Invoice.apply_payment(self.invoice_id, self.amount)
+			self._stored = (self.invoice_id, self.amount)
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic():
+			Invoice.apply_payment(self.invoice_id, -self.amount)
+			return super().delete(*args, **kwargs)
+
 
-class RevenueEntry(models.Model):
+class SnapshotInvalidatingEntry:
+	"""Saving or deleting a dated entry drops the snapshot of its (closed) month (see connect_signals)."""
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._stored_occurred_on = instance.__dict__.get('occurred_on')
+		return instance
+
+	def save(self, *args, **kwargs):
+		super().save(*args, **kwargs)
+		self._stored_occurred_on = self.occurred_on
+
+
+class RevenueEntry(SnapshotInvalidatingEntry, models.Model):
 	class Category(models.TextChoices):
 		INVOICE_PAYMENT = 'INVOICE_PAYMENT', 'Invoice Payment'
 		GRANT = 'GRANT', 'Grant/Donation'
@@ -72,12 +239,15 @@ class RevenueEntry(models.Model):
 
 	class Meta:
 		ordering = ['-occurred_on', '-created_at']
+		indexes = [
+			models.Index(fields=['occurred_on', 'category'], name='revenue_occurred_cat_idx'),
+		]
 
 	def __str__(self):
 		return f"Revenue {self.amount} on {self.occurred_on}"
 
 
-class ExpenseEntry(models.Model):
+class ExpenseEntry(SnapshotInvalidatingEntry, models.Model):
 	class Category(models.TextChoices):
 		STOCK = 'STOCK', 'Inventory/Stock'
 		OPERATIONS = 'OPERATIONS', 'Operations'
@@ -97,6 +267,58 @@ class ExpenseEntry(models.Model):
 
 	class Meta:
 		ordering = ['-occurred_on', '-created_at']
+		indexes = [
+			models.Index(fields=['occurred_on', 'category'], name='expense_occurred_cat_idx'),
+		]
 
 	def __str__(self):
 		return f"Expense {self.amount} on {self.occurred_on}"
+
+
+class FinancialPeriodSnapshot(models.Model):
+	"""
+	Financial position figures for one closed calendar month, so reports over
+	past months don't rescan them (see Finance/reports.py). Written the first
+	time a report covers the month; dropped again when an entry or payment in
+	that month is saved or deleted, and rebuilt by ``rebuild_financial_snapshots``.
+	"""
+	month = models.DateField(unique=True)  # first day of the month
+	revenue_by_category = models.JSONField(default=dict)  # {category: "amount"}
+	expenses_by_category = models.JSONField(default=dict)
+	cash_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	computed_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['month']
+
+	def __str__(self):
+		return f"Financial snapshot {self.month:%Y-%m}"
+
+	@classmethod
+	def invalidate(cls, *days):
+		"""Forget the snapshots of the months containing these dates; the open month never has one."""
+		current = timezone.localdate().replace(day=1)
+		# occurred_on defaults to timezone.now, so a new entry can still hold a datetime
+		days = [timezone.localdate(d) if isinstance(d, datetime) else d for d in days if d is not None]
+		months = {d.replace(day=1) for d in days if d.replace(day=1) < current}
+		if months:
+			cls.objects.filter(month__in=months).delete()
+
+
+def _snapshot_days(instance):
+	if isinstance(instance, Payment):
+		return [timezone.localdate(instance.created_at)]
+	# Moving an entry to another date changes both months
+	return [instance.occurred_on, getattr(instance, '_stored_occurred_on', None)]
+
+
+def _invalidate_snapshots(sender, instance, **kwargs):
+	FinancialPeriodSnapshot.invalidate(*_snapshot_days(instance))
+
+
+def connect_signals():
+	"""Drop month snapshots from post_save / post_delete, so cascade deletes (an invoice's payments) count too."""
+	for model in (Payment, RevenueEntry, ExpenseEntry):
+		label = model._meta.label
+		post_save.connect(_invalidate_snapshots, sender=model, dispatch_uid=f'Finance.snapshot.save.{label}')
+		post_delete.connect(_invalidate_snapshots, sender=model, dispatch_uid=f'Finance.snapshot.delete.{label}')
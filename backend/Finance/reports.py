@@ -0,0 +1,224 @@
+"""
+Financial position report.
+
+Revenue, expenses and cash collected add up over time, so a report range is
+split into whole closed months, read from FinancialPeriodSnapshot, and the
+remaining days (a partial first month, the open current month), computed
+live. Months without a snapshot yet are computed in the same pass as the live
+days and saved. Each table is read once per report: one grouped sum per
+(month, category) for revenue and for expenses, one per month for payments.
+Payments are compared on created_at ranges rather than a date cast, so the
+created_at index applies.
+
+Accounts receivable is the balance still due right now and is always computed live.
+
+Revenue by service code / by medicine sums InvoiceLine rows for invoices
+created in the range: one grouped query each.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import reduce
+import operator
+
+from django.db.models import Count, DateField, F, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import ExpenseEntry, FinancialPeriodSnapshot, Invoice, InvoiceLine, Payment, RevenueEntry
+
+ZERO = Decimal('0')
+
+
+def month_start(day):
+	return day.replace(day=1)
+
+
+def next_month(day):
+	return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def split_period(start, end, today=None):
+	"""
+	(closed_months, live_ranges) covering start..end: the first day of every
+	whole month that ended before the current one, and the (start, end) date
+	ranges left over.
+	"""
+	current = month_start(today or timezone.localdate())
+	months, live = [], []
+	cursor = start
+	while cursor <= end:
+		following = next_month(cursor)
+		last = min(end, following - timedelta(days=1))
+		if cursor.day == 1 and last == following - timedelta(days=1) and following <= current:
+			months.append(cursor)
+		else:
+			live.append((cursor, last))
+		cursor = following
+	return months, _merge(live)
+
+
+def _day_bounds(start, end):
+	"""Aware [start 00:00, day after end 00:00) in the current timezone."""
+	return (
+		timezone.make_aware(datetime.combine(start, time.min)),
+		timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+	)
+
+
+def _merge(ranges):
+	"""Sorted (start, end) ranges with touching ones joined."""
+	merged = []
+	for start, end in sorted(ranges):
+		if merged and merged[-1][1] + timedelta(days=1) >= start:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+		else:
+			merged.append((start, end))
+	return merged
+
+
+def _any(ranges, field, datetimes=False):
+	conditions = []
+	for start, end in _merge(ranges):
+		if datetimes:
+			lower, upper = _day_bounds(start, end)
+			conditions.append(Q(**{f'{field}__gte': lower, f'{field}__lt': upper}))
+		else:
+			conditions.append(Q(**{f'{field}__range': (start, end)}))
+	return reduce(operator.or_, conditions)
+
+
+def _empty_bucket():
+	return {'revenue': defaultdict(Decimal), 'expenses': defaultdict(Decimal), 'cash_collected': ZERO}
+
+
+def _collect(ranges):
+	"""Per-month buckets of category sums and cash collected over ``ranges`` (three queries)."""
+	buckets = defaultdict(_empty_bucket)
+	month = TruncMonth('occurred_on', output_field=DateField())
+	for key, model in (('revenue', RevenueEntry), ('expenses', ExpenseEntry)):
+		rows = (
+			model.objects.filter(_any(ranges, 'occurred_on'))
+			.annotate(month=month).values('month', 'category')
+			.annotate(total=Sum('amount')).order_by()
+		)
+		for row in rows:
+			buckets[row['month']][key][row['category']] += row['total'] or ZERO
+	rows = (
+		Payment.objects.filter(_any(ranges, 'created_at', datetimes=True))
+		.annotate(month=TruncMonth('created_at', output_field=DateField())).values('month')
+		.annotate(total=Sum('amount')).order_by()
+	)
+	for row in rows:
+		buckets[row['month']]['cash_collected'] += row['total'] or ZERO
+	return buckets
+
+
+def _as_snapshot(month, bucket):
+	return FinancialPeriodSnapshot(
+		month=month,
+		revenue_by_category={k: str(v) for k, v in bucket['revenue'].items()},
+		expenses_by_category={k: str(v) for k, v in bucket['expenses'].items()},
+		cash_collected=bucket['cash_collected'],
+	)
+
+
+def snapshot_months(months):
+	"""Compute and save snapshots for these closed months (replacing any existing ones)."""
+	if not months:
+		return []
+	buckets = _collect([(m, next_month(m) - timedelta(days=1)) for m in months])
+	snapshots = [_as_snapshot(m, buckets.get(m) or _empty_bucket()) for m in months]
+	FinancialPeriodSnapshot.objects.filter(month__in=months).delete()
+	return FinancialPeriodSnapshot.objects.bulk_create(snapshots)
+
+
+def _breakdown(totals):
+	rows = [{'category': category, 'total': total} for category, total in totals.items()]
+	return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+
+def financial_position(start, end):
+	"""The financial position report for start..end (inclusive dates)."""
+	months, live = split_period(start, end)
+	snapshots = {s.month: s for s in FinancialPeriodSnapshot.objects.filter(month__in=months)} if months else {}
+	missing = [m for m in months if m not in snapshots]
+
+	# Live days and months still missing a snapshot, in one pass per table
+	ranges = live + [(m, next_month(m) - timedelta(days=1)) for m in missing]
+	buckets = _collect(ranges) if ranges else {}
+	if missing:
+		FinancialPeriodSnapshot.objects.bulk_create(
+			[_as_snapshot(m, buckets.get(m) or _empty_bucket()) for m in missing],
+			ignore_conflicts=True,
+		)
+
+	revenue = defaultdict(Decimal)
+	expenses = defaultdict(Decimal)
+	cash_collected = ZERO
+	for bucket in buckets.values():
+		for category, amount in bucket['revenue'].items():
+			revenue[category] += amount
+		for category, amount in bucket['expenses'].items():
+			expenses[category] += amount
+		cash_collected += bucket['cash_collected']
+	for snapshot in snapshots.values():
+		for category, amount in snapshot.revenue_by_category.items():
+			revenue[category] += Decimal(amount)
+		for category, amount in snapshot.expenses_by_category.items():
+			expenses[category] += Decimal(amount)
+		cash_collected += snapshot.cash_collected
+
+	revenue_total = sum(revenue.values(), ZERO)
+	expense_total = sum(expenses.values(), ZERO)
+	# What is still owed on open invoices, net of partial payments
+	accounts_receivable = Invoice.objects.filter(status='DUE').aggregate(
+		total=Coalesce(Sum('balance'), ZERO)
+	)['total'] or ZERO
+
+	return {
+		'period': {'start_date': start.isoformat(), 'end_date': end.isoformat()},
+		'totals': {
+			'revenue': revenue_total,
+			'expenses': expense_total,
+			'net_position': revenue_total - expense_total,
+			'accounts_receivable': accounts_receivable,
+			'cash_collected': cash_collected,
+		},
+		'breakdown': {
+			'revenue_by_category': _breakdown(revenue),
+			'expenses_by_category': _breakdown(expenses),
+		},
+	}
+
+
+def _billed_lines(start, end, status=None):
+	lower, upper = _day_bounds(start, end)
+	lines = InvoiceLine.objects.filter(invoice__created_at__gte=lower, invoice__created_at__lt=upper)
+	if status:
+		return lines.filter(invoice__status=status)
+	return lines.exclude(invoice__status='VOID')
+
+
+def revenue_by_code(start, end, status=None, key=None):
+	"""[{code, name, quantity, revenue, invoices}] for start..end, highest revenue first."""
+	lines = _billed_lines(start, end, status)
+	if key:
+		lines = lines.filter(code=key)
+	return list(
+		lines.values('code')
+		.annotate(name=Max('name'), quantity=Sum('quantity'), revenue=Sum('amount'), invoices=Count('invoice', distinct=True))
+		.order_by('-revenue', 'code')
+	)
+
+
+def revenue_by_medicine(start, end, status=None, key=None):
+	"""[{medicine_id, medicine_name, quantity, revenue, invoices}] for start..end, highest revenue first."""
+	lines = _billed_lines(start, end, status).filter(medicine__isnull=False)
+	if key:
+		lines = lines.filter(medicine_id=int(key))
+	return list(
+		lines.values('medicine_id', medicine_name=F('medicine__name'))
+		.annotate(quantity=Sum('quantity'), revenue=Sum('amount'), invoices=Count('invoice', distinct=True))
+		.order_by('-revenue', 'medicine_id')
+	)
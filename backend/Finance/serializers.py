@@ -1,21 +1,62 @@
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
-from .models import Invoice, Payment, RevenueEntry, ExpenseEntry
-from patients.serializers import PatientSerializer
+from .models import Invoice, InvoiceLine, Payment, RevenueEntry, ExpenseEntry
+from patients.serializers import PatientSerializer, PatientSummarySerializer
+
+class InvoiceLineSerializer(serializers.ModelSerializer):
+	"""One ``services`` entry: {code, name, amount} plus optional medicine, quantity, unit_price."""
+	amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+	unit_price = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+	quantity = serializers.IntegerField(min_value=1, required=False)
+
+	class Meta:
+		model = InvoiceLine
+		fields = ['code','name','amount','quantity','unit_price','medicine']
+
+	def validate(self, attrs):
+		# Field defaults are skipped on PATCH, so fill the quantity here
+		attrs.setdefault('quantity', 1)
+		amount = attrs.get('amount')
+		unit_price = attrs.get('unit_price')
+		if amount is None and unit_price is None:
+			raise serializers.ValidationError('Give an amount or a unit_price.')
+		if amount is None:
+			attrs['amount'] = unit_price * attrs['quantity']
+		elif unit_price is None:
+			attrs['unit_price'] = (amount / attrs['quantity']).quantize(Decimal('0.01'))
+		return attrs
 
 class InvoiceSerializer(serializers.ModelSerializer):
+	services = InvoiceLineSerializer(source='lines', many=True, required=False)
 	patient_detail = PatientSerializer(source='patient', read_only=True)
 	created_by_username = serializers.CharField(source='created_by.username', read_only=True)
 	created_by_id = serializers.IntegerField(source='created_by.id', read_only=True)
 	class Meta:
 		model = Invoice
-		fields = ['id','patient','patient_detail','prescription','created_by','created_by_username','created_by_id','services','subtotal','discount','total','status','created_at','updated_at']
-		read_only_fields = ['created_by','created_by_username','created_by_id','subtotal','total','created_at','updated_at']
+		fields = ['id','patient','patient_detail','prescription','created_by','created_by_username','created_by_id','services','subtotal','discount','total','amount_paid','balance','status','created_at','updated_at']
+		read_only_fields = ['created_by','created_by_username','created_by_id','subtotal','total','amount_paid','balance','created_at','updated_at']
 
 	def create(self, validated_data):
 		req = self.context.get('request')
 		if req and req.user and req.user.is_authenticated:
 			validated_data['created_by'] = req.user
-		return super().create(validated_data)
+		lines = validated_data.pop('lines', [])
+		with transaction.atomic():
+			invoice = super().create(validated_data)
+			invoice.set_lines([InvoiceLine(**line) for line in lines])
+		return invoice
+
+	def update(self, instance, validated_data):
+		lines = validated_data.pop('lines', None)
+		with transaction.atomic():
+			instance = super().update(instance, validated_data)
+			if lines is not None:
+				instance.set_lines([InvoiceLine(**line) for line in lines])
+		return instance
+
+class InvoiceListSerializer(InvoiceSerializer):
+	patient_detail = PatientSummarySerializer(source='patient', read_only=True)
 
 class PaymentSerializer(serializers.ModelSerializer):
 	class Meta:
@@ -33,23 +74,22 @@ class PaymentSerializer(serializers.ModelSerializer):
 		req = self.context.get('request')
 		if req and req.user and req.user.is_authenticated:
 			validated_data['recorded_by'] = req.user
+		# Payment.save adds the amount to the invoice's amount_paid and marks it
+		# PAID once covered, in a single UPDATE
 		obj = super().create(validated_data)
 		inv = obj.invoice
-		total_paid = sum(p.amount for p in inv.payments.all())
-		if total_paid >= inv.total:
-			inv.status = 'PAID'
-			inv.save()
 		try:
-			RevenueEntry.objects.create(
-				occurred_on=obj.created_at.date(),
-				category=RevenueEntry.Category.INVOICE_PAYMENT,
-				description=f"Invoice #{inv.id} payment via {obj.method}",
-				amount=obj.amount,
-				reference=obj.reference or '',
-				invoice=inv,
-				recorded_by=obj.recorded_by,
-				metadata={'payment_id': obj.id}
-			)
+			with transaction.atomic():
+				RevenueEntry.objects.create(
+					occurred_on=obj.created_at.date(),
+					category=RevenueEntry.Category.INVOICE_PAYMENT,
+					description=f"Invoice #{inv.id} payment via {obj.method}",
+					amount=obj.amount,
+					reference=obj.reference or '',
+					invoice=inv,
+					recorded_by=obj.recorded_by,
+					metadata={'payment_id': obj.id}
+				)
 		except Exception:
 			# Avoid breaking payment creation if revenue logging fails
 			pass
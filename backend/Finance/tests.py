@@ -1,3 +1,216 @@
+import csv
+from datetime import timedelta
+from decimal import Decimal
+import io
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from core.testing import QueryBudgetTestMixin, make_patient
+from users.models import User
+
+from .models import ExpenseEntry, FinancialPeriodSnapshot, Invoice, InvoiceLine, Payment, RevenueEntry
+from .views import InvoiceViewSet
+
+
+class FinanceApiQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+	"""List and retrieve stay within the views' query_budget however many rows they return."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.finance = User.objects.create_user('finance', password='x', role=User.Role.FINANCE)
+		for i in range(3):
+			invoice = Invoice.objects.create(patient=make_patient(f'patient{i}'), created_by=cls.finance)
+			invoice.set_lines([
+				InvoiceLine(code='CONS', name='Consultation', unit_price=Decimal('500.00')),
+				InvoiceLine(code='LAB', name='Blood test', unit_price=Decimal('250.00'), quantity=2),
+			])
+			Payment.objects.create(invoice=invoice, recorded_by=cls.finance, amount=Decimal('100.00'))
+			RevenueEntry.objects.create(amount=Decimal('100.00'), invoice=invoice, recorded_by=cls.finance)
+			ExpenseEntry.objects.create(amount=Decimal('40.00'), vendor='Supplier', recorded_by=cls.finance)
+
+	def setUp(self):
+		super().setUp()
+		self.client.force_authenticate(self.finance)
+
+	def test_invoices(self):
+		response = self.assertListAndRetrieve('/api/invoices/')
+		self.assertEqual(len(response.data['services']), 2)
+
+	def test_payments(self):
+		self.assertListAndRetrieve('/api/payments/')
+
+	def test_revenues(self):
+		self.assertListAndRetrieve('/api/revenues/')
+
+	def test_expenses(self):
+		self.assertListAndRetrieve('/api/expenses/')
+
+
+class InvoiceExportTests(APITestCase):
+	def setUp(self):
+		self.finance = User.objects.create_user('finance', password='x', role=User.Role.FINANCE)
+		self.client.force_authenticate(self.finance)
+		self.paid = Invoice.objects.create(patient=make_patient('alice'), created_by=self.finance)
+		self.paid.set_lines([InvoiceLine(code='CONS', unit_price=Decimal('200.00'))])
+		Payment.objects.create(invoice=self.paid, amount=Decimal('200.00'))
+		self.due = Invoice.objects.create(patient=make_patient('bob'), discount=Decimal('5.00'))
+		self.due.set_lines([InvoiceLine(code='LAB', unit_price=Decimal('50.00'), quantity=2)])
+		Invoice.objects.filter(pk=self.due.pk).update(created_at=timezone.now() - timedelta(days=10))
+
+	def export(self, query=''):
+		response = self.client.get(f'/api/invoices/download-all/{query}')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		self.assertEqual(response['Content-Type'], 'text/csv')
+		return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+	def test_columns_and_rows(self):
+		rows = self.export()
+		self.assertEqual(rows[0], [
+			'Invoice ID', 'Patient Name', 'Medical ID', 'Status', 'Subtotal',
+			'Discount', 'Total', 'Amount Paid', 'Balance', 'Created At', 'Created By', 'Prescription ID',
+		])
+		by_id = {row[0]: row for row in rows[1:]}
+		self.assertEqual(by_id[str(self.paid.pk)][1:9], [
+			'Alice', self.paid.patient.medical_id, 'PAID', '200.00', '0.00', '200.00', '200.00', '0.00',
+		])
+		self.assertEqual(by_id[str(self.due.pk)][3:9], ['DUE', '100.00', '5.00', '95.00', '0.00', '95.00'])
+		self.assertEqual(by_id[str(self.paid.pk)][10:], ['finance', 'N/A'])
+		self.assertEqual(by_id[str(self.due.pk)][10:], ['N/A', 'N/A'])
+
+	def test_uses_the_list_filters(self):
+		self.assertEqual([row[0] for row in self.export('?status=DUE')[1:]], [str(self.due.pk)])
+		self.assertEqual([row[0] for row in self.export('?outstanding=1')[1:]], [str(self.due.pk)])
+		today = timezone.localdate()
+		self.assertEqual([row[0] for row in self.export(f'?start_date={today}')[1:]], [str(self.paid.pk)])
+		self.assertEqual(self.export('?start_date=2000-01-01&end_date=2000-01-31'), [self.export()[0]])
+
+
+class FinancialSnapshotInvalidationTests(TestCase):
+	def setUp(self):
+		self.past = timezone.now() - timedelta(days=70)
+		self.month = timezone.localdate(self.past).replace(day=1)
+		self.invoice = Invoice.objects.create(patient=make_patient('patient'), total=Decimal('100.00'))
+
+	def snapshot(self):
+		FinancialPeriodSnapshot.objects.update_or_create(month=self.month)
+
+	def has_snapshot(self):
+		return FinancialPeriodSnapshot.objects.filter(month=self.month).exists()
+
+	def test_deleting_an_invoice_drops_its_payments_months(self):
+		payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('10.00'))
+		Payment.objects.filter(pk=payment.pk).update(created_at=self.past)
+		self.snapshot()
+		self.invoice.delete()
+		self.assertFalse(self.has_snapshot())
+
+	def test_moving_an_entry_drops_both_months(self):
+		entry = ExpenseEntry.objects.create(amount=Decimal('5.00'), occurred_on=self.month)
+		self.snapshot()
+		entry = ExpenseEntry.objects.get(pk=entry.pk)
+		entry.occurred_on = timezone.localdate()
+		entry.save()
+		self.assertFalse(self.has_snapshot())
+		self.snapshot()
+		RevenueEntry.objects.create(amount=Decimal('5.00'), occurred_on=timezone.localdate())
+		self.assertTrue(self.has_snapshot())
+
+
+class InvoicePaymentTests(TestCase):
+	def setUp(self):
+		self.invoice = Invoice.objects.create(patient=make_patient('patient'))
+		self.invoice.set_lines([InvoiceLine(code='CONS', unit_price=Decimal('100.00'))])
+
+	def state(self):
+		self.invoice.refresh_from_db()
+		return self.invoice.amount_paid, self.invoice.balance, self.invoice.status
+
+	def test_apply_payment_flips_status_both_ways(self):
+		Invoice.apply_payment(self.invoice.pk, Decimal('60.00'))
+		self.assertEqual(self.state(), (Decimal('60.00'), Decimal('40.00'), 'DUE'))
+		Invoice.apply_payment(self.invoice.pk, Decimal('40.00'))
+		self.assertEqual(self.state(), (Decimal('100.00'), Decimal('0.00'), 'PAID'))
+		Invoice.apply_payment(self.invoice.pk, Decimal('-40.00'))
+		self.assertEqual(self.state(), (Decimal('60.00'), Decimal('40.00'), 'DUE'))
+
+	def test_apply_payment_leaves_void_invoices_void(self):
+		Invoice.objects.filter(pk=self.invoice.pk).update(status='VOID')
+		Invoice.apply_payment(self.invoice.pk, Decimal('100.00'))
+		self.assertEqual(self.state()[2], 'VOID')
+
+	def test_payments_keep_amount_paid(self):
+		payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('100.00'))
+		self.assertEqual(self.state()[2], 'PAID')
+		payment.amount = Decimal('30.00')
+		payment.save()
+		self.assertEqual(self.state(), (Decimal('30.00'), Decimal('70.00'), 'DUE'))
+		payment.delete()
+		self.assertEqual(self.state()[0], Decimal('0.00'))
+
+	def test_saving_a_stale_invoice_keeps_amount_paid(self):
+		stale = Invoice.objects.get(pk=self.invoice.pk)
+		Payment.objects.create(invoice=self.invoice, amount=Decimal('25.00'))
+		stale.discount = Decimal('10.00')
+		stale.save()
+		self.assertEqual(self.state(), (Decimal('25.00'), Decimal('65.00'), 'DUE'))
+
+	def test_saving_a_stale_invoice_keeps_the_status_a_payment_set(self):
+		stale = Invoice.objects.get(pk=self.invoice.pk)
+		Payment.objects.create(invoice=self.invoice, amount=Decimal('100.00'))
+		stale.discount = Decimal('0.00')
+		stale.save()
+		self.assertEqual(self.state(), (Decimal('100.00'), Decimal('0.00'), 'PAID'))
+		self.assertEqual(stale.status, 'PAID')
+
+	def test_patch_racing_a_payment_leaves_it_paid(self):
+		get_object = InvoiceViewSet.get_object
+
+		def pay_after_load(view):
+			invoice = get_object(view)
+			Invoice.apply_payment(invoice.pk, Decimal('100.00'))
+			return invoice
+
+		client = APIClient()
+		client.force_authenticate(User.objects.create_user('finance', password='x', role=User.Role.FINANCE))
+		with mock.patch.object(InvoiceViewSet, 'get_object', autospec=True, side_effect=pay_after_load):
+			response = client.patch(f'/api/invoices/{self.invoice.pk}/', {'status': 'DUE', 'discount': '0.00'}, format='json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['status'], 'PAID')
+		self.assertEqual(self.state(), (Decimal('100.00'), Decimal('0.00'), 'PAID'))
+
+	def test_raising_the_discount_settles_a_covered_invoice(self):
+		Invoice.apply_payment(self.invoice.pk, Decimal('90.00'))
+		self.invoice.refresh_from_db()
+		self.invoice.discount = Decimal('10.00')
+		self.invoice.save()
+		self.assertEqual(self.state(), (Decimal('90.00'), Decimal('0.00'), 'PAID'))
+		self.invoice.discount = Decimal('5.00')
+		self.invoice.save()
+		self.assertEqual(self.state(), (Decimal('90.00'), Decimal('5.00'), 'DUE'))
+
+	def test_set_lines_rechecks_the_status(self):
+		Invoice.apply_payment(self.invoice.pk, Decimal('100.00'))
+		self.invoice.set_lines([InvoiceLine(code='CONS', unit_price=Decimal('150.00'))])
+		self.assertEqual(self.state(), (Decimal('100.00'), Decimal('50.00'), 'DUE'))
+		self.invoice.set_lines([InvoiceLine(code='CONS', unit_price=Decimal('80.00'))])
+		self.assertEqual(self.state(), (Decimal('100.00'), Decimal('-20.00'), 'PAID'))
 
-# Create your tests here.
+	def test_void_is_kept_and_can_be_undone(self):
+		stale = Invoice.objects.get(pk=self.invoice.pk)
+		Invoice.apply_payment(self.invoice.pk, Decimal('100.00'))
+		self.invoice.refresh_from_db()
+		self.invoice.status = 'VOID'
+		self.invoice.save()
+		self.assertEqual(self.state()[2], 'VOID')
+		# A stale copy saved later doesn't revive it
+		stale.discount = Decimal('1.00')
+		stale.save()
+		self.assertEqual(self.state()[2], 'VOID')
+		self.invoice.status = 'DUE'
+		self.invoice.discount = Decimal('0.00')
+		self.invoice.save()
+		self.assertEqual(self.state()[2], 'PAID')
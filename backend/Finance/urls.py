@@ -6,6 +6,8 @@ from .views import (
 	RevenueEntryViewSet,
 	ExpenseEntryViewSet,
 	FinancialPositionReportView,
+	RevenueByCodeReportView,
+	RevenueByMedicineReportView,
 )
 
 router = DefaultRouter()
@@ -16,5 +18,7 @@ router.register(r'expenses', ExpenseEntryViewSet, basename='expense-entry')
 
 urlpatterns = [
 	path('finance/reports/financial-position/', FinancialPositionReportView.as_view(), name='financial-position-report'),
+	path('finance/reports/revenue-by-code/', RevenueByCodeReportView.as_view(), name='revenue-by-code-report'),
+	path('finance/reports/revenue-by-medicine/', RevenueByMedicineReportView.as_view(), name='revenue-by-medicine-report'),
 	path('', include(router.urls)),
 ]
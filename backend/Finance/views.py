@@ -1,29 +1,99 @@
-from datetime import date
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+from django.db import transaction
 from django.utils.dateparse import parse_date
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
 import csv
 import io
-from .models import Invoice, Payment, RevenueEntry, ExpenseEntry
-from .serializers import InvoiceSerializer, PaymentSerializer, RevenueEntrySerializer, ExpenseEntrySerializer
+from .models import Invoice, InvoiceLine, Payment, RevenueEntry, ExpenseEntry
+from .serializers import InvoiceSerializer, InvoiceListSerializer, PaymentSerializer, RevenueEntrySerializer, ExpenseEntrySerializer
 from .permissions import IsFinanceOrReadOnly
+from .reports import financial_position, revenue_by_code, revenue_by_medicine
+from core.mixins import ListSerializerMixin
+from core.pagination import InvoicePagination, OccurredOnPagination
+from patients.search import PatientSearchFilter
 
 # Create your views here.
 
-class InvoiceViewSet(viewsets.ModelViewSet):
-	queryset = Invoice.objects.select_related('patient','created_by').order_by('-created_at')
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+	"""File-like object for csv.writer that hands each row back instead of buffering it."""
+	def write(self, value):
+		return value
+
+
+def _start_of_day(day):
+	return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _date_param(params, name):
+	"""A YYYY-MM-DD query param as a date, or None if absent; 400 if it is malformed or not a real date."""
+	if not params.get(name):
+		return None
+	try:
+		day = parse_date(params[name])
+	except ValueError:
+		day = None
+	if day is None:
+		raise ValidationError({name: 'Enter a valid date (YYYY-MM-DD).'})
+	return day
+
+
+class InvoiceViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+	queryset = Invoice.objects.select_related('patient__user','created_by').prefetch_related('lines').order_by('-created_at')
 	serializer_class = InvoiceSerializer
+	query_budget = {'list': 5, 'retrieve': 5}
+	list_serializer_class = InvoiceListSerializer
 	permission_classes = [IsAuthenticated & IsFinanceOrReadOnly]
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-	search_fields = ['patient__name','patient__medical_id']
-	ordering_fields = ['created_at','total','status']
+	pagination_class = InvoicePagination
+	filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+	ordering_fields = ['created_at','total','status','balance']
+
+	def get_queryset(self):
+		"""
+		List filters: start_date / end_date (YYYY-MM-DD, on created_at), status,
+		prescription (id), outstanding=1|0 (balance above / at or below zero),
+		min_balance, max_balance.
+		Balances are stored on the invoice, so none of these touch the payments table.
+		"""
+		qs = super().get_queryset()
+		if self.action not in ('list', 'download_all'):
+			return qs
+		params = self.request.query_params
+		start = _date_param(params, 'start_date')
+		if start:
+			qs = qs.filter(created_at__gte=_start_of_day(start))
+		end = _date_param(params, 'end_date')
+		if end:
+			qs = qs.filter(created_at__lt=_start_of_day(end + timedelta(days=1)))
+		if params.get('status'):
+			qs = qs.filter(status=params['status'])
+		if params.get('prescription'):
+			try:
+				qs = qs.filter(prescription_id=int(params['prescription']))
+			except ValueError:
+				raise ValidationError({'prescription': 'Must be an integer.'})
+		outstanding = params.get('outstanding')
+		if outstanding in ('1', 'true'):
+			qs = qs.filter(balance__gt=0)
+		elif outstanding in ('0', 'false'):
+			qs = qs.filter(balance__lte=0)
+		for param, lookup in (('min_balance', 'balance__gte'), ('max_balance', 'balance__lte')):
+			if params.get(param):
+				try:
+					qs = qs.filter(**{lookup: Decimal(params[param])})
+				except ArithmeticError:
+					raise ValidationError({param: 'Must be a number.'})
+		return qs
 
 	@action(detail=True, methods=['post'])
 	def void(self, request, pk=None):
@@ -63,25 +133,30 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 				return Response({'detail': 'Discount and additional charges must be zero or positive'}, status=status.HTTP_400_BAD_REQUEST)
 			presc = Prescription.objects.get(pk=pid)
 			med = Medicine.objects.get(pk=mid)
-			amount = Decimal(str(med.selling_price or 0)) * qty
-			services = [{
-				'code': f'MED-{med.id}',
-				'name': f"{med.name} (x{qty})",
-				'amount': float(amount)
-			}]
+			unit_price = Decimal(str(med.selling_price or 0))
+			lines = [InvoiceLine(
+				code=f'MED-{med.id}',
+				name=f"{med.name} (x{qty})",
+				medicine=med,
+				quantity=qty,
+				unit_price=unit_price,
+				amount=unit_price * qty
+			)]
 			if additional_charges > 0:
-				services.append({
-					'code': 'ADD-CHARGE',
-					'name': additional_label,
-					'amount': float(additional_charges)
-				})
-			invoice = Invoice.objects.create(
-				patient=presc.patient,
-				prescription=presc,
-				created_by=request.user,
-				discount=discount,
-				services=services
-			)
+				lines.append(InvoiceLine(
+					code='ADD-CHARGE',
+					name=additional_label,
+					unit_price=additional_charges,
+					amount=additional_charges
+				))
+			with transaction.atomic():
+				invoice = Invoice.objects.create(
+					patient=presc.patient,
+					prescription=presc,
+					created_by=request.user,
+					discount=discount
+				)
+				invoice.set_lines(lines)
 			ser = self.get_serializer(invoice)
 			return Response(ser.data, status=status.HTTP_201_CREATED)
 		except Prescription.DoesNotExist:
@@ -107,19 +182,23 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 		writer.writerow(['Created By', invoice.created_by.username if invoice.created_by else 'N/A'])
 		writer.writerow([])
 		writer.writerow(['Services/Items'])
-		writer.writerow(['Code', 'Name', 'Amount'])
+		writer.writerow(['Code', 'Name', 'Quantity', 'Unit Price', 'Amount'])
 		
-		for service in (invoice.services or []):
+		for line in invoice.lines.all():
 			writer.writerow([
-				service.get('code', ''),
-				service.get('name', ''),
-				f"Kshs {service.get('amount', 0):.2f}"
+				line.code,
+				line.name,
+				line.quantity,
+				f"Kshs {line.unit_price:.2f}",
+				f"Kshs {line.amount:.2f}"
 			])
 		
 		writer.writerow([])
 		writer.writerow(['Subtotal', f"Kshs {invoice.subtotal:.2f}"])
 		writer.writerow(['Discount', f"Kshs {invoice.discount:.2f}"])
 		writer.writerow(['Total', f"Kshs {invoice.total:.2f}"])
+		writer.writerow(['Amount Paid', f"Kshs {invoice.amount_paid:.2f}"])
+		writer.writerow(['Balance', f"Kshs {invoice.balance:.2f}"])
 		
 		if invoice.prescription:
 			writer.writerow([])
@@ -130,58 +209,51 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 
 	@action(detail=False, methods=['get'], url_path='download-all')
 	def download_all(self, request):
-		"""Download all invoices (with optional filtering) as CSV"""
+		"""Download all invoices (with optional filtering) as CSV.
+
+		Rows are streamed straight from a server-side cursor, so memory use does not
+		grow with the date range and the browser starts receiving data immediately.
+		"""
+		# Same filters as the list (dates as created_at ranges so the index is usable)
 		queryset = self.filter_queryset(self.get_queryset())
-		
-		# Apply date filtering if provided
-		start_date = request.query_params.get('start_date')
-		end_date = request.query_params.get('end_date')
-		status_filter = request.query_params.get('status')
-		
-		if start_date:
-			start = parse_date(start_date)
-			if start:
-				queryset = queryset.filter(created_at__date__gte=start)
-		if end_date:
-			end = parse_date(end_date)
-			if end:
-				queryset = queryset.filter(created_at__date__lte=end)
-		if status_filter:
-			queryset = queryset.filter(status=status_filter)
-		
-		response = HttpResponse(content_type='text/csv')
+
+		# One joined query for exactly the exported columns; no model instances, no per-row lookups.
+		rows = queryset.values_list(
+			'id', 'patient__name', 'patient__medical_id', 'status', 'subtotal',
+			'discount', 'total', 'amount_paid', 'balance', 'created_at', 'created_by__username', 'prescription_id',
+		).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+		def stream():
+			writer = csv.writer(_Echo())
+			yield writer.writerow([
+				'Invoice ID', 'Patient Name', 'Medical ID', 'Status', 'Subtotal', 
+				'Discount', 'Total', 'Amount Paid', 'Balance', 'Created At', 'Created By', 'Prescription ID'
+			])
+			for invoice_id, name, medical_id, inv_status, subtotal, discount, total, amount_paid, balance, created_at, username, prescription_id in rows:
+				yield writer.writerow([
+					invoice_id,
+					name,
+					medical_id,
+					inv_status,
+					f"{subtotal:.2f}",
+					f"{discount:.2f}",
+					f"{total:.2f}",
+					f"{amount_paid:.2f}",
+					f"{balance:.2f}",
+					created_at.strftime('%Y-%m-%d %H:%M:%S'),
+					username or 'N/A',
+					prescription_id or 'N/A'
+				])
+
+		response = StreamingHttpResponse(stream(), content_type='text/csv')
 		filename = f"invoices_{date.today().isoformat()}.csv"
 		response['Content-Disposition'] = f'attachment; filename="{filename}"'
-		
-		writer = csv.writer(response)
-		writer.writerow([
-			'Invoice ID', 'Patient Name', 'Medical ID', 'Status', 'Subtotal', 
-			'Discount', 'Total', 'Created At', 'Created By', 'Prescription ID'
-		])
-		
-		for invoice in queryset:
-			services_summary = ', '.join([s.get('name', '') for s in (invoice.services or [])[:3]])
-			if len(invoice.services or []) > 3:
-				services_summary += '...'
-			
-			writer.writerow([
-				invoice.id,
-				invoice.patient.name,
-				invoice.patient.medical_id,
-				invoice.status,
-				f"{invoice.subtotal:.2f}",
-				f"{invoice.discount:.2f}",
-				f"{invoice.total:.2f}",
-				invoice.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-				invoice.created_by.username if invoice.created_by else 'N/A',
-				invoice.prescription.id if invoice.prescription else 'N/A'
-			])
-		
 		return response
 
 class PaymentViewSet(viewsets.ModelViewSet):
 	queryset = Payment.objects.select_related('invoice','recorded_by').order_by('-created_at')
 	serializer_class = PaymentSerializer
+	query_budget = {'list': 4, 'retrieve': 4}
 	permission_classes = [IsAuthenticated & IsFinanceOrReadOnly]
 	filter_backends = [filters.OrderingFilter]
 	ordering_fields = ['created_at','amount']
@@ -193,6 +265,8 @@ class BaseFinanceEntryViewSet(viewsets.ModelViewSet):
 	"""
 	date_field = 'occurred_on'
 	permission_classes = [IsAuthenticated & IsFinanceOrReadOnly]
+	pagination_class = OccurredOnPagination
+	query_budget = {'list': 4, 'retrieve': 4}
 
 	def get_queryset(self):
 		qs = super().get_queryset()
@@ -222,7 +296,8 @@ class ExpenseEntryViewSet(BaseFinanceEntryViewSet):
 	serializer_class = ExpenseEntrySerializer
 
 
-class FinancialPositionReportView(APIView):
+class BaseReportView(APIView):
+	"""Finance reports over ?start_date..?end_date (default: this month so far)."""
 	permission_classes = [IsAuthenticated & IsFinanceOrReadOnly]
 
 	def _resolve_dates(self, request):
@@ -241,40 +316,51 @@ class FinancialPositionReportView(APIView):
 			start, end = end, start
 		return start, end
 
-	def get(self, request):
-		start, end = self._resolve_dates(request)
 
-		revenue_qs = RevenueEntry.objects.filter(occurred_on__range=(start, end))
-		expense_qs = ExpenseEntry.objects.filter(occurred_on__range=(start, end))
-		payment_qs = Payment.objects.filter(created_at__date__range=(start, end))
+class FinancialPositionReportView(BaseReportView):
+	# snapshots, revenue, expenses, payments, receivables + the user; the first
+	# report over a closed month also inserts its snapshot (3 with BEGIN/COMMIT)
+	query_budget = 9
 
-		revenue_total = revenue_qs.aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total'] or Decimal('0')
-		expense_total = expense_qs.aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total'] or Decimal('0')
-		net_position = revenue_total - expense_total
+	def get(self, request):
+		"""Revenue, expenses, receivables and cash collected for ?start_date..?end_date (see Finance.reports).
+		Closed months come from stored snapshots; only the open edges are aggregated live.
+		"""
+		start, end = self._resolve_dates(request)
+		return Response(financial_position(start, end))
 
-		revenue_breakdown = list(
-			revenue_qs.values('category').annotate(total=Coalesce(Sum('amount'), Decimal('0'))).order_by('-total')
-		)
-		expense_breakdown = list(
-			expense_qs.values('category').annotate(total=Coalesce(Sum('amount'), Decimal('0'))).order_by('-total')
-		)
 
-		accounts_receivable = Invoice.objects.filter(status='DUE').aggregate(
-			total=Coalesce(Sum('total'), Decimal('0'))
-		)['total'] or Decimal('0')
-		cash_collected = payment_qs.aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total'] or Decimal('0')
+class LineRevenueReportView(BaseReportView):
+	"""
+	Billed revenue per invoice line group for invoices created in the range.
+	?status=DUE|PAID narrows to those invoices (VOID ones are always left out).
+	"""
+	query_budget = 2
+	report = None
+	key_param = None
 
+	def get(self, request):
+		start, end = self._resolve_dates(request)
+		status_param = request.query_params.get('status') or None
+		if status_param not in (None, 'DUE', 'PAID'):
+			raise ValidationError({'status': 'Must be DUE or PAID.'})
+		try:
+			rows = self.report(start, end, status=status_param, key=request.query_params.get(self.key_param) or None)
+		except ValueError:
+			raise ValidationError({self.key_param: 'Invalid value.'})
 		return Response({
 			'period': {'start_date': start.isoformat(), 'end_date': end.isoformat()},
-			'totals': {
-				'revenue': revenue_total,
-				'expenses': expense_total,
-				'net_position': net_position,
-				'accounts_receivable': accounts_receivable,
-				'cash_collected': cash_collected,
-			},
-			'breakdown': {
-				'revenue_by_category': revenue_breakdown,
-				'expenses_by_category': expense_breakdown,
-			}
+			'results': rows,
 		})
+
+
+class RevenueByCodeReportView(LineRevenueReportView):
+	"""Revenue per service code (?code= for a single one)."""
+	report = staticmethod(revenue_by_code)
+	key_param = 'code'
+
+
+class RevenueByMedicineReportView(LineRevenueReportView):
+	"""Revenue per medicine (?medicine=<id> for a single one)."""
+	report = staticmethod(revenue_by_medicine)
+	key_param = 'medicine'
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "users",
     "rest_framework",
     "corsheaders",
@@ -64,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'Medicore.urls'
@@ -101,6 +103,34 @@ DATABASES = {
     }
 }
 
+# Connection reuse. DB_POOL_MODE:
+# - "persistent" (default): each worker keeps its connection open for up to
+#   DB_CONN_MAX_AGE seconds and checks it is alive before reusing it.
+# - "pgbouncer": same, for connections going through PgBouncer in transaction
+#   pooling mode, which cannot hold server-side cursors across statements.
+# - "native": Django's built-in pool (needs psycopg 3 with psycopg_pool);
+#   sized by DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE, waiting up to DB_POOL_TIMEOUT.
+# - "off": a new connection per request.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'persistent').lower()
+if DB_POOL_MODE == 'off':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+elif DB_POOL_MODE == 'native':
+    # The pool owns connection lifetimes; Django requires CONN_MAX_AGE = 0 here.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_lifetime': float(os.getenv('DB_CONN_MAX_AGE', '600')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv('DB_CONN_HEALTH_CHECKS', '1') == '1'
+    if DB_POOL_MODE == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -168,6 +198,9 @@ REST_FRAMEWORK = {
         'DEFAULT_PERMISSION_CLASSES': [
                 'rest_framework.permissions.IsAuthenticated',
         ],
+        # Keyset pagination keeps list latency flat as tables grow; see core/pagination.py
+        'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+        'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
 
 CORS_ALLOWED_ORIGINS = parse_csv_env("CORS_ALLOWED_ORIGINS", "")
@@ -179,6 +212,66 @@ CORS_ALLOW_CREDENTIALS = True
 # Example: ^https://.*\.vercel\.app$
 CORS_ALLOWED_ORIGIN_REGEXES = parse_csv_env("CORS_ALLOWED_ORIGIN_REGEXES", "")
 
+# Invoice OCR job queue (pharmacy/ocr_jobs.py).
+# 'thread' runs jobs on a thread pool inside each web worker; 'external' leaves
+# them to `python manage.py run_ocr_worker`.
+OCR_WORKER_MODE = os.getenv("OCR_WORKER_MODE", "thread")
+OCR_WORKER_THREADS = int(os.getenv("OCR_WORKER_THREADS", "4"))
+# Max in-flight calls per provider, per process
+OCR_PROVIDER_CONCURRENCY = {
+    "gemini": int(os.getenv("OCR_GEMINI_CONCURRENCY", "2")),
+    "aws_textract": int(os.getenv("OCR_TEXTRACT_CONCURRENCY", "4")),
+}
+# Seconds to wait for a provider before failing the job
+OCR_PROVIDER_TIMEOUT = {
+    "gemini": float(os.getenv("OCR_GEMINI_TIMEOUT", "90")),
+    "aws_textract": float(os.getenv("OCR_TEXTRACT_TIMEOUT", "30")),
+    "passthrough": 5.0,
+}
+# RUNNING jobs older than this are assumed abandoned by a dead worker
+OCR_JOB_STALE_AFTER = int(os.getenv("OCR_JOB_STALE_AFTER", "600"))
+# Seconds between sweeps for stale / unclaimed jobs in thread mode
+OCR_SWEEP_INTERVAL = int(os.getenv("OCR_SWEEP_INTERVAL", "60"))
+# OCR result cache (pharmacy/ocr_cache.py): entry lifetime and total size bound
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(30 * 24 * 3600)))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Text-to-speech (core/tts.py): upstream URL (point at a stand-in server in
+# tests), on-disk audio cache location and size cap, HTTP pool size.
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", str(BASE_DIR / "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TTS_HTTP_POOL_SIZE = int(os.getenv("TTS_HTTP_POOL_SIZE", "10"))
+TTS_READ_TIMEOUT = float(os.getenv("TTS_READ_TIMEOUT", "30"))
+
+# Seconds to cache 1-2 character medicine autocomplete results (pharmacy/search.py)
+MEDICINE_AUTOCOMPLETE_CACHE_TTL = int(os.getenv("MEDICINE_AUTOCOMPLETE_CACHE_TTL", "30"))
+
+# Request metrics (core/metrics.py): requests kept per route for the admin
+# metrics endpoint, and whether exceeding a view's query_budget raises
+# (tests) instead of logging a warning.
+REQUEST_METRICS_WINDOW = int(os.getenv("REQUEST_METRICS_WINDOW", "500"))
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+# Stock alerts (pharmacy StockAlert / StockEvent): how often the dashboard
+# event stream checks for new events, how long one stream stays open before
+# the client reconnects, how many streams one server process serves at once
+# (each open stream occupies a worker thread; keep this well under gunicorn's
+# --threads) and how long a client turned away is told to wait, and how long
+# events are kept for catch-up.
+STOCK_STREAM_POLL_INTERVAL = float(os.getenv("STOCK_STREAM_POLL_INTERVAL", "2"))
+STOCK_STREAM_MAX_SECONDS = int(os.getenv("STOCK_STREAM_MAX_SECONDS", "300"))
+STOCK_STREAM_MAX_STREAMS = int(os.getenv("STOCK_STREAM_MAX_STREAMS", "2"))
+STOCK_STREAM_RETRY_SECONDS = int(os.getenv("STOCK_STREAM_RETRY_SECONDS", "30"))
+STOCK_EVENT_RETENTION_DAYS = int(os.getenv("STOCK_EVENT_RETENTION_DAYS", "30"))
+
+# Bulk patient import (patients/importer.py): initial password for imported
+# accounts (users must change it on first login), rows per insert, and
+# processes used for password hashing (0 = hash in the calling process).
+PATIENT_IMPORT_DEFAULT_PASSWORD = os.getenv("PATIENT_IMPORT_DEFAULT_PASSWORD", "default123")
+PATIENT_IMPORT_CHUNK_SIZE = int(os.getenv("PATIENT_IMPORT_CHUNK_SIZE", "1000"))
+PATIENT_IMPORT_HASH_WORKERS = int(os.getenv("PATIENT_IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+
 
 LOGGING = {
     'version': 1,
@@ -194,3 +287,7 @@ LOGGING = {
     },
 }
 
+# Seconds a /api/dashboard/<name>/ summary is cached (core/dashboard.py). Writes
+# invalidate it immediately in the worker that made them; other workers using
+# the default per-process cache may serve their copy until it expires.
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "30"))
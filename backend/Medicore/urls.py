@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from core.views import DashboardView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,6 +31,7 @@ urlpatterns = [
     path('api/', include('Finance.urls')),
     path('api/pharmacy/', include('pharmacy.urls')),
     path('api/core/', include('core.urls')),
+    path('api/dashboard/<str:name>/', DashboardView.as_view(), name='dashboard'),
 ]
 
 # Serve media files in development
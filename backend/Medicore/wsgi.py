@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Medicore.settings')
 
 application = get_wsgi_application()
+
+# Pick up OCR jobs a previous worker left behind (no-op with OCR_WORKER_MODE=external)
+from pharmacy.ocr_jobs import start_sweeper  # noqa: E402
+
+start_sweeper()
@@ -0,0 +1,251 @@
+"""
+Server-side dashboard summaries.
+
+Each dashboard (``pharmacy``, ``finance``, ``admin``) is built from a handful of
+grouped / conditional aggregate queries instead of the browser downloading
+whole tables and summing them. Results are cached per dashboard and date range
+for DASHBOARD_CACHE_TTL seconds.
+
+Invalidation is by generation: every dashboard has a counter in the cache that
+is part of its keys. A committed write to a model the dashboard reads
+(post_save / post_delete, or an explicit ``invalidate_for`` from bulk paths
+that bypass signals) bumps the counter, so the next request rebuilds. With the
+default per-process cache other workers still serve their copy until the TTL
+runs out, which is what keeps the TTL short.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+# Rows in the "top" and "recent" lists
+TOP_N = 5
+RECENT_N = 50
+
+# Models each dashboard reads; a write to any of them invalidates it
+DEPENDENCIES = {
+    'pharmacy': (
+        'pharmacy.Medicine', 'pharmacy.InventoryTransaction', 'pharmacy.StockAlert',
+        'pharmacy.DailyMedicineLedger', 'patients.Prescription',
+    ),
+    'finance': (
+        'Finance.Invoice', 'Finance.Payment', 'Finance.RevenueEntry', 'Finance.ExpenseEntry',
+        'pharmacy.InventoryTransaction', 'pharmacy.DailyMedicineLedger',
+    ),
+    'admin': (
+        'users.User', 'patients.Patient', 'Finance.Invoice', 'pharmacy.Medicine', 'pharmacy.StockAlert',
+    ),
+}
+
+
+def resolve_period(params):
+    """(start, end) from ?start_date / ?end_date; defaults to the start of this month through today.
+
+    Raises ValueError with a message for a well-formed but impossible date (2025-02-30).
+    """
+    today = date.today()
+    try:
+        start = parse_date(params.get('start_date') or '') or today.replace(day=1)
+        end = parse_date(params.get('end_date') or '') or today
+    except ValueError:
+        raise ValueError('Enter valid dates (YYYY-MM-DD).')
+    if end < start:
+        start, end = end, start
+    return start, end
+
+
+def _money_sum(field, **filters):
+    return Coalesce(Sum(field, filter=Q(**filters) if filters else None), Decimal('0'), output_field=DecimalField())
+
+
+def build_pharmacy(start, end):
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    StockAlert = apps.get_model('pharmacy', 'StockAlert')
+    InventoryTransaction = apps.get_model('pharmacy', 'InventoryTransaction')
+    DailyMedicineLedger = apps.get_model('pharmacy', 'DailyMedicineLedger')
+    Prescription = apps.get_model('patients', 'Prescription')
+
+    counts = Medicine.objects.aggregate(
+        total_medicines=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        in_stock=Count('id', filter=Q(current_stock__gt=F('reorder_level'))),
+        low_stock=Count('id', filter=Q(current_stock__gt=0, current_stock__lte=F('reorder_level'))),
+        out_of_stock=Count('id', filter=Q(current_stock__lte=0)),
+        stock_value=Coalesce(Sum(F('current_stock') * F('buying_price')), Decimal('0'), output_field=DecimalField()),
+    )
+    categories = list(
+        Medicine.objects.values('category').annotate(count=Count('id')).order_by('-count', 'category')
+    )
+    alerts = [a.as_dict() for a in StockAlert.objects.select_related('medicine').order_by('medicine__name')]
+    top_dispensed = list(
+        DailyMedicineLedger.objects.filter(day__range=(start, end))
+        .values('medicine_id', name=F('medicine__name'))
+        .annotate(quantity=Sum('qty_dispensed'), sales=Sum('revenue'))
+        .filter(quantity__gt=0)
+        .order_by('-quantity', 'name')[:TOP_N]
+    )
+    recent = list(
+        InventoryTransaction.objects.order_by('-created_at', '-id')
+        .values('id', 'medicine_id', 'transaction_type', 'quantity', 'created_at', medicine_name=F('medicine__name'))[:RECENT_N]
+    )
+    counts['pending_prescriptions'] = Prescription.objects.filter(status='PENDING').count()
+
+    return {
+        'stats': counts,
+        'categories': categories,
+        'low_stock': alerts,
+        'top_dispensed': top_dispensed,
+        'recent_transactions': recent,
+    }
+
+
+def build_finance(start, end):
+    from Finance.reports import financial_position
+
+    Invoice = apps.get_model('Finance', 'Invoice')
+    Payment = apps.get_model('Finance', 'Payment')
+    InventoryTransaction = apps.get_model('pharmacy', 'InventoryTransaction')
+    DailyMedicineLedger = apps.get_model('pharmacy', 'DailyMedicineLedger')
+
+    invoices = {
+        row['status']: row
+        for row in Invoice.objects.values('status')
+        .annotate(count=Count('id'), amount=_money_sum('total'), outstanding=_money_sum('balance')).order_by()
+    }
+    due = invoices.get('DUE', {'count': 0, 'amount': Decimal('0'), 'outstanding': Decimal('0')})
+
+    payments = Payment.objects.aggregate(count=Count('id'), total=_money_sum('amount'))
+    ledger = DailyMedicineLedger.objects.aggregate(
+        total_revenue=_money_sum('revenue'),
+        total_cogs=_money_sum('cogs'),
+        total_spent=_money_sum('spend'),
+        period_revenue=_money_sum('revenue', day__range=(start, end)),
+        period_cogs=_money_sum('cogs', day__range=(start, end)),
+        period_spent=_money_sum('spend', day__range=(start, end)),
+    )
+    recent_payments = list(
+        Payment.objects.order_by('-created_at', '-id')
+        .values('id', 'invoice', 'amount', 'method', 'reference', 'created_at')[:RECENT_N]
+    )
+    recent_stock_in = list(
+        InventoryTransaction.objects.filter(transaction_type='STOCK_IN').order_by('-created_at', '-id')
+        .values(
+            'id', 'medicine', 'quantity', 'batch_number', 'created_at',
+            medicine_name=F('medicine__name'),
+            buying_price=Coalesce('unit_cost', 'medicine__buying_price'),
+        )[:RECENT_N]
+    )
+
+    position = financial_position(start, end)
+    return {
+        'summary': {
+            'pending_invoices': due['count'],
+            'outstanding_balance': due['outstanding'],
+            'money_paid': payments['total'],
+            'payments_count': payments['count'],
+            'money_spent': ledger['total_spent'],
+            'gross_profit': ledger['total_revenue'] - ledger['total_cogs'],
+            'period_gross_profit': ledger['period_revenue'] - ledger['period_cogs'],
+            'period_spent': ledger['period_spent'],
+        },
+        'invoices_by_status': {
+            status: {'count': row['count'], 'total': row['amount'], 'balance': row['outstanding']}
+            for status, row in invoices.items()
+        },
+        # Same as /api/finance/reports/financial-position/
+        'financial_position': position,
+        'recent_payments': recent_payments,
+        'recent_stock_in': recent_stock_in,
+    }
+
+
+def build_admin(start, end):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Patient = apps.get_model('patients', 'Patient')
+    StockAlert = apps.get_model('pharmacy', 'StockAlert')
+    Invoice = apps.get_model('Finance', 'Invoice')
+
+    users_by_role = {row['role']: row['count'] for row in User.objects.values('role').annotate(count=Count('id')).order_by()}
+    alerts = StockAlert.objects.aggregate(
+        low_stock=Count('id', filter=Q(status='LOW_STOCK')),
+        out_of_stock=Count('id', filter=Q(status='OUT_OF_STOCK')),
+    )
+    due = Invoice.objects.filter(status='DUE').aggregate(count=Count('id'), total=_money_sum('balance'))
+    return {
+        'stats': {
+            'total_users': sum(users_by_role.values()),
+            'total_patients': Patient.objects.count(),
+            'low_stock_items': alerts['low_stock'] + alerts['out_of_stock'],
+            'out_of_stock_items': alerts['out_of_stock'],
+            'pending_invoices': due['count'],
+            'pending_invoices_total': due['total'],
+        },
+        'users_by_role': users_by_role,
+    }
+
+
+BUILDERS = {
+    'pharmacy': build_pharmacy,
+    'finance': build_finance,
+    'admin': build_admin,
+}
+
+
+def _generation_key(name):
+    return f'dashboard:gen:{name}'
+
+
+def _generation(name):
+    return cache.get_or_set(_generation_key(name), 1, None)
+
+
+def get_dashboard(name, start, end):
+    """(data, cached) for one dashboard and date range."""
+    key = f'dashboard:{name}:{_generation(name)}:{start.isoformat()}:{end.isoformat()}'
+    data = cache.get(key)
+    if data is not None:
+        return data, True
+    data = BUILDERS[name](start, end)
+    data['period'] = {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+    data['generated_at'] = timezone.now()
+    cache.set(key, data, getattr(settings, 'DASHBOARD_CACHE_TTL', 30))
+    return data, False
+
+
+def invalidate(*names):
+    """Drop the cached copies of these dashboards once the current transaction commits."""
+    def bump():
+        for name in names:
+            try:
+                cache.incr(_generation_key(name))
+            except ValueError:
+                cache.set(_generation_key(name), 2, None)
+    transaction.on_commit(bump)
+
+
+def invalidate_for(*models):
+    """Invalidate every dashboard that reads any of these models."""
+    labels = {model._meta.label for model in models}
+    names = [name for name, deps in DEPENDENCIES.items() if labels.intersection(deps)]
+    if names:
+        invalidate(*names)
+
+
+def _on_write(sender, **kwargs):
+    invalidate_for(sender)
+
+
+def connect_signals():
+    labels = {label for deps in DEPENDENCIES.values() for label in deps}
+    for label in labels:
+        model = apps.get_model(label)
+        post_save.connect(_on_write, sender=model, dispatch_uid=f'core.dashboard.save.{label}')
+        post_delete.connect(_on_write, sender=model, dispatch_uid=f'core.dashboard.delete.{label}')
@@ -0,0 +1,112 @@
+"""
+Per-worker database connection statistics.
+
+Counts, for this server process, how many requests were served and how many of
+them found a database connection already open (reused) versus how many new
+connections had to be opened. With persistent connections nearly every request
+should reuse; a low reuse ratio means connections are being recycled too often
+(DB_CONN_MAX_AGE) or failing health checks. In ``native`` pool mode the psycopg
+pool's own counters (size, idle connections, waiting requests) are included.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_lock = threading.Lock()
+_started_at = time.time()
+_requests = 0
+_reused = defaultdict(int)
+_opened = defaultdict(int)
+
+
+def _on_request_started(sender, **kwargs):
+    global _requests
+    with _lock:
+        _requests += 1
+        # Runs after Django's own request_started handler has closed obsolete or
+        # unusable connections, so anything still open here is really reused.
+        for alias in connections:
+            if connections[alias].connection is not None:
+                _reused[alias] += 1
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] += 1
+
+
+def connect_signals():
+    request_started.connect(_on_request_started, dispatch_uid='core.dbstats.request_started')
+    connection_created.connect(_on_connection_created, dispatch_uid='core.dbstats.connection_created')
+
+
+def _pool_stats(conn):
+    pool = getattr(conn, 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    size = stats.get('pool_size', 0)
+    available = stats.get('pool_available', 0)
+    max_size = stats.get('pool_max', 0) or size
+    return {
+        'size': size,
+        'idle': available,
+        'in_use': size - available,
+        'max_size': max_size,
+        'utilization': round((size - available) / max_size, 3) if max_size else 0,
+        'requests_waiting': stats.get('requests_waiting', 0),
+        'requests_queued': stats.get('requests_queued', 0),
+        'requests_wait_ms': stats.get('requests_wait_ms', 0),
+        'requests_errors': stats.get('requests_errors', 0),
+        'connections_opened': stats.get('connections_num', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+    }
+
+
+def snapshot():
+    """Connection settings and reuse counters for every configured database, for this process."""
+    with _lock:
+        requests = _requests
+        reused = dict(_reused)
+        opened = dict(_opened)
+
+    aliases = {}
+    for alias in connections:
+        conn = connections[alias]
+        config = conn.settings_dict
+        aliases[alias] = {
+            'vendor': conn.vendor,
+            'conn_max_age': config.get('CONN_MAX_AGE'),
+            'health_checks': config.get('CONN_HEALTH_CHECKS', False),
+            'server_side_cursors': not config.get('DISABLE_SERVER_SIDE_CURSORS', False),
+            'connections_opened': opened.get(alias, 0),
+            'requests_reusing_connection': reused.get(alias, 0),
+            'reuse_ratio': round(reused.get(alias, 0) / requests, 3) if requests else None,
+            'connected': conn.connection is not None,
+            'pool': _pool_stats(conn),
+        }
+        if conn.connection is not None and conn.close_at is not None and config.get('CONN_MAX_AGE'):
+            aliases[alias]['recycle_in_s'] = round(conn.close_at - time.monotonic(), 1)
+
+    return {
+        'pid': os.getpid(),
+        'pool_mode': getattr(settings, 'DB_POOL_MODE', 'off'),
+        'uptime_s': round(time.time() - _started_at),
+        'requests': requests,
+        'databases': aliases,
+    }
+
+
+def ping(alias='default'):
+    """Round-trip time of a trivial query, in milliseconds."""
+    start = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,84 @@
+from contextlib import nullcontext
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+
+def list_endpoints():
+    """Return (label, viewset) pairs for the list endpoints that render patients."""
+    from Finance.views import InvoiceViewSet
+    from emr.views import LabReportViewSet, PrescriptionViewSet as EmrPrescriptionViewSet, TreatmentNoteViewSet
+    from patients.views import PatientViewSet, VisitViewSet, PrescriptionViewSet
+
+    return [
+        ('/api/patients/', PatientViewSet),
+        ('/api/visits/', VisitViewSet),
+        ('/api/prescriptions/', PrescriptionViewSet),
+        ('/api/lab-reports/', LabReportViewSet),
+        ('emr PrescriptionViewSet', EmrPrescriptionViewSet),  # shadowed by /api/prescriptions/
+        ('/api/treatment-notes/', TreatmentNoteViewSet),
+        ('/api/invoices/', InvoiceViewSet),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Report SQL queries and payload size per list endpoint, comparing the list serializer with the full one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to make the requests as (defaults to the first ADMIN)')
+        parser.add_argument('--page-size', type=int, default=50, help='Rows per page to request')
+        parser.add_argument('--max-queries', type=int, default=3, help='Flag endpoints that need more queries than this per page')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options.get('username'):
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(role='ADMIN').order_by('id').first()
+        if user is None:
+            raise CommandError('No user to run the audit as; pass --username.')
+
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h not in ('*', '')), 'localhost')
+        factory = APIRequestFactory(SERVER_NAME=host)
+
+        self.stdout.write(f"{'endpoint':<30} {'rows':>5} {'queries':>8} {'full KB':>8} {'list KB':>8}")
+        offenders = 0
+        for path, viewset in list_endpoints():
+            full_queries, full_bytes, _ = self._measure(factory, user, path, viewset, options['page_size'], lean=False)
+            list_queries, list_bytes, rows = self._measure(factory, user, path, viewset, options['page_size'], lean=True)
+            queries = max(full_queries, list_queries)
+            line = f'{path:<30} {rows:>5} {queries:>8} {full_bytes / 1024:>8.1f} {list_bytes / 1024:>8.1f}'
+            # A page should cost a fixed handful of queries; more than that means a per-row lookup.
+            if queries > options['max_queries']:
+                offenders += 1
+                self.stdout.write(self.style.ERROR(f'❌ {line}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'✅ {line}'))
+
+        if offenders:
+            self.stdout.write(self.style.WARNING(f'{offenders} endpoints issue more than {options["max_queries"]} queries per page.'))
+
+    def _measure(self, factory, user, path, viewset, page_size, lean):
+        """Return (query count, response bytes, rows) for one list page."""
+        request = factory.get(path if path.startswith('/') else '/', {'page_size': page_size})
+        force_authenticate(request, user=user)
+        view = viewset.as_view({'get': 'list'})
+
+        # The "full" run swaps the detail serializer back in to show what the list one saves.
+        if lean or getattr(viewset, 'list_serializer_class', None) is None:
+            swap = nullcontext()
+        else:
+            swap = mock.patch.object(viewset, 'list_serializer_class', None)
+        with swap, CaptureQueriesContext(connection) as queries:
+            response = view(request)
+            response.render()
+        data = response.data
+        if isinstance(data, dict) and 'results' in data:
+            data = data['results']
+        return len(queries.captured_queries), len(response.content), len(data or [])
+
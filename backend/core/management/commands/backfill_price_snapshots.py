@@ -0,0 +1,39 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+
+
+class Command(BaseCommand):
+    help = 'Fill InventoryTransaction.unit_cost/unit_price for rows written before price snapshots existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Transactions updated per statement')
+        parser.add_argument('--skip-ledger', action='store_true', help='Do not rebuild DailyMedicineLedger afterwards')
+
+    def handle(self, *args, **options):
+        from pharmacy.models import Medicine, InventoryTransaction
+
+        chunk = max(1, options['chunk_size'])
+        missing = InventoryTransaction.objects.filter(Q(unit_cost__isnull=True) | Q(unit_price__isnull=True))
+        bounds = missing.aggregate(lo=Min('id'), hi=Max('id'))
+        if bounds['lo'] is None:
+            self.stdout.write(self.style.SUCCESS('✅ All transactions already have price snapshots'))
+            return
+
+        # Historical prices are not recorded anywhere, so current medicine prices
+        # are the best available approximation for old rows.
+        buying = Subquery(Medicine.objects.filter(pk=OuterRef('medicine_id')).values('buying_price')[:1])
+        selling = Subquery(Medicine.objects.filter(pk=OuterRef('medicine_id')).values('selling_price')[:1])
+
+        updated = 0
+        # Walk the id range in chunks so each UPDATE commits on its own and never
+        # holds locks on the whole table.
+        for lo in range(bounds['lo'], bounds['hi'] + 1, chunk):
+            window = InventoryTransaction.objects.filter(id__gte=lo, id__lt=lo + chunk)
+            updated += window.filter(unit_cost__isnull=True).update(unit_cost=buying)
+            window.filter(unit_price__isnull=True).update(unit_price=selling)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Backfilled price snapshots for {updated} transactions'))
+
+        if not options.get('skip_ledger'):
+            call_command('rebuild_medicine_ledger', stdout=self.stdout)
@@ -0,0 +1,122 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+
+# Plan fragments that mean an index was used, per backend.
+INDEX_MARKERS = {
+    'postgresql': re.compile(r'(?:Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)'),
+    'sqlite': re.compile(r'USING (?:COVERING )?INDEX (\w+)'),
+}
+
+
+def hot_queries():
+    """Return (label, queryset) pairs mirroring the hottest filter/order paths in the API."""
+    from Finance.models import Invoice, Payment, RevenueEntry, ExpenseEntry
+    from patients.models import Prescription
+    from pharmacy.models import Medicine, InventoryTransaction, DailyMedicineLedger, StockEvent
+    from pharmacy.search import autocomplete_queryset
+    from patients.search import search_patients
+
+    now = timezone.now()
+    month_ago = now - timedelta(days=30)
+    today = now.date()
+    some_medicine = Medicine.objects.values_list('id', flat=True).first() or 0
+    some_prescription = Prescription.objects.values_list('id', flat=True).first() or 0
+
+    return [
+        ('finance summaries: ledger days in range',
+         DailyMedicineLedger.objects.filter(day__gte=month_ago.date(), day__lte=today)),
+        ('finance summaries: ledger days in range for a medicine',
+         DailyMedicineLedger.objects.filter(medicine_id=some_medicine, day__gte=month_ago.date())),
+        ('ledger rebuild: transactions in range',
+         InventoryTransaction.objects.filter(created_at__gte=month_ago, created_at__lt=now)),
+        ('transaction_history: one medicine',
+         InventoryTransaction.objects.filter(medicine_id=some_medicine).order_by('-created_at')),
+        ('inventory-transactions list (first page)',
+         InventoryTransaction.objects.order_by('-created_at', '-id')[:50]),
+        ('dispense gate: PAID invoice for prescription',
+         Invoice.objects.filter(prescription_id=some_prescription, status='PAID').values('id')[:1]),
+        ('invoices list: DUE, newest first',
+         Invoice.objects.filter(status='DUE').order_by('-created_at')[:50]),
+        ('payments list (first page)',
+         Payment.objects.order_by('-created_at', '-id')[:50]),
+        ('dispense queue: PENDING prescriptions',
+         Prescription.objects.filter(status='PENDING').order_by('-created_at')[:50]),
+        ('financial position: revenue by category',
+         RevenueEntry.objects.filter(occurred_on__range=(today.replace(day=1), today), category='INVOICE_PAYMENT')),
+        ('financial position: expenses by category',
+         ExpenseEntry.objects.filter(occurred_on__range=(today.replace(day=1), today), category='STOCK')),
+        ('rebuild_stock_alerts: active medicines under reorder level',
+         Medicine.objects.filter(current_stock__lte=F('reorder_level'), is_active=True)),
+        ('stock stream: events after cursor',
+         StockEvent.objects.filter(id__gt=0).order_by('id')[:100]),
+        ('medicine autocomplete: substring / trigram match',
+         autocomplete_queryset('amoxi', 20, in_stock=True)),
+        ('medicine autocomplete: short prefix',
+         autocomplete_queryset('am', 20, in_stock=False)),
+        ('patient search: name prefix / trigram match',
+         search_patients('wanj')),
+        ('patient search: phone number prefix',
+         search_patients('0712')),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot API queries and report whether each one uses an index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full query plan for every query')
+        parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE (PostgreSQL only; executes the queries)')
+        parser.add_argument(
+            '--no-seqscan',
+            action='store_true',
+            help='Discourage sequential scans (PostgreSQL only) so small dev tables still show which index would be chosen',
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        marker = INDEX_MARKERS.get(vendor)
+        if marker is None:
+            self.stdout.write(self.style.WARNING(f'Index detection is not supported for the {vendor} backend; printing plans only.'))
+
+        explain_opts = {}
+        if options.get('analyze') and vendor == 'postgresql':
+            explain_opts['analyze'] = True
+
+        if options.get('no_seqscan') and vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+        misses = 0
+        for label, qs in hot_queries():
+            plan = qs.explain(**explain_opts)
+            indexes = sorted(set(marker.findall(plan))) if marker is not None else []
+
+            if marker is None:
+                self.stdout.write(f'• {label}')
+            elif indexes:
+                self.stdout.write(f"✅ {label}: {', '.join(indexes)}")
+            else:
+                misses += 1
+                self.stdout.write(self.style.ERROR(f'❌ {label}: no index used'))
+
+            if options.get('verbose_plans') or marker is None:
+                self.stdout.write(plan)
+                self.stdout.write('')
+
+        if options.get('no_seqscan') and vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+        if misses:
+            self.stdout.write(self.style.WARNING(
+                f'{misses} hot queries did not use an index. On small tables the planner may prefer a sequential scan; '
+                're-run with --no-seqscan to check index coverage.'
+            ))
+        elif marker is not None:
+            self.stdout.write(self.style.SUCCESS('All hot queries are served by an index.'))
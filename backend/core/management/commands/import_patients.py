@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Register patients in bulk from a CSV file (username, name, gender[, dob, contact, address, password])'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV file with a header row')
+        parser.add_argument('--chunk-size', type=int, help='Rows per bulk insert (default PATIENT_IMPORT_CHUNK_SIZE)')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default PATIENT_IMPORT_HASH_WORKERS)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without saving anything')
+        parser.add_argument('--errors', type=str, help='Write the per-row error report to this CSV file')
+
+    def handle(self, *args, **options):
+        import csv
+
+        from patients.importer import ImportFileError, PatientImport
+
+        def progress(report):
+            self.stdout.write(f"   … {report['rows']} rows read, {report['created']} created, {report['failed']} failed")
+
+        importer = PatientImport(
+            chunk_size=options.get('chunk_size'),
+            workers=options.get('workers'),
+            dry_run=options['dry_run'],
+            on_chunk=progress,
+        )
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as fh:
+                report = importer.run(csv.DictReader(fh))
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['csv_path']}")
+        except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors'][:20]:
+            details = '; '.join(f'{field}: {msg}' for field, msg in error['errors'].items())
+            self.stdout.write(self.style.WARNING(f"⚠️  Row {error['row']} ({error['username'] or 'no username'}): {details}"))
+        if len(report['errors']) > 20:
+            self.stdout.write(self.style.WARNING(f"⚠️  … and {len(report['errors']) - 20} more"))
+
+        if options.get('errors'):
+            with open(options['errors'], 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(['row', 'username', 'field', 'error'])
+                for error in report['errors']:
+                    for field, msg in error['errors'].items():
+                        writer.writerow([error['row'], error['username'], field, msg])
+            self.stdout.write(f"📝 Error report written to {options['errors']}")
+
+        verb = 'would be created' if options['dry_run'] else 'created'
+        ids = ''
+        if report['first_medical_id']:
+            ids = f" ({report['first_medical_id']} – {report['last_medical_id']})"
+        self.stdout.write(self.style.SUCCESS(f"✅ {report['created']} of {report['rows']} patients {verb}{ids}"))
+        if report['failed']:
+            self.stdout.write(self.style.ERROR(f"❌ {report['failed']} rows failed"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored financial position of every closed month (FinancialPeriodSnapshot)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, help='First month to rebuild (YYYY-MM-DD, any day of it). Defaults to the earliest entry or payment.')
+
+    def handle(self, *args, **options):
+        from Finance.models import ExpenseEntry, FinancialPeriodSnapshot, Payment, RevenueEntry
+        from Finance.reports import month_start, next_month, snapshot_months
+
+        current = month_start(timezone.localdate())
+        if options.get('start'):
+            start = parse_date(options['start'])
+            if not start:
+                raise CommandError('Invalid --start date; expected YYYY-MM-DD')
+        else:
+            # Nothing before the first record; drop snapshots of months that no longer have any
+            FinancialPeriodSnapshot.objects.all().delete()
+            firsts = [
+                RevenueEntry.objects.aggregate(first=Min('occurred_on'))['first'],
+                ExpenseEntry.objects.aggregate(first=Min('occurred_on'))['first'],
+            ]
+            first_payment = Payment.objects.aggregate(first=Min('created_at'))['first']
+            if first_payment:
+                firsts.append(timezone.localdate(first_payment))
+            firsts = [d for d in firsts if d]
+            if not firsts:
+                self.stdout.write('📝 No revenue, expenses or payments recorded yet')
+                return
+            start = min(firsts)
+
+        months = []
+        month = month_start(start)
+        while month < current:
+            months.append(month)
+            month = next_month(month)
+        written = snapshot_months(months)
+        span = f'{months[0]:%Y-%m} to {months[-1]:%Y-%m}' if months else 'no closed months'
+        self.stdout.write(self.style.SUCCESS(f'✅ Stored {len(written)} monthly snapshots ({span})'))
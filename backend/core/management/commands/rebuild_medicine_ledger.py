@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyMedicineLedger rollup from InventoryTransaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, help='First day to rebuild (YYYY-MM-DD). Defaults to the beginning of history.')
+        parser.add_argument('--end', type=str, help='Last day to rebuild (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        from pharmacy.models import DailyMedicineLedger
+
+        start = end = None
+        if options.get('start'):
+            start = parse_date(options['start'])
+            if not start:
+                raise CommandError('Invalid --start date; expected YYYY-MM-DD')
+        if options.get('end'):
+            end = parse_date(options['end'])
+            if not end:
+                raise CommandError('Invalid --end date; expected YYYY-MM-DD')
+        if start and end and end < start:
+            raise CommandError('--end must not be before --start')
+
+        written = DailyMedicineLedger.rebuild(start=start, end=end, batch_size=options['batch_size'])
+        span = f"{start or 'beginning'} to {end or 'today'}"
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {written} ledger rows ({span})'))
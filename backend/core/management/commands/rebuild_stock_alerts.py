@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute the low/out-of-stock set (StockAlert) from Medicine and prune old stock events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Medicines per sync batch')
+        parser.add_argument(
+            '--retention-days', type=int, default=None,
+            help='Delete stock events older than this (default STOCK_EVENT_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        from pharmacy.models import StockAlert, StockEvent
+
+        corrected = StockAlert.rebuild(batch_size=options['batch_size'])
+        flagged = StockAlert.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'✅ {flagged} medicines flagged low/out of stock ({corrected} corrections published)'))
+
+        days = options['retention_days']
+        if days is None:
+            days = getattr(settings, 'STOCK_EVENT_RETENTION_DAYS', 30)
+        pruned = StockEvent.prune(days)
+        self.stdout.write(f'🧹 Pruned {pruned} stock events older than {days} days')
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+
+class Command(BaseCommand):
+    help = "Check every invoice's stored amount_paid against the sum of its payments, and optionally fix it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite amount_paid (and mark covered DUE invoices PAID)')
+        parser.add_argument('--show', type=int, default=20, help='Mismatches to list (default 20)')
+
+    def handle(self, *args, **options):
+        from Finance.models import Invoice, Payment
+
+        paid = dict(
+            Payment.objects.order_by().values('invoice').annotate(total=Sum('amount')).values_list('invoice', 'total')
+        )
+        checked = 0
+        wrong_paid = []
+        unpaid_status = []
+        for invoice_id, amount_paid, total, status in (
+            Invoice.objects.order_by('pk').values_list('id', 'amount_paid', 'total', 'status').iterator(chunk_size=2000)
+        ):
+            checked += 1
+            actual = paid.get(invoice_id) or Decimal('0')
+            if actual != amount_paid:
+                wrong_paid.append((invoice_id, amount_paid, actual))
+            if status == 'DUE' and total <= actual and actual > 0:
+                unpaid_status.append(invoice_id)
+
+        self.stdout.write(f'📝 Checked {checked} invoices')
+        if not wrong_paid and not unpaid_status:
+            self.stdout.write(self.style.SUCCESS('✅ Every amount_paid matches its payments'))
+            return
+
+        for invoice_id, stored, actual in wrong_paid[:options['show']]:
+            self.stdout.write(f'   Invoice #{invoice_id}: amount_paid {stored}, payments total {actual}')
+        if wrong_paid:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(wrong_paid)} invoices have the wrong amount_paid'))
+        if unpaid_status:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(unpaid_status)} fully paid invoices are still DUE'))
+        if not options['fix']:
+            self.stdout.write('Run with --fix to correct them')
+            return
+
+        fixed = 0
+        for invoice_id in sorted({i for i, _, _ in wrong_paid} | set(unpaid_status)):
+            with transaction.atomic():
+                # The row lock holds off Payment.save for this invoice while we recount
+                invoice = Invoice.objects.select_for_update().only('id', 'total', 'status').get(pk=invoice_id)
+                actual = Payment.objects.filter(invoice_id=invoice_id).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+                changes = {'amount_paid': actual}
+                if invoice.status == 'DUE' and invoice.total <= actual and actual > 0:
+                    changes['status'] = 'PAID'
+                Invoice.objects.filter(pk=invoice_id).update(**changes)
+                fixed += 1
+        self.stdout.write(self.style.SUCCESS(f'✅ Fixed {fixed} invoices'))
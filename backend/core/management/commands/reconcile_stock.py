@@ -0,0 +1,42 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Check every medicine's current_stock (and batch totals) against the inventory ledger, and optionally fix it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Reset drifted medicines to their ledger totals')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Medicine ids per grouped query (default 2000)')
+        parser.add_argument('--show', type=int, default=20, help='Mismatches to list (default 20)')
+
+    def handle(self, *args, **options):
+        from pharmacy.reconcile import find_drift, repair
+
+        started = time.monotonic()
+        drift = find_drift(workers=options['workers'], chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"📝 Checked the ledger in {elapsed:.1f}s ({options['workers']} workers)")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('✅ Every current_stock matches its transactions and batches'))
+            return
+
+        for pk, name, stock, expected, in_batches in drift[:options['show']]:
+            self.stdout.write(f'   {name} (#{pk}): current_stock {stock}, ledger {expected}, batches {in_batches}')
+        wrong_stock = sum(1 for _, _, stock, expected, _ in drift if stock != max(0, expected))
+        if wrong_stock:
+            self.stdout.write(self.style.WARNING(f'⚠️ {wrong_stock} medicines have a current_stock that differs from the ledger'))
+        if len(drift) > wrong_stock:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(drift) - wrong_stock} medicines have batches that don\'t add up to their stock'))
+        negative = [name for _, name, _, expected, _ in drift if expected < 0]
+        if negative:
+            self.stdout.write(self.style.WARNING(f"⚠️ Ledger is below zero for {', '.join(negative[:10])} (--fix sets them to 0)"))
+        if not options['fix']:
+            self.stdout.write('Run with --fix to correct them')
+            return
+
+        fixed = repair(pk for pk, *_ in drift)
+        self.stdout.write(self.style.SUCCESS(f'✅ Fixed {fixed} medicines'))
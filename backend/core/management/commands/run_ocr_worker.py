@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = 'Process queued invoice OCR jobs (use with OCR_WORKER_MODE=external)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs processed concurrently')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        from pharmacy import ocr_jobs
+
+        threads = max(1, options['threads'])
+        self.stdout.write(f'OCR worker started with {threads} threads')
+
+        def work(job_id):
+            try:
+                ocr_jobs.run_job(job_id, claimed=True)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ocr-worker') as pool:
+            in_flight = set()
+            while True:
+                requeued = ocr_jobs.requeue_stale()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale OCR jobs'))
+
+                in_flight = {f for f in in_flight if not f.done()}
+                claimed_any = False
+                while len(in_flight) < threads:
+                    job_id = ocr_jobs.claim_next()
+                    if job_id is None:
+                        break
+                    claimed_any = True
+                    in_flight.add(pool.submit(work, job_id))
+
+                if options.get('once') and not claimed_any and not in_flight:
+                    break
+                if not claimed_any:
+                    time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS('✅ OCR queue drained'))
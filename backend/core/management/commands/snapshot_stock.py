@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Write the StockSnapshot for the end of a day (default: yesterday); run nightly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Day to snapshot (YYYY-MM-DD). Defaults to yesterday.')
+        parser.add_argument('--days', type=int, default=1, help='Also snapshot this many days back from --date (backfill)')
+
+    def handle(self, *args, **options):
+        from pharmacy.models import StockSnapshot
+
+        today = timezone.localdate()
+        day = today - timedelta(days=1)
+        if options.get('date'):
+            day = parse_date(options['date'])
+            if not day:
+                raise CommandError('Invalid --date; expected YYYY-MM-DD')
+        if day >= today:
+            raise CommandError('Only days that have ended can be snapshotted')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        # Latest first, so each day is worked out from the snapshot just written
+        for offset in range(options['days']):
+            current = day - timedelta(days=offset)
+            written = StockSnapshot.take(current)
+            self.stdout.write(f'📝 {current}: {written} medicines in stock')
+        self.stdout.write(self.style.SUCCESS(f"✅ Wrote {options['days']} stock snapshot(s)"))
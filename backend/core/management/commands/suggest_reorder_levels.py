@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Forecast reorder levels for every active medicine from dispensing history, and optionally apply them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Days of dispensing history (default 90)')
+        parser.add_argument('--window', type=int, help='Moving-average window in days (default 28)')
+        parser.add_argument('--lead-time', type=int, help='Supplier lead time in days (default 7)')
+        parser.add_argument('--service-level', type=float, help='Chance of not running out during the lead time (default 0.95)')
+        parser.add_argument('--cover-days', type=int, help='Days of demand an order should cover (default 30)')
+        parser.add_argument('--apply', action='store_true', help='Write the suggested reorder levels')
+        parser.add_argument('--show', type=int, default=20, help='Changes to list (default 20)')
+
+    def handle(self, *args, **options):
+        from pharmacy import forecast
+
+        try:
+            params = forecast.parse_params(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        results = forecast.suggest(params)
+        elapsed = time.monotonic() - started
+        changes = [row for row in results if row['suggested_reorder_level'] != row['reorder_level']]
+        to_order = sum(1 for row in results if row['suggested_order_quantity'])
+        self.stdout.write(f'📝 Forecast {len(results)} medicines in {elapsed:.1f}s; {to_order} need ordering')
+        for row in changes[:options['show']]:
+            self.stdout.write(
+                f"   {row['name']} (#{row['id']}): reorder level {row['reorder_level']} -> {row['suggested_reorder_level']}"
+                f" ({row['avg_daily']}/day, order {row['suggested_order_quantity']})"
+            )
+        if not changes:
+            self.stdout.write(self.style.SUCCESS('✅ Every reorder level matches its forecast'))
+            return
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(changes)} reorder levels differ from the forecast'))
+            self.stdout.write('Run with --apply to write them')
+            return
+
+        changed = forecast.apply_reorder_levels({row['id']: row['suggested_reorder_level'] for row in changes})
+        self.stdout.write(self.style.SUCCESS(f'✅ Updated {len(changed)} reorder levels'))
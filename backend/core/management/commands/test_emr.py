@@ -72,8 +72,8 @@ class Command(BaseCommand):
             return r.data['id']
         # if duplicate, fetch existing by search
         r = client.get('/api/patients/', {'search': 'EMR Test Patient'})
-        if r.status_code == status.HTTP_200_OK and len(r.data):
-            return r.data[0]['id']
+        if r.status_code == status.HTTP_200_OK and r.data['results']:
+            return r.data['results'][0]['id']
         raise SystemExit('Failed to ensure patient')
 
     def _create_prescription(self, client: APIClient, patient_id: int) -> int:
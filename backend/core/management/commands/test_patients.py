@@ -87,7 +87,7 @@ class Command(BaseCommand):
 
 			# List patients
 			r = client.get('/api/patients/')
-			if r.status_code != status.HTTP_200_OK or not any(p['id']==patient_id for p in r.data):
+			if r.status_code != status.HTTP_200_OK or not any(p['id']==patient_id for p in r.data['results']):
 				self.stdout.write(self.style.ERROR(f'❌ {role}: list patients failed'))
 				raise SystemExit(1)
 
@@ -133,7 +133,7 @@ class Command(BaseCommand):
 
 		# Search by name
 		r = client.get('/api/patients/?search=Test%20Patient%203')
-		if r.status_code != status.HTTP_200_OK or not any('Test Patient 3' in p['name'] for p in r.data):
+		if r.status_code != status.HTTP_200_OK or not any('Test Patient 3' in p['name'] for p in r.data['results']):
 			self.stdout.write(self.style.ERROR('❌ Search by name failed'))
 			raise SystemExit(1)
 
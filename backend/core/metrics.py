@@ -0,0 +1,210 @@
+"""
+Per-request SQL and latency metrics.
+
+RequestMetricsMiddleware wraps every database call made while a request is
+handled (``connection.execute_wrapper``) and splits the request into:
+
+- db:        time spent executing SQL, and how many statements ran
+- serialize: time in the view outside the database, which for DRF list and
+             retrieve actions is almost entirely serializer work
+- render:    turning the response data into bytes (DRF renderers)
+- total:     the whole request, as seen by the middleware
+
+They are sent back as a ``Server-Timing`` header (visible in the browser's
+network panel) and folded into a rolling per-route window that admins can read
+from ``/api/core/metrics/requests/``. The window is kept in memory, so each
+server process reports its own traffic.
+
+Views can declare a query budget::
+
+    class InvoiceViewSet(viewsets.ModelViewSet):
+        query_budget = {'list': 4, 'retrieve': 4}
+
+or ``query_budget = 6`` for every action. Requests over budget are logged; with
+``QUERY_BUDGET_STRICT = True`` (see core.testing) they raise
+QueryBudgetExceeded so the test that made them fails.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms / queries) of the histogram buckets reported per route.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class _QueryTimer:
+    """execute_wrapper callable that counts statements and accumulates their duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class RouteStats:
+    """Rolling window of the last ``window`` requests for every route."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, route: str, sample: Dict) -> None:
+        with self._lock:
+            self._samples[route].append(sample)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            samples = {route: list(rows) for route, rows in self._samples.items()}
+        return {route: _summarize(rows) for route, rows in sorted(samples.items())}
+
+
+def _percentile(ordered, pct: float):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+def _histogram(values, bounds):
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f'<={b}' for b in bounds] + [f'>{bounds[-1]}']
+    return dict(zip(labels, counts))
+
+
+def _summarize(rows):
+    total_ms = sorted(r['total_ms'] for r in rows)
+    queries = sorted(r['queries'] for r in rows)
+    n = len(rows)
+    return {
+        'requests': n,
+        'over_budget': sum(1 for r in rows if r['over_budget']),
+        'total_ms': {
+            'p50': round(_percentile(total_ms, 0.5), 1),
+            'p95': round(_percentile(total_ms, 0.95), 1),
+            'max': round(total_ms[-1], 1) if n else 0,
+            'histogram': _histogram(total_ms, LATENCY_BUCKETS_MS),
+        },
+        'queries': {
+            'p50': _percentile(queries, 0.5),
+            'p95': _percentile(queries, 0.95),
+            'max': queries[-1] if n else 0,
+            'histogram': _histogram(queries, QUERY_BUCKETS),
+        },
+        'db_ms_avg': round(sum(r['db_ms'] for r in rows) / n, 1) if n else 0,
+        'serialize_ms_avg': round(sum(r['serialize_ms'] for r in rows) / n, 1) if n else 0,
+        'render_ms_avg': round(sum(r['render_ms'] for r in rows) / n, 1) if n else 0,
+        'bytes_avg': int(sum(r['bytes'] for r in rows) / n) if n else 0,
+    }
+
+
+route_stats = RouteStats(window=getattr(settings, 'REQUEST_METRICS_WINDOW', 500))
+
+
+def query_budget_for(request) -> Optional[int]:
+    """The query budget the resolved view declares for this request, if any."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    view = getattr(func, 'cls', None) or getattr(func, 'view_class', None) or func
+    budget = getattr(view, 'query_budget', None)
+    if isinstance(budget, dict):
+        action = (getattr(func, 'actions', None) or {}).get(request.method.lower())
+        return budget.get(action, budget.get('*'))
+    return budget
+
+
+def _route_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return f'{request.method} (unresolved)'
+    return f'{request.method} {match.view_name or match.route}'
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        request._metrics = {'view_start': None, 'view_end': None, 'view_db': 0.0}
+        start = time.perf_counter()
+        request._metrics['timer'] = timer
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        marks = request._metrics
+        view_start = marks['view_start'] or start
+        view_end = marks['view_end'] or end
+        db_in_view = marks['view_db'] if marks['view_end'] else timer.seconds
+        sample = {
+            'queries': timer.count,
+            'db_ms': timer.seconds * 1000,
+            'serialize_ms': max(0.0, (view_end - view_start) - db_in_view) * 1000,
+            'render_ms': max(0.0, end - view_end) * 1000 if marks['view_end'] else 0.0,
+            'total_ms': (end - start) * 1000,
+            'bytes': len(response.content) if not getattr(response, 'streaming', False) else 0,
+        }
+
+        budget = query_budget_for(request)
+        sample['over_budget'] = budget is not None and timer.count > budget
+        route_stats.record(_route_name(request), sample)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample["db_ms"]:.1f};desc="{timer.count} queries"',
+            f'serialize;dur={sample["serialize_ms"]:.1f}',
+            f'render;dur={sample["render_ms"]:.1f}',
+            f'total;dur={sample["total_ms"]:.1f}',
+        ])
+
+        if sample['over_budget']:
+            message = f'{_route_name(request)} ran {timer.count} queries (budget {budget})'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called after the view returns and before DRF/template rendering.
+        metrics = request._metrics
+        metrics['view_end'] = time.perf_counter()
+        metrics['view_db'] = metrics['timer'].seconds
+        return response
+
@@ -0,0 +1,15 @@
+class ListSerializerMixin:
+    """
+    Use ``list_serializer_class`` for the ``list`` action and ``serializer_class``
+    for everything else.
+
+    List pages render many rows, so they get a compact serializer (typically a
+    patient summary instead of the full nested patient); retrieve, create and
+    update keep the full representation.
+    """
+    list_serializer_class = None
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
@@ -0,0 +1,22 @@
+"""
+Migration operations shared across apps.
+
+Production runs on PostgreSQL, but the suite also runs on SQLite, which can't
+build PostgreSQL-only indexes such as trigram indexes on an expression
+(``OpClass(Upper('name'), name='gin_trgm_ops')``). ``PostgresAddIndex`` records
+the index in the migration state everywhere and only creates it on PostgreSQL.
+"""
+from django.db import migrations
+
+
+class PostgresAddIndex(migrations.AddIndex):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f'{super().describe()} (PostgreSQL only)'
@@ -0,0 +1,48 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination shared by every list endpoint.
+
+    Pages are located by seeking past the last row of the previous page on the
+    ordering column, so the cost of fetching a page does not grow with the size
+    of the table. Clients can opt into larger pages for exports with
+    ``?page_size=``, capped per endpoint by ``max_page_size``. The default page
+    size comes from ``REST_FRAMEWORK['PAGE_SIZE']``.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    # Trailing '-id' breaks ties between rows sharing a timestamp.
+    ordering = ('-created_at', '-id')
+
+
+class InvoicePagination(KeysetPagination):
+    max_page_size = 1000
+
+
+class InventoryTransactionPagination(KeysetPagination):
+    max_page_size = 1000
+
+
+class OccurredOnPagination(KeysetPagination):
+    ordering = ('-occurred_on', '-created_at', '-id')
+    max_page_size = 1000
+
+
+class DispensedAtPagination(KeysetPagination):
+    ordering = ('-dispensed_at', '-id')
+
+
+class VisitDatePagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class DateJoinedPagination(KeysetPagination):
+    ordering = ('-date_joined', '-id')
+
+
+class NamePagination(KeysetPagination):
+    # Medicine names are unique, so no tiebreaker is needed.
+    ordering = ('name',)
+    max_page_size = 200
@@ -0,0 +1,21 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that return a ``text/event-stream`` StreamingHttpResponse pass
+    DRF content negotiation (EventSource and fetch-based clients send
+    ``Accept: text/event-stream``). Error responses become a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, bytes):
+            return data
+        return f'event: error\ndata: {json.dumps(data, default=str)}\n\n'.encode(self.charset)
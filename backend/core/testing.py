@@ -0,0 +1,46 @@
+from django.test.utils import override_settings
+
+from .metrics import QueryBudgetExceeded  # noqa: F401  (for assertRaises in tests)
+
+
+def make_patient(username, **fields):
+    """A patient with its own login, for tests that only need somebody to bill or treat."""
+    from patients.models import Patient
+    from users.models import User
+
+    user = User.objects.create_user(username, password='x', role=User.Role.PATIENT)
+    fields.setdefault('name', username.title())
+    fields.setdefault('gender', 'F')
+    return Patient.objects.create(user=user, medical_id=f'PAT-{user.pk:04d}', **fields)
+
+
+class QueryBudgetTestMixin:
+    """
+    Mix into a Django TestCase so any request made through ``self.client`` fails
+    the test when it runs more queries than the view's ``query_budget``.
+
+        class InvoiceApiTests(QueryBudgetTestMixin, APITestCase):
+            def test_list(self):
+                self.client.get('/api/invoices/')  # raises QueryBudgetExceeded if over budget
+    """
+
+    def setUp(self):
+        super().setUp()
+        strict = override_settings(QUERY_BUDGET_STRICT=True)
+        strict.enable()
+        self.addCleanup(strict.disable)
+
+    def assertWithinQueryBudget(self, response, budget):
+        """Check an explicit budget against the query count reported in Server-Timing."""
+        header = response.get('Server-Timing', '')
+        queries = int(header.split('desc="', 1)[1].split(' ', 1)[0]) if 'desc="' in header else 0
+        self.assertLessEqual(queries, budget, f'{queries} queries, budget {budget}')
+
+    def assertListAndRetrieve(self, url, count=3):
+        """List ``url`` expecting ``count`` rows, then retrieve the first; returns the detail response."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), count)
+        response = self.client.get(f"{url}{response.data['results'][0]['id']}/")
+        self.assertEqual(response.status_code, 200)
+        return response
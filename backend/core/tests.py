@@ -1,3 +1,178 @@
-from django.test import TestCase
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from Finance.models import ExpenseEntry
+from pharmacy.models import InventoryTransaction, Medicine
+from users.models import User
+
+from . import dashboard, tts
+
+
+def upstream(*chunks, status_code=200, broken=False):
+    """A stand-in for the streamed ElevenLabs response."""
+    def iter_content(chunk_size):
+        yield from chunks
+        if broken:
+            raise requests.ConnectionError('reset')
+
+    resp = mock.Mock(status_code=status_code)
+    resp.iter_content.side_effect = iter_content
+    return resp
+
+
+class TTSCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings = override_settings(TTS_CACHE_DIR=self.cache_dir, TTS_READ_TIMEOUT=30)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def store(self, key, data, age=0):
+        path = self.cache_dir / f'{key}.mp3'
+        path.write_bytes(data)
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+
+class TTSCacheTests(TTSCacheTestCase):
+    def test_key_covers_every_input(self):
+        key = tts.cache_key('Hello', 'voice', 'model', {'stability': 0.5})
+        self.assertEqual(key, tts.cache_key('Hello', 'voice', 'model', {'stability': 0.5}))
+        self.assertNotEqual(key, tts.cache_key('Hello!', 'voice', 'model', {'stability': 0.5}))
+        self.assertNotEqual(key, tts.cache_key('Hello', 'other', 'model', {'stability': 0.5}))
+        self.assertNotEqual(key, tts.cache_key('Hello', 'voice', 'model', {'stability': 0.6}))
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(tts.open_cached('clip'))
+        self.assertEqual(b''.join(tts.stream_and_cache(upstream(b'ab', b'cd'), 'clip')), b'abcd')
+        with tts.open_cached('clip') as clip:
+            self.assertEqual(clip.read(), b'abcd')
+
+    def test_hit_marks_the_clip_recently_used(self):
+        path = self.store('clip', b'x', age=3600)
+        tts.open_cached('clip').close()
+        self.assertGreater(path.stat().st_mtime, time.time() - 60)
+
+    def test_broken_stream_is_not_cached(self):
+        with self.assertLogs('core.tts', 'ERROR'):
+            self.assertEqual(b''.join(tts.stream_and_cache(upstream(b'ab', broken=True), 'clip')), b'ab')
+        self.assertIsNone(tts.open_cached('clip'))
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+    def test_client_disconnect_is_not_cached(self):
+        stream = tts.stream_and_cache(upstream(b'ab', b'cd'), 'clip')
+        next(stream)
+        stream.close()
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+    def test_evicts_least_recently_used_first(self):
+        self.store('old', b'x' * 10, age=300)
+        self.store('middle', b'x' * 10, age=200)
+        self.store('new', b'x' * 10, age=100)
+        with override_settings(TTS_CACHE_MAX_BYTES=20):
+            self.assertEqual(tts.evict(), 1)
+        self.assertEqual(sorted(p.stem for p in self.cache_dir.iterdir()), ['middle', 'new'])
+
+    def test_sweeps_abandoned_partial_downloads(self):
+        abandoned = self.cache_dir / 'old.1.1.part'
+        abandoned.write_bytes(b'x')
+        os.utime(abandoned, (time.time() - 120, time.time() - 120))
+        live = self.cache_dir / 'new.1.2.part'
+        live.write_bytes(b'x')
+        tts.evict()
+        self.assertFalse(abandoned.exists())
+        self.assertTrue(live.exists())
+
+
+@mock.patch.dict(os.environ, {'ELEVENLABS_API_KEY': 'test-key'})
+class TTSAudioViewTests(TTSCacheTestCase, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR))
+
+    def speak(self):
+        response = self.client.post('/api/core/tts/', {'text': 'Take with food'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response['X-TTS-Cache'], b''.join(response.streaming_content)
+
+    def test_second_request_is_served_from_the_cache(self):
+        with mock.patch.object(tts, 'synthesize', return_value=upstream(b'mp3', b'data')) as synthesize:
+            self.assertEqual(self.speak(), ('MISS', b'mp3data'))
+            self.assertEqual(self.speak(), ('HIT', b'mp3data'))
+        synthesize.assert_called_once()
+
+    def test_upstream_error_is_not_cached(self):
+        failed = upstream(status_code=401)
+        failed.json.return_value = {'detail': 'invalid key'}
+        with mock.patch.object(tts, 'synthesize', return_value=failed), self.assertLogs('django.request', 'ERROR'):
+            response = self.client.post('/api/core/tts/', {'text': 'Take with food'}, format='json')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.data, {'detail': 'invalid key'})
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+
+class DashboardCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = User.objects.create_user('admin', password='x', role=User.Role.ADMIN)
+        self.client.force_authenticate(self.admin)
+        self.medicine = Medicine.objects.create(
+            name='Cough syrup', category='SYRUP', buying_price=Decimal('10.00'), selling_price=Decimal('15.00'),
+        )
+
+    def fetch(self, name='pharmacy', query=''):
+        response = self.client.get(f'/api/dashboard/{name}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Dashboard-Cache'], response.data
+
+    def test_hit_until_a_model_it_reads_changes(self):
+        self.assertEqual(self.fetch()[0], 'MISS')
+        self.assertEqual(self.fetch()[0], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.create(name='Eye drops', category='DROPS', buying_price=Decimal('5.00'), selling_price=Decimal('8.00'))
+        state, data = self.fetch()
+        self.assertEqual((state, data['stats']['total_medicines']), ('MISS', 2))
+
+    def test_writes_to_other_models_keep_the_cache(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            ExpenseEntry.objects.create(amount=Decimal('40.00'), vendor='Supplier', recorded_by=self.admin)
+        self.assertEqual(self.fetch()[0], 'HIT')
+        self.assertEqual(self.fetch('finance')[0], 'MISS')
+
+    def test_bulk_writes_invalidate(self):
+        self.fetch()
+        self.fetch('finance')
+        with self.captureOnCommitCallbacks(execute=True):
+            InventoryTransaction.bulk_apply([
+                InventoryTransaction(medicine=self.medicine, transaction_type='STOCK_IN', quantity=5),
+            ])
+        self.assertEqual(self.fetch()[0], 'MISS')
+        self.assertEqual(self.fetch('finance')[0], 'MISS')
+        self.assertEqual(self.fetch('admin')[0], 'MISS')
+
+    def test_rolled_back_write_keeps_the_cache(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            dashboard.invalidate_for(Medicine)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.fetch()[0], 'HIT')
+
+    def test_cached_per_date_range(self):
+        self.fetch()
+        self.assertEqual(self.fetch(query='?start_date=2026-01-01&end_date=2026-01-31')[0], 'MISS')
+        self.assertEqual(self.fetch(query='?start_date=2026-01-01&end_date=2026-01-31')[0], 'HIT')
@@ -0,0 +1,163 @@
+"""
+ElevenLabs text-to-speech with a disk cache.
+
+Voice insights re-narrate the same text often, so finished audio is kept on
+disk under a SHA-256 of (text, voice_id, model_id, voice_settings). Hits are
+served straight from the file; misses are streamed to the client as ElevenLabs
+produces them and written to the cache only once the whole clip has arrived.
+The cache directory is capped at TTS_CACHE_MAX_BYTES, evicting the least
+recently played clips first (file mtime is bumped on every hit). A hit is
+opened before it is touched, so eviction racing a hit can only unlink a file
+the hit is already reading. Partial downloads left behind by a killed worker
+are swept on the next eviction.
+
+Upstream calls share one pooled requests.Session per process. ELEVENLABS_BASE_URL
+can point at a local stand-in server for tests.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """Process-wide HTTP session so repeat calls reuse TLS connections to ElevenLabs."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(getattr(settings, 'TTS_HTTP_POOL_SIZE', 10))
+            s = requests.Session()
+            s.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            s.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            _session = s
+        return _session
+
+
+def cache_key(text: str, voice_id: str, model_id: str, voice_settings) -> str:
+    payload = json.dumps(
+        {'text': text, 'voice_id': voice_id, 'model_id': model_id, 'voice_settings': voice_settings},
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_dir() -> Path:
+    path = Path(getattr(settings, 'TTS_CACHE_DIR', Path(settings.BASE_DIR) / 'tts_cache'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _read_timeout() -> float:
+    return float(getattr(settings, 'TTS_READ_TIMEOUT', 30))
+
+
+def open_cached(key: str) -> Optional[BinaryIO]:
+    """The cached clip for ``key`` opened for reading and marked recently used, or None on a miss."""
+    path = _cache_dir() / f'{key}.mp3'
+    try:
+        clip = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(clip.fileno())
+    except OSError:
+        # Already evicted; the open handle still reads the whole clip
+        pass
+    return clip
+
+
+def synthesize(text: str, voice_id: str, model_id: str, voice_settings, api_key: str) -> requests.Response:
+    """Start the upstream request; the body is left unread so it can be streamed."""
+    base_url = getattr(settings, 'ELEVENLABS_BASE_URL', 'https://api.elevenlabs.io').rstrip('/')
+    return session().post(
+        f'{base_url}/v1/text-to-speech/{voice_id}',
+        json={'text': text, 'model_id': model_id, 'voice_settings': voice_settings},
+        headers={'xi-api-key': api_key, 'Content-Type': 'application/json', 'Accept': 'audio/mpeg'},
+        timeout=(5, _read_timeout()),
+        stream=True,
+    )
+
+
+def stream_and_cache(resp: requests.Response, key: str) -> Iterator[bytes]:
+    """Yield the upstream audio as it arrives, keeping a copy that becomes the cache entry when complete."""
+    directory = _cache_dir()
+    partial = directory / f'{key}.{os.getpid()}.{threading.get_ident()}.part'
+    complete = False
+    try:
+        with open(partial, 'wb') as out:
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    out.write(chunk)
+                    yield chunk
+        complete = True
+    except requests.RequestException:
+        logger.exception('TTS stream for %s broke off', key)
+    finally:
+        resp.close()
+        try:
+            if complete:
+                os.replace(partial, directory / f'{key}.mp3')
+                evict()
+        finally:
+            # Client went away, upstream failed or the rename did; never cache a truncated clip.
+            partial.unlink(missing_ok=True)
+
+
+def evict() -> int:
+    """Delete least recently used clips until the cache fits TTS_CACHE_MAX_BYTES. Returns files removed.
+
+    Also removes ``.part`` files nobody has written to for two read timeouts
+    (a live download writes at least once per read timeout).
+    """
+    limit = int(getattr(settings, 'TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    abandoned = time.time() - 2 * _read_timeout()
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(_cache_dir()):
+            if entry.name.endswith('.part'):
+                try:
+                    if entry.stat().st_mtime < abandoned:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not entry.name.endswith('.mp3'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= limit:
+            return 0
+
+        removed = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
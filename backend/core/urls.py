@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import TTSAudioView
+from .views import TTSAudioView, RequestMetricsView, DatabaseDiagnosticsView
 
 urlpatterns = [
     path('tts/', TTSAudioView.as_view(), name='tts'),
+    path('metrics/requests/', RequestMetricsView.as_view(), name='request-metrics'),
+    path('diagnostics/db/', DatabaseDiagnosticsView.as_view(), name='db-diagnostics'),
 ]
\ No newline at end of file
@@ -1,9 +1,12 @@
 import os
 import requests
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from users.permissions import IsAdmin
+from .metrics import route_stats
+from . import dashboard, dbstats, tts
 
 
 class TTSAudioView(APIView):
@@ -13,7 +16,8 @@ class TTSAudioView(APIView):
         """Generate TTS audio via ElevenLabs.
 
         Expects JSON body: { text: string, voice_id?: string, model_id?: string, voice_settings?: { stability?: float, similarity_boost?: float } }
-        Returns: raw audio bytes with content-type 'audio/mpeg' on success, otherwise JSON error.
+        Returns: audio/mpeg streamed in chunks on success (X-TTS-Cache: HIT|MISS), otherwise JSON error.
+        Repeat requests for the same text and voice are served from the disk cache in core.tts.
         """
         api_key = os.getenv('ELEVENLABS_API_KEY')
         default_voice = os.getenv('ELEVENLABS_VOICE_ID', 'EXAVITQu4vr4xnSDxMaL')
@@ -29,19 +33,15 @@ class TTSAudioView(APIView):
         model_id = data.get('model_id') or 'eleven_multilingual_v2'
         voice_settings = data.get('voice_settings') or { 'stability': 0.5, 'similarity_boost': 0.5 }
 
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        payload = {
-            'text': text,
-            'model_id': model_id,
-            'voice_settings': voice_settings,
-        }
-        headers = {
-            'xi-api-key': api_key,
-            'Content-Type': 'application/json'
-        }
+        key = tts.cache_key(text, voice_id, model_id, voice_settings)
+        clip = tts.open_cached(key)
+        if clip is not None:
+            response = FileResponse(clip, content_type='audio/mpeg')
+            response['X-TTS-Cache'] = 'HIT'
+            return response
 
         try:
-            resp = requests.post(url, json=payload, headers=headers, timeout=30)
+            resp = tts.synthesize(text, voice_id, model_id, voice_settings, api_key)
         except requests.RequestException as e:
             return Response({'detail': f'Network error calling ElevenLabs: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
 
@@ -51,7 +51,77 @@ class TTSAudioView(APIView):
                 err = resp.json()
             except Exception:
                 err = {'detail': 'Non-200 from ElevenLabs', 'status_code': resp.status_code}
+            finally:
+                resp.close()
             return Response(err, status=status.HTTP_502_BAD_GATEWAY)
 
-        # Return audio bytes
-        return HttpResponse(resp.content, content_type='audio/mpeg')
+        # Stream audio to the client as it arrives
+        response = StreamingHttpResponse(tts.stream_and_cache(resp, key), content_type='audio/mpeg')
+        response['X-TTS-Cache'] = 'MISS'
+        return response
+
+
+class RequestMetricsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        """Rolling per-route request metrics for this server process (see core.metrics).
+
+        Returns: { window, routes: { "<METHOD> <view name>": { requests, over_budget, total_ms, queries, ... } } }
+        Pass ?reset=1 to clear the window after reading it.
+        """
+        data = {'window': route_stats.window, 'routes': route_stats.snapshot()}
+        if request.query_params.get('reset') in ('1', 'true'):
+            route_stats.reset()
+        return Response(data)
+
+
+class DatabaseDiagnosticsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        """Connection pooling settings and per-worker reuse/pool counters (see core.dbstats).
+
+        Returns: { pid, pool_mode, uptime_s, requests, ping_ms, databases: { alias: { ..., pool } } }
+        """
+        data = dbstats.snapshot()
+        try:
+            data['ping_ms'] = dbstats.ping()
+        except Exception as exc:
+            data['ping_ms'] = None
+            data['ping_error'] = str(exc)
+        return Response(data)
+
+
+class DashboardView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    # finance: 5 aggregate / list queries, up to 8 for the financial position + the user
+    query_budget = 14
+    # Who may read each dashboard (None = any signed-in user, like the list endpoints it replaces)
+    allowed_roles = {
+        'pharmacy': None,
+        'finance': None,
+        'admin': {'ADMIN'},
+    }
+
+    def get(self, request, name):
+        """Everything one dashboard displays, from a few grouped queries (see core.dashboard).
+
+        Dashboards: pharmacy, finance, admin. Optional ?start_date / ?end_date (YYYY-MM-DD),
+        default start of month to today. Cached briefly per dashboard and range (X-Dashboard-Cache: HIT|MISS).
+        """
+        if name not in dashboard.BUILDERS:
+            return Response({'detail': f'Unknown dashboard "{name}".'}, status=status.HTTP_404_NOT_FOUND)
+        roles = self.allowed_roles.get(name)
+        if roles is not None and getattr(request.user, 'role', None) not in roles:
+            return Response({'detail': 'You do not have permission to view this dashboard.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            start, end = dashboard.resolve_period(request.query_params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data, cached = dashboard.get_dashboard(name, start, end)
+        return Response(data, headers={
+            'X-Dashboard-Cache': 'HIT' if cached else 'MISS',
+            'Cache-Control': 'private, no-cache',
+        })
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import LabReport, Prescription, TreatmentNote
-from patients.serializers import PatientSerializer
+from patients.serializers import PatientSerializer, PatientSummarySerializer
 from patients.models import Patient
 
 
@@ -22,6 +22,10 @@ class LabReportSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class LabReportListSerializer(LabReportSerializer):
+    patient_detail = PatientSummarySerializer(source='patient', read_only=True)
+
+
 class PrescriptionSerializer(serializers.ModelSerializer):
     patient_detail = PatientSerializer(source='patient.patient_profile', read_only=True)
     patient_username = serializers.CharField(write_only=True, required=False, allow_blank=True)
@@ -87,6 +91,11 @@ class PrescriptionSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+
+class PrescriptionListSerializer(PrescriptionSerializer):
+    patient_detail = PatientSummarySerializer(source='patient.patient_profile', read_only=True)
+
+
 class TreatmentNoteSerializer(serializers.ModelSerializer):
     patient_detail = PatientSerializer(source='patient', read_only=True)
     
@@ -103,3 +112,7 @@ class TreatmentNoteSerializer(serializers.ModelSerializer):
         if request and request.user and request.user.is_authenticated:
             validated_data['doctor'] = request.user
         return super().create(validated_data)
+
+
+class TreatmentNoteListSerializer(TreatmentNoteSerializer):
+    patient_detail = PatientSummarySerializer(source='patient', read_only=True)
@@ -1,3 +1,31 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from core.testing import QueryBudgetTestMixin, make_patient
+from patients.models import Visit
+from users.models import User
+
+from .models import LabReport, TreatmentNote
+
+
+class EmrApiQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """List and retrieve stay within the views' query_budget however many rows they return."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+        lab_tech = User.objects.create_user('labtech', password='x', role=User.Role.LAB_TECH)
+        for i in range(3):
+            patient = make_patient(f'patient{i}', gender='M')
+            visit = Visit.objects.create(patient=patient, doctor=cls.doctor, date=patient.user.date_joined)
+            LabReport.objects.create(patient=patient, lab_tech=lab_tech, report_type='Blood Test', results='Normal')
+            TreatmentNote.objects.create(patient=patient, doctor=cls.doctor, visit=visit, diagnosis='Flu', treatment_plan='Rest')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.doctor)
+
+    def test_lab_reports(self):
+        self.assertListAndRetrieve('/api/lab-reports/')
+
+    def test_treatment_notes(self):
+        self.assertListAndRetrieve('/api/treatment-notes/')
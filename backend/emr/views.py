@@ -4,24 +4,36 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from .models import LabReport, Prescription, TreatmentNote
-from .serializers import LabReportSerializer, PrescriptionSerializer, TreatmentNoteSerializer
+from .serializers import (
+    LabReportSerializer, LabReportListSerializer,
+    PrescriptionSerializer, PrescriptionListSerializer,
+    TreatmentNoteSerializer, TreatmentNoteListSerializer,
+)
+from core.mixins import ListSerializerMixin
+from patients.search import PatientSearchFilter
 from .permissions import IsLabTechOrReadOnly, IsDoctorOrReadOnly, IsPharmacistOrReadOnly
 
-class LabReportViewSet(viewsets.ModelViewSet):
-    queryset = LabReport.objects.select_related('patient', 'lab_tech').order_by('-created_at')
+class LabReportViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+    queryset = LabReport.objects.select_related('patient__user', 'lab_tech').order_by('-created_at')
     serializer_class = LabReportSerializer
+    list_serializer_class = LabReportListSerializer
+    query_budget = {'list': 4, 'retrieve': 4}
     permission_classes = [IsAuthenticated & IsLabTechOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['patient__name', 'patient__medical_id', 'report_type']
+    filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+    search_fields = ['report_type']
     ordering_fields = ['created_at', 'status']
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
-    queryset = Prescription.objects.select_related('patient', 'doctor', 'pharmacist').order_by('-created_at')
+class PrescriptionViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+    queryset = Prescription.objects.select_related('patient__patient_profile', 'doctor', 'pharmacist').order_by('-created_at')
     serializer_class = PrescriptionSerializer
+    list_serializer_class = PrescriptionListSerializer
+    query_budget = {'list': 4, 'retrieve': 4}
     # Allow authenticated, enforce role logic per action below
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['patient__name', 'patient__medical_id', 'medication']
+    filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+    # patient is the User; the searchable record is their Patient profile
+    patient_lookup = 'patient__patient_profile'
+    search_fields = ['medication']
     ordering_fields = ['created_at', 'status']
 
     def create(self, request, *args, **kwargs):
@@ -47,10 +59,12 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             return super().partial_update(request, *args, **kwargs)
         raise PermissionDenied('You do not have permission to perform this action')
 
-class TreatmentNoteViewSet(viewsets.ModelViewSet):
-    queryset = TreatmentNote.objects.select_related('patient', 'doctor', 'visit').order_by('-created_at')
+class TreatmentNoteViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+    queryset = TreatmentNote.objects.select_related('patient__user', 'doctor', 'visit').order_by('-created_at')
     serializer_class = TreatmentNoteSerializer
+    list_serializer_class = TreatmentNoteListSerializer
+    query_budget = {'list': 4, 'retrieve': 4}
     permission_classes = [IsAuthenticated & IsDoctorOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['patient__name', 'patient__medical_id', 'diagnosis']
+    filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+    search_fields = ['diagnosis']
     ordering_fields = ['created_at']
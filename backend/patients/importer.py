@@ -0,0 +1,249 @@
+"""
+Bulk patient registration from CSV.
+
+Rows are read as a stream and handled PATIENT_IMPORT_CHUNK_SIZE at a time:
+each chunk is validated with a couple of set-based queries, its passwords are
+hashed in a process pool (PBKDF2 is deliberately slow, ~tens of ms per hash),
+medical IDs are reserved from the database sequence in one round trip, and
+users and patients are written with bulk_create inside one transaction per
+chunk. A bad row never stops the import; it is reported with its line number
+and the reason, and the rest of its chunk is still saved (if a chunk's write
+hits a conflict, e.g. a username registered meanwhile, its rows are retried
+one at a time). The process pool forks, so it is only used by the
+import_patients command; the API view hashes inline (workers=1).
+
+Columns: username, name, gender (required); dob (YYYY-MM-DD), contact,
+address, password (optional). Without a password the account gets
+PATIENT_IMPORT_DEFAULT_PASSWORD and must change it on first login.
+"""
+import csv
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date
+
+from core import dashboard
+
+from .models import Patient, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+REQUIRED_COLUMNS = ('username', 'name', 'gender')
+OPTIONAL_COLUMNS = ('dob', 'contact', 'address', 'password')
+
+GENDERS = {
+    'M': 'M', 'MALE': 'M',
+    'F': 'F', 'FEMALE': 'F',
+    'O': 'O', 'OTHER': 'O',
+}
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (e.g. missing columns)."""
+
+
+def _clean_row(raw):
+    """Validated field values for one CSV row, or raise ValidationError with a {field: message} dict."""
+    errors = {}
+    cleaned = {}
+
+    for column in ('username', 'name', 'contact', 'address'):
+        value = (raw.get(column) or '').strip()
+        model = User if column == 'username' else Patient
+        field = model._meta.get_field(column)
+        if not value and not field.blank:
+            errors[column] = 'This field is required.'
+            continue
+        try:
+            cleaned[column] = field.clean(value, None) if value else ''
+        except ValidationError as exc:
+            errors[column] = ' '.join(exc.messages)
+
+    gender = GENDERS.get((raw.get('gender') or '').strip().upper())
+    if gender:
+        cleaned['gender'] = gender
+    else:
+        errors['gender'] = 'Expected M, F or O.'
+
+    dob = (raw.get('dob') or '').strip()
+    cleaned['dob'] = None
+    if dob:
+        try:
+            cleaned['dob'] = parse_date(dob)
+        except ValueError:
+            pass
+        if cleaned['dob'] is None:
+            errors['dob'] = 'Expected YYYY-MM-DD.'
+
+    cleaned['password'] = (raw.get('password') or '').strip()
+
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def _hash_executor(workers):
+    """Process pool for make_password, or None to hash inline."""
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    # Forked workers inherit the configured Django settings (PASSWORD_HASHERS);
+    # they never touch the database.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+
+def _hash_passwords(passwords, executor, workers):
+    if executor is None or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+class PatientImport:
+    """
+    One import run. Feed it rows with ``run(reader)``; ``report`` holds the totals
+    and the per-row errors.
+    """
+
+    def __init__(self, chunk_size=None, workers=None, dry_run=False, default_password=None, on_chunk=None):
+        self.chunk_size = chunk_size or getattr(settings, 'PATIENT_IMPORT_CHUNK_SIZE', 1000)
+        self.workers = getattr(settings, 'PATIENT_IMPORT_HASH_WORKERS', 1) if workers is None else workers
+        self.dry_run = dry_run
+        self.default_password = default_password or getattr(settings, 'PATIENT_IMPORT_DEFAULT_PASSWORD', 'default123')
+        self.on_chunk = on_chunk
+        self.seen_usernames = set()
+        self.report = {
+            'dry_run': dry_run,
+            'rows': 0,
+            'created': 0,
+            'failed': 0,
+            'first_medical_id': None,
+            'last_medical_id': None,
+            'errors': [],
+        }
+
+    def _fail(self, line, username, errors):
+        self.report['failed'] += 1
+        self.report['errors'].append({'row': line, 'username': username, 'errors': errors})
+
+    def run(self, reader):
+        """Import every row of a csv.DictReader. Returns the report."""
+        columns = {c.strip().lower() for c in (reader.fieldnames or [])}
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            raise ImportFileError(f"Missing required column(s): {', '.join(missing)}")
+
+        # Line 1 is the header
+        rows = (
+            (line, {(k or '').strip().lower(): v for k, v in raw.items()})
+            for line, raw in enumerate(reader, start=2)
+        )
+        executor = None if self.dry_run else _hash_executor(self.workers)
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(chunk, executor)
+                if self.on_chunk:
+                    self.on_chunk(self.report)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.report['errors'].sort(key=lambda error: error['row'])
+        return self.report
+
+    def _import_chunk(self, chunk, executor):
+        self.report['rows'] += len(chunk)
+
+        valid = []
+        for line, raw in chunk:
+            username = (raw.get('username') or '').strip()
+            try:
+                cleaned = _clean_row(raw)
+            except ValidationError as exc:
+                self._fail(line, username, {k: ' '.join(v) for k, v in exc.message_dict.items()})
+                continue
+            if cleaned['username'] in self.seen_usernames:
+                self._fail(line, username, {'username': 'Duplicate username earlier in the file.'})
+                continue
+            self.seen_usernames.add(cleaned['username'])
+            valid.append((line, cleaned))
+
+        taken = set(
+            User.objects.filter(username__in=[c['username'] for _, c in valid]).values_list('username', flat=True)
+        )
+        if taken:
+            for line, cleaned in valid:
+                if cleaned['username'] in taken:
+                    self._fail(line, cleaned['username'], {'username': 'A user with that username already exists.'})
+            valid = [(line, c) for line, c in valid if c['username'] not in taken]
+
+        if not valid:
+            return
+        if self.dry_run:
+            self.report['created'] += len(valid)
+            return
+
+        hashes = _hash_passwords([c['password'] or self.default_password for _, c in valid], executor, self.workers)
+        try:
+            medical_ids = self._save(valid, hashes)
+        except IntegrityError as exc:
+            # Most likely a username registered concurrently since the check above.
+            # Retry row by row so only the offending rows fail.
+            logger.warning('Patient import chunk starting at row %s failed, retrying row by row: %s', valid[0][0], exc)
+            medical_ids = []
+            for row, hashed in zip(valid, hashes):
+                try:
+                    medical_ids += self._save([row], [hashed])
+                except IntegrityError as row_exc:
+                    self._fail(row[0], row[1]['username'], {'non_field_errors': f'Not saved: {row_exc}'})
+            if not medical_ids:
+                return
+
+        dashboard.invalidate_for(User, Patient)
+        self.report['created'] += len(medical_ids)
+        if self.report['first_medical_id'] is None:
+            self.report['first_medical_id'] = medical_ids[0]
+        self.report['last_medical_id'] = medical_ids[-1]
+
+    def _save(self, valid, hashes):
+        """Write users and patients for ``valid`` rows in one transaction. Returns their medical IDs."""
+        with transaction.atomic():
+            medical_ids = Patient.allocate_medical_ids(len(valid))
+            users = User.objects.bulk_create([
+                User(
+                    username=c['username'],
+                    password=hashed,
+                    role=User.Role.PATIENT,
+                    password_change_required=not c['password'],
+                )
+                for (_, c), hashed in zip(valid, hashes)
+            ])
+            Patient.objects.bulk_create([
+                Patient(
+                    user=user,
+                    name=c['name'],
+                    medical_id=medical_id,
+                    gender=c['gender'],
+                    dob=c['dob'],
+                    contact=c['contact'],
+                    contact_digits=normalize_phone(c['contact']),
+                    address=c['address'],
+                )
+                for (_, c), user, medical_id in zip(valid, users, medical_ids)
+            ])
+        return medical_ids
+
+
+def import_patients(stream, **options):
+    """Import patients from a text stream of CSV. See PatientImport for options."""
+    return PatientImport(**options).run(csv.DictReader(stream))
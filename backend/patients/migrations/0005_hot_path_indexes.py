@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_alter_prescription_prescription_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['status', '-created_at'], name='presc_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['-created_at', '-id'], name='presc_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['-created_at'], name='presc_pending_created_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:00
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def fill_contact_digits(apps, schema_editor):
+    from patients.models import normalize_phone
+
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.exclude(contact='').only('id', 'contact').iterator(chunk_size=2000):
+        patient.contact_digits = normalize_phone(patient.contact)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['contact_digits'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['contact_digits'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='contact_digits',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='patient_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['medical_id'], name='patient_medid_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['contact_digits'], name='patient_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_contact_digits, migrations.RunPython.noop),
+    ]
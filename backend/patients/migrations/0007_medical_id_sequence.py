@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:00
+
+from django.db import migrations
+
+SEQUENCE = 'patients_medical_id_seq'
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} START 1')
+        # Continue after every number already handed out, whether it came from the
+        # PAT-xxxx suffix or (for the old id-derived scheme) the row id.
+        cursor.execute(
+            """
+            SELECT GREATEST(
+                COALESCE(MAX(id), 0),
+                COALESCE(MAX(CAST(SUBSTRING(medical_id FROM 5) AS bigint))
+                         FILTER (WHERE medical_id ~ '^PAT-[0-9]+$'), 0)
+            ) FROM patients_patient
+            """
+        )
+        highest = cursor.fetchone()[0]
+        cursor.execute('SELECT setval(%s, %s, false)', [SEQUENCE, highest + 1])
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_patient_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:00
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_medical_id_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['contact_digits'], name='patient_phone_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
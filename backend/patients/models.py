@@ -1,5 +1,25 @@
-from django.db import models
+import re
+
+from django.db import connection, models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
+
+# PostgreSQL sequence behind Patient.allocate_medical_ids (created in migration 0007)
+MEDICAL_ID_SEQUENCE = 'patients_medical_id_seq'
+
+
+def normalize_phone(raw):
+    """
+    Reduce a phone number to the digits of its national form, so "+254 712 345 678",
+    "254712345678" and "0712-345-678" all become "0712345678".
+    """
+    digits = re.sub(r'\D', '', raw or '')
+    if digits.startswith('254') and len(digits) == 12:
+        digits = '0' + digits[3:]
+    elif len(digits) == 9 and digits[0] in '17':
+        digits = '0' + digits
+    return digits
 
 
 class Patient(models.Model):
@@ -19,10 +39,63 @@ class Patient(models.Model):
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     dob = models.DateField(null=True, blank=True)
     contact = models.CharField(max_length=20, blank=True)
+    # normalize_phone(contact), kept in sync by save(); what phone search matches on
+    contact_digits = models.CharField(max_length=20, blank=True, editable=False)
     address = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # patients.search: fuzzy name matches (the % operator)
+            GinIndex(fields=['name'], name='patient_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            # iexact / istartswith / icontains, which compile to UPPER(name) LIKE UPPER(...)
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='patient_name_upper_idx'),
+            # prefix matches ("PAT-01", "0712") with LIKE 'x%'
+            models.Index(fields=['medical_id'], name='patient_medid_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['contact_digits'], name='patient_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # digits anywhere in the number ("5678") with LIKE '%x%'
+            GinIndex(fields=['contact_digits'], name='patient_phone_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    @classmethod
+    def allocate_medical_ids(cls, count=1):
+        """
+        Reserve ``count`` new PAT-xxxx IDs.
+
+        On PostgreSQL they come from MEDICAL_ID_SEQUENCE, so concurrent
+        registrations and imports never hand out the same number. Elsewhere
+        (sqlite in development) the next number follows the highest existing ID.
+        """
+        if count <= 0:
+            return []
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s) FROM generate_series(1, %s)',
+                    [MEDICAL_ID_SEQUENCE, count],
+                )
+                numbers = [row[0] for row in cursor.fetchall()]
+        else:
+            start = cls.highest_medical_number() + 1
+            numbers = range(start, start + count)
+        return [f"PAT-{n:04d}" for n in numbers]
+
+    @classmethod
+    def highest_medical_number(cls):
+        """Largest number used so far, by PAT-xxxx suffix or by id (older IDs were derived from it)."""
+        highest = cls.objects.aggregate(models.Max('id'))['id__max'] or 0
+        for medical_id in cls.objects.filter(medical_id__regex=r'^PAT-[0-9]+$').values_list('medical_id', flat=True):
+            highest = max(highest, int(medical_id[4:]))
+        return highest
+
+    def save(self, *args, **kwargs):
+        self.contact_digits = normalize_phone(self.contact)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'contact' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'contact_digits'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} ({self.medical_id})"
 
@@ -81,6 +154,14 @@ class Prescription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='presc_status_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='presc_created_id_idx'),
+            # the pharmacy dispense queue
+            models.Index(fields=['-created_at'], name='presc_pending_created_idx', condition=models.Q(status='PENDING')),
+        ]
+
     def __str__(self):
         return f"{self.patient.name} - {self.medication} ({self.status})"
 
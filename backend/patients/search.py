@@ -0,0 +1,139 @@
+"""
+Patient lookup by name, medical ID, username or phone number.
+
+Every branch is answerable from an index (see Patient.Meta.indexes), so
+PostgreSQL can combine them with a BitmapOr. Case-insensitive name lookups
+compile to UPPER(name) LIKE UPPER(...) and use the index on UPPER(name); the
+username is looked up separately and matched by patient pk.
+
+- exact:     medical_id, username, normalized phone, name (case-insensitive)
+- prefix:    medical_id ("PAT-01"), phone digits ("0712"), name or any word in it
+- substring: phone digits anywhere in the number ("5678")
+- fuzzy:     trigram similarity on name (PostgreSQL only), for typos
+
+Matches are ranked in that order, then by similarity and name.
+
+PatientSearchFilter plugs this into the ``?search=`` parameter of any viewset
+whose rows belong to a patient, replacing DRF's SearchFilter (which ORs
+unindexed icontains joins across patient columns).
+"""
+import operator
+import re
+from functools import reduce
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Patient, normalize_phone
+
+# Rank of each kind of match; higher sorts first.
+EXACT_ID = 100
+EXACT_PHONE = 90
+EXACT_NAME = 80
+PREFIX_ID = 60
+PREFIX_PHONE = 50
+PREFIX_NAME = 40
+PREFIX_WORD = 30
+CONTAINS_PHONE = 20
+FUZZY = 10
+
+# Phone digits needed before a query is treated as a (partial) phone number
+MIN_PHONE_DIGITS = 3
+PHONE_CHARS = re.compile(r'[\d\s+()-]+')
+MAX_RESULTS = 50
+
+
+def _uses_trigrams():
+    return connection.vendor == 'postgresql'
+
+
+def _conditions(q):
+    """(rank, Q) pairs for every way ``q`` can match a patient."""
+    upper = q.upper()
+    digits = normalize_phone(q)
+    looks_like_phone = len(digits) >= MIN_PHONE_DIGITS and PHONE_CHARS.fullmatch(q) is not None
+
+    # Resolved up front: ORing a join to users_user into the filter below would
+    # stop PostgreSQL combining the per-column indexes and force a sequential scan.
+    exact_id = Q(medical_id=upper)
+    by_username = list(Patient.objects.filter(user__username=q).values_list('pk', flat=True))
+    if by_username:
+        exact_id |= Q(pk__in=by_username)
+
+    conditions = [
+        (EXACT_ID, exact_id),
+        (EXACT_NAME, Q(name__iexact=q)),
+        (PREFIX_NAME, Q(name__istartswith=q)),
+        (PREFIX_WORD, Q(name__icontains=f' {q}')),
+    ]
+    if q.isdigit():
+        # "123" finds PAT-0123
+        conditions.insert(0, (EXACT_ID, Q(medical_id=f'PAT-{int(q):04d}')))
+    if upper.startswith('PAT-'):
+        # Only an explicit "PAT-..." is a prefix search; "pat" alone would match every ID
+        conditions.append((PREFIX_ID, Q(medical_id__startswith=upper)))
+    if looks_like_phone:
+        conditions.append((EXACT_PHONE, Q(contact_digits=digits)))
+        conditions.append((PREFIX_PHONE, Q(contact_digits__startswith=digits)))
+        conditions.append((CONTAINS_PHONE, Q(contact_digits__contains=digits)))
+    if _uses_trigrams() and len(q) >= 3:
+        conditions.append((FUZZY, Q(name__trigram_similar=q)))
+    elif len(q) >= 3:
+        conditions.append((FUZZY, Q(name__icontains=q)))
+    return conditions
+
+
+def matching_patients(q, queryset=None):
+    """Patients matching ``q`` (unordered), suitable for a ``patient__in`` subquery."""
+    queryset = Patient.objects.all() if queryset is None else queryset
+    q = (q or '').strip()
+    if not q:
+        return queryset
+    return queryset.filter(reduce(operator.or_, (cond for _rank, cond in _conditions(q))))
+
+
+def search_patients(q, queryset=None, limit=MAX_RESULTS):
+    """Patients matching ``q``, best match first, annotated with ``search_rank`` (and ``similarity`` on PostgreSQL)."""
+    q = (q or '').strip()
+    conditions = _conditions(q)
+    qs = matching_patients(q, queryset).annotate(
+        search_rank=Case(
+            *[When(cond, then=Value(rank)) for rank, cond in sorted(conditions, key=lambda c: -c[0])],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    order = ['-search_rank', 'name']
+    if _uses_trigrams() and len(q) >= 3:
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        qs = qs.annotate(similarity=TrigramSimilarity('name', q))
+        order = ['-search_rank', '-similarity', 'name']
+    return qs.order_by(*order)[:limit]
+
+
+class PatientSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` for patient-owned rows.
+
+    The view names the path to the patient with ``patient_lookup`` (default
+    ``'patient'``). Any ``search_fields`` on the view that don't go through the
+    patient (e.g. ``medication``) are still matched with icontains.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        q = request.query_params.get(self.search_param, '').strip()
+        if not q:
+            return queryset
+
+        lookup = getattr(view, 'patient_lookup', 'patient')
+        if lookup:
+            match = Q(**{f'{lookup}__in': matching_patients(q).values('pk')})
+        else:
+            # The view lists patients themselves
+            match = Q(pk__in=matching_patients(q).values('pk'))
+        for field in getattr(view, 'search_fields', None) or []:
+            match |= Q(**{f'{field}__icontains': q})
+        return queryset.filter(match)
@@ -28,14 +28,18 @@ class PatientSerializer(serializers.ModelSerializer):
 
         validated_data["user"] = user
 
-        # Auto-generate medical ID
-        last_patient = Patient.objects.order_by('-id').first()
-        next_num = (last_patient.id if last_patient else 0) + 1
-        validated_data["medical_id"] = f"PAT-{next_num:04d}"
+        # Auto-generate medical ID from the shared sequence (safe under concurrent registration)
+        validated_data["medical_id"] = Patient.allocate_medical_ids(1)[0]
 
         return super().create(validated_data)
 
 
+class PatientSummarySerializer(serializers.ModelSerializer):
+	"""Just enough of a patient to label a row in a list view."""
+	class Meta:
+		model = Patient
+		fields = ["id", "name", "medical_id"]
+		read_only_fields = fields
 
 
 class VisitSerializer(serializers.ModelSerializer):
@@ -54,6 +58,10 @@ class VisitSerializer(serializers.ModelSerializer):
 		return super().create(validated_data)
 
 
+class VisitListSerializer(VisitSerializer):
+	patient_detail = PatientSummarySerializer(source="patient", read_only=True)
+
+
 class PrescriptionSerializer(serializers.ModelSerializer):
 	patient_detail = PatientSerializer(source="patient", read_only=True)
 	patient_username = serializers.CharField(write_only=True, required=False)
@@ -98,3 +106,7 @@ class PrescriptionSerializer(serializers.ModelSerializer):
 			if not validated_data.get("doctor") and request.user.role == "DOCTOR":
 				validated_data["doctor"] = request.user
 		return super().create(validated_data)
+
+
+class PrescriptionListSerializer(PrescriptionSerializer):
+	patient_detail = PatientSummarySerializer(source="patient", read_only=True)
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from core.testing import QueryBudgetTestMixin, make_patient
+from users.models import User
+
+from .importer import PatientImport
+from .models import Patient, Prescription, Visit
+
+
+class PatientApiQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """List and retrieve stay within the views' query_budget however many rows they return."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+        cls.patients = []
+        for i in range(3):
+            patient = make_patient(f'patient{i}', contact=f'071234567{i}')
+            Visit.objects.create(patient=patient, doctor=cls.doctor, date=timezone.now() - timedelta(days=i), reason='Checkup')
+            Prescription.objects.create(patient=patient, doctor=cls.doctor, medication='Amoxicillin', dosage='1 twice', duration='5', created_by=cls.doctor)
+            cls.patients.append(patient)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.doctor)
+
+    def test_patients(self):
+        self.assertListAndRetrieve('/api/patients/')
+
+    def test_visits(self):
+        self.assertListAndRetrieve('/api/visits/')
+
+    def test_prescriptions(self):
+        self.assertListAndRetrieve('/api/prescriptions/')
+
+
+class PatientSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+        cls.wanjiru = make_patient('wanjiru', name='Wanjiru', contact='+254 712 345 678')
+        cls.mary = make_patient('mary', name='Mary Wanjiku', contact='0722-111-222')
+        cls.wanjala = make_patient('wanjala', name='Wanjala Otieno', contact='0733 999 888')
+        cls.other = make_patient('kamau', name='Kamau', contact='0711 000 111')
+
+    def setUp(self):
+        self.client.force_authenticate(self.doctor)
+
+    def search(self, q, url='/api/patients/'):
+        response = self.client.get(url, {'search': q})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def test_ranks_exact_then_prefix_then_word(self):
+        self.assertEqual(self.search('wanj'), ['Wanjala Otieno', 'Wanjiru', 'Mary Wanjiku'])
+        self.assertEqual(self.search('WANJIRU'), ['Wanjiru'])
+
+    def test_medical_id_and_username(self):
+        self.assertEqual(self.search(self.mary.medical_id.lower()), ['Mary Wanjiku'])
+        self.assertEqual(self.search(str(int(self.mary.medical_id[4:]))), ['Mary Wanjiku'])
+        self.assertEqual(self.search('kamau'), ['Kamau'])
+
+    def test_phone_is_normalized(self):
+        for q in ('0712345678', '+254712345678', '254 712-345-678', '712345678'):
+            self.assertEqual(self.search(q), ['Wanjiru'], q)
+        self.assertEqual(self.wanjiru.contact_digits, '0712345678')
+
+    def test_phone_prefix_ranks_above_substring(self):
+        self.mary.contact = '0788 071 200'
+        self.mary.save()
+        self.assertEqual(self.search('071'), ['Kamau', 'Wanjiru', 'Mary Wanjiku'])
+        self.assertEqual(self.search('999 8'), ['Wanjala Otieno'])
+
+    def test_filters_patient_owned_rows(self):
+        for patient in (self.wanjiru, self.other):
+            Prescription.objects.create(patient=patient, doctor=self.doctor, medication='Amoxicillin', dosage='1', duration='5')
+        self.assertEqual(
+            [row['patient'] for row in self.client.get('/api/prescriptions/', {'search': 'wanjiru'}).data['results']],
+            [self.wanjiru.pk],
+        )
+
+
+IMPORT_CSV = """Username,Name,Gender,DOB,Contact,Password
+amina,Amina Hassan,female,1990-04-01,+254 712 000 111,s3cret-pass
+brian,Brian Otieno,M,,0722 000 222,
+amina,Amina Again,F,,,
+carol,,X,01/02/1990,,
+doctor,Taken Username,F,,,
+dan,Dan Kibet,o,,,
+"""
+
+
+class PatientImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role=User.Role.ADMIN)
+        User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, text, query=''):
+        return self.client.post(
+            f'/api/patients/import/{query}',
+            {'file': SimpleUploadedFile('patients.csv', text.encode('utf-8-sig'), content_type='text/csv')},
+            format='multipart',
+        )
+
+    def test_imports_valid_rows_and_reports_the_rest(self):
+        response = self.upload(IMPORT_CSV)
+        self.assertEqual(response.status_code, 201)
+        report = response.data
+        self.assertEqual((report['rows'], report['created'], report['failed']), (6, 3, 3))
+        self.assertEqual([(e['row'], e['username']) for e in report['errors']], [(4, 'amina'), (5, 'carol'), (6, 'doctor')])
+        self.assertEqual(report['errors'][0]['errors'], {'username': 'Duplicate username earlier in the file.'})
+        self.assertEqual(set(report['errors'][1]['errors']), {'name', 'gender', 'dob'})
+        self.assertEqual(report['errors'][2]['errors'], {'username': 'A user with that username already exists.'})
+
+        amina = Patient.objects.select_related('user').get(user__username='amina')
+        self.assertEqual((amina.name, amina.gender, amina.dob, amina.contact_digits), ('Amina Hassan', 'F', date(1990, 4, 1), '0712000111'))
+        self.assertEqual(amina.user.role, User.Role.PATIENT)
+        self.assertTrue(amina.user.check_password('s3cret-pass'))
+        self.assertFalse(amina.user.password_change_required)
+        brian = Patient.objects.select_related('user').get(user__username='brian')
+        self.assertTrue(brian.user.password_change_required)
+        ids = sorted(Patient.objects.values_list('medical_id', flat=True))
+        self.assertEqual((report['first_medical_id'], report['last_medical_id']), (ids[0], ids[-1]))
+
+    def test_dry_run_saves_nothing(self):
+        response = self.upload(IMPORT_CSV, '?dry_run=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['dry_run'], response.data['created'], response.data['failed']), (True, 3, 3))
+        self.assertFalse(Patient.objects.exists())
+
+    def test_rejects_missing_columns_and_non_admins(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.upload('username,name\namina,Amina\n')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('gender', response.data['detail'])
+            self.client.force_authenticate(User.objects.get(username='doctor'))
+            self.assertEqual(self.upload(IMPORT_CSV).status_code, 403)
+
+    def test_conflict_fails_only_the_conflicting_row(self):
+        save = PatientImport._save
+
+        def register_meanwhile(importer, valid, hashes):
+            # Someone registers "brian" after the chunk's username check
+            if not User.objects.filter(username='brian').exists():
+                User.objects.create_user('brian', password='x', role=User.Role.PATIENT)
+            return save(importer, valid, hashes)
+
+        with mock.patch.object(PatientImport, '_save', register_meanwhile), self.assertLogs('patients.importer', 'WARNING'):
+            response = self.upload(IMPORT_CSV)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 4))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertIn('non_field_errors', response.data['errors'][0]['errors'])
+        self.assertEqual(sorted(Patient.objects.values_list('user__username', flat=True)), ['amina', 'dan'])
+
+    def test_command_writes_the_error_report(self):
+        directory = tempfile.mkdtemp()
+        source, errors = os.path.join(directory, 'in.csv'), os.path.join(directory, 'errors.csv')
+        with open(source, 'w') as fh:
+            fh.write(IMPORT_CSV)
+        call_command('import_patients', source, '--errors', errors, '--chunk-size', '2', '--workers', '1', stdout=io.StringIO())
+        with open(errors, newline='') as fh:
+            rows = list(csv.reader(fh))
+        self.assertEqual(rows[0], ['row', 'username', 'field', 'error'])
+        self.assertEqual({(row[0], row[2]) for row in rows[1:]}, {('4', 'username'), ('5', 'name'), ('5', 'gender'), ('5', 'dob'), ('6', 'username')})
+        self.assertEqual(Patient.objects.count(), 3)
@@ -1,35 +1,82 @@
+import csv
+import io
+
 from django.shortcuts import render
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from .models import Patient, Visit, Prescription
-from .serializers import PatientSerializer, VisitSerializer, PrescriptionSerializer
+from .serializers import (
+	PatientSerializer, VisitSerializer, VisitListSerializer, PrescriptionSerializer, PrescriptionListSerializer,
+)
 from .permissions import IsClinicianOrReadOnly
+from .search import PatientSearchFilter, search_patients
+from .importer import ImportFileError, import_patients
+from core.mixins import ListSerializerMixin
+from core.pagination import VisitDatePagination
 
 # Create your views here.
 
 class PatientViewSet(viewsets.ModelViewSet):
-	queryset = Patient.objects.all().order_by("-created_at")
+	queryset = Patient.objects.select_related("user").order_by("-created_at")
 	serializer_class = PatientSerializer
+	query_budget = {'list': 4, 'retrieve': 4}
 	permission_classes = [IsAuthenticated & IsClinicianOrReadOnly]
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-	search_fields = ["name","medical_id","contact"]
+	filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+	patient_lookup = None
 	ordering_fields = ["created_at","name"]
 
-class VisitViewSet(viewsets.ModelViewSet):
-	queryset = Visit.objects.select_related("patient","doctor").order_by("-date")
+	def list(self, request, *args, **kwargs):
+		# A search without ?ordering= returns the best matches ranked by relevance,
+		# as a single page in the usual {next, previous, results} shape; cursor
+		# pagination would discard the ranking. With ?ordering= the matches are
+		# paged in that order like any other list.
+		q = request.query_params.get(PatientSearchFilter.search_param, "").strip()
+		if not q or request.query_params.get(filters.OrderingFilter.ordering_param):
+			return super().list(request, *args, **kwargs)
+		patients = search_patients(q, self.get_queryset())
+		return Response({"next": None, "previous": None, "results": self.get_serializer(patients, many=True).data})
+
+	@action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser, FormParser])
+	def import_csv(self, request):
+		"""Register patients from an uploaded CSV ("file"); ?dry_run=1 validates without saving."""
+		if getattr(request.user, "role", None) != "ADMIN":
+			raise PermissionDenied("Only admins can import patients")
+		upload = request.FILES.get("file")
+		if not upload:
+			return Response({"detail": "Upload a CSV file in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+		dry_run = request.query_params.get("dry_run") in {"1", "true", "yes"}
+		stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+		try:
+			# No hashing pool here: forking a multi-threaded web worker isn't safe
+			report = import_patients(stream, dry_run=dry_run, workers=1)
+		except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+			return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+		created = report["created"] and not dry_run
+		return Response(report, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+class VisitViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+	queryset = Visit.objects.select_related("patient__user","doctor").order_by("-date")
 	serializer_class = VisitSerializer
+	list_serializer_class = VisitListSerializer
+	query_budget = {'list': 4, 'retrieve': 4}
 	permission_classes = [IsAuthenticated & IsClinicianOrReadOnly]
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-	search_fields = ["patient__name","patient__medical_id","reason"]
+	pagination_class = VisitDatePagination
+	filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+	search_fields = ["reason"]
 	ordering_fields = ["date","created_at"]
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
-	queryset = Prescription.objects.select_related("patient", "doctor", "pharmacist", "created_by").order_by("-created_at")
+class PrescriptionViewSet(ListSerializerMixin, viewsets.ModelViewSet):
+	queryset = Prescription.objects.select_related("patient__user", "doctor", "pharmacist", "created_by").order_by("-created_at")
 	serializer_class = PrescriptionSerializer
+	list_serializer_class = PrescriptionListSerializer
+	query_budget = {'list': 4, 'retrieve': 4}
 	permission_classes = [IsAuthenticated & IsClinicianOrReadOnly]
 	parser_classes = [MultiPartParser, FormParser, JSONParser]  # Support file uploads
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-	search_fields = ["patient__name", "patient__medical_id", "medication"]
+	filter_backends = [PatientSearchFilter, filters.OrderingFilter]
+	search_fields = ["medication"]
 	ordering_fields = ["created_at", "status"]
 	filterset_fields = ["status", "patient"]
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Medicine, InventoryTransaction, PrescriptionDispense
+from .models import (
+    Medicine, InventoryTransaction, PrescriptionDispense, DailyMedicineLedger, OCRJob, OCRCacheEntry, StockAlert, StockEvent,
+    StockBatch, StockSnapshot,
+)
 
 
 @admin.register(Medicine)
@@ -29,6 +32,14 @@ class InventoryTransactionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
     date_hierarchy = 'created_at'
 
+    # Editing or deleting a row would leave stock, batches and the daily ledger
+    # behind it; record an ADJUSTMENT instead.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(PrescriptionDispense)
 class PrescriptionDispenseAdmin(admin.ModelAdmin):
@@ -41,3 +52,64 @@ class PrescriptionDispenseAdmin(admin.ModelAdmin):
     search_fields = ['prescription__patient__name', 'medicine__name']
     readonly_fields = ['dispensed_at']
     date_hierarchy = 'dispensed_at'
+
+
+@admin.register(DailyMedicineLedger)
+class DailyMedicineLedgerAdmin(admin.ModelAdmin):
+    list_display = ['day', 'medicine', 'pharmacist', 'qty_in', 'qty_out', 'qty_dispensed', 'revenue', 'cogs', 'spend']
+    list_filter = ['day']
+    search_fields = ['medicine__name']
+    date_hierarchy = 'day'
+
+
+@admin.register(OCRJob)
+class OCRJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'filename', 'status', 'provider', 'cached', 'attempts', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'provider']
+    search_fields = ['filename']
+    exclude = ['content']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(OCRCacheEntry)
+class OCRCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['digest', 'provider', 'model', 'size', 'hits', 'created_at', 'last_used_at']
+    list_filter = ['provider']
+    search_fields = ['digest']
+    readonly_fields = ['created_at']
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ['medicine', 'status', 'current_stock', 'reorder_level', 'since', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['medicine__name']
+    readonly_fields = ['since', 'updated_at']
+
+
+@admin.register(StockEvent)
+class StockEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'previous_status', 'status', 'current_stock', 'reorder_level', 'created_at']
+    list_filter = ['status']
+    search_fields = ['name']
+    readonly_fields = ['created_at']
+
+
+@admin.register(StockBatch)
+class StockBatchAdmin(admin.ModelAdmin):
+    list_display = ['medicine', 'batch_number', 'expiry_date', 'on_hand', 'received_at', 'updated_at']
+    list_filter = ['expiry_date']
+    search_fields = ['medicine__name', 'batch_number']
+    # Moved only by inventory transactions, so it stays in step with current_stock
+    readonly_fields = ['medicine', 'batch_number', 'expiry_date', 'on_hand', 'received_at', 'updated_at']
+    date_hierarchy = 'expiry_date'
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['day', 'medicine', 'on_hand', 'created_at']
+    list_filter = ['day']
+    search_fields = ['medicine__name']
+    # Written by snapshot_stock; rerun it for a day rather than editing rows
+    readonly_fields = ['day', 'medicine', 'on_hand', 'created_at']
+    date_hierarchy = 'day'
@@ -0,0 +1,190 @@
+"""
+Consumption forecasting and reorder-level suggestions.
+
+DISPENSED transactions over the last ``days`` complete days are read with one
+grouped query (units per medicine per day) and laid out as a medicine × day
+matrix, so demand, variability and safety stock for the whole catalog are a
+few NumPy operations instead of a loop per medicine:
+
+- demand: mean units per day over the last ``window`` days (moving average)
+- variability: standard deviation of units per day over the whole history
+- safety stock: z × σ × √lead_time, z taken from the service level
+- reorder level: demand × lead_time + safety stock
+- order quantity: what brings current stock up to the reorder level plus
+  ``cover_days`` of demand
+
+``apply_reorder_levels`` writes new levels with a single UPDATE and brings the
+StockAlert set in line for the medicines whose level changed.
+"""
+from datetime import datetime, time, timedelta
+import json
+from statistics import NormalDist
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core import dashboard
+
+from .models import InventoryTransaction, Medicine, StockAlert
+
+DEFAULTS = {
+    'days': 90,
+    'window': 28,
+    'lead_time': 7,
+    'service_level': 0.95,
+    'cover_days': 30,
+}
+# (type, lowest, highest) for each parameter
+LIMITS = {
+    'days': (int, 7, 730),
+    'window': (int, 1, 730),
+    'lead_time': (int, 0, 365),
+    'service_level': (float, 0.5, 0.999),
+    'cover_days': (int, 0, 365),
+}
+
+
+def parse_params(data):
+    """Forecast parameters from query params / request data, with defaults. Raises ValueError with a message."""
+    params = {}
+    for name, default in DEFAULTS.items():
+        kind, lowest, highest = LIMITS[name]
+        raw = data.get(name)
+        if raw in (None, ''):
+            params[name] = default
+            continue
+        try:
+            value = kind(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} must be a number.')
+        if not lowest <= value <= highest:
+            raise ValueError(f'{name} must be between {lowest} and {highest}.')
+        params[name] = value
+    if params['window'] > params['days']:
+        raise ValueError('window cannot be longer than days.')
+    return params
+
+
+def consumption_matrix(medicine_ids, days, today=None):
+    """
+    Units dispensed per medicine (rows, in the order of the sorted
+    ``medicine_ids``) per day (columns, oldest first) over the ``days``
+    complete days before today. One grouped query.
+    """
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days)
+    ids = np.asarray(medicine_ids, dtype=np.int64)
+    matrix = np.zeros((len(ids), days))
+    if not len(ids):
+        return matrix
+
+    rows = list(
+        InventoryTransaction.objects.filter(
+            transaction_type='DISPENSED',
+            created_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            created_at__lt=timezone.make_aware(datetime.combine(today, time.min)),
+        )
+        .annotate(day=TruncDate('created_at'))
+        .values('medicine_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .values_list('medicine_id', 'day', 'units')
+        .order_by()
+    )
+    if not rows:
+        return matrix
+    medicine, day, units = zip(*rows)
+    medicine = np.fromiter(medicine, dtype=np.int64, count=len(rows))
+    column = np.fromiter((d.toordinal() for d in day), dtype=np.int64, count=len(rows)) - start.toordinal()
+    row = np.searchsorted(ids, medicine)
+    # Medicines outside the requested set (inactive ones) are dropped
+    known = (row < len(ids)) & (ids[np.minimum(row, len(ids) - 1)] == medicine)
+    matrix[row[known], column[known]] = np.fromiter(units, dtype=np.float64, count=len(rows))[known]
+    return matrix
+
+
+def suggest(params, medicine_ids=None, today=None):
+    """
+    Suggested reorder level and order quantity for every active medicine (or
+    just ``medicine_ids``), most urgent first (fewest days of stock left).
+    Medicines with nothing dispensed in the history keep their current level.
+    Two queries, however large the catalog.
+    """
+    medicines = Medicine.objects.filter(is_active=True).order_by('pk')
+    if medicine_ids is not None:
+        medicines = medicines.filter(pk__in=medicine_ids)
+    catalog = list(medicines.values_list('pk', 'name', 'current_stock', 'reorder_level'))
+    if not catalog:
+        return []
+    ids, names, stock, levels = zip(*catalog)
+    stock = np.asarray(stock, dtype=np.float64)
+    current = np.asarray(levels, dtype=np.float64)
+
+    matrix = consumption_matrix(ids, params['days'], today)
+    demand = matrix[:, -params['window']:].mean(axis=1)
+    sigma = matrix.std(axis=1, ddof=1)
+    z = NormalDist().inv_cdf(params['service_level'])
+    safety = np.ceil(z * sigma * np.sqrt(params['lead_time']))
+    reorder = np.ceil(demand * params['lead_time']) + safety
+    reorder = np.where(matrix.any(axis=1), reorder, current)
+    order = np.maximum(reorder + np.ceil(demand * params['cover_days']) - stock, 0)
+    days_left = np.divide(stock, demand, out=np.full(len(ids), np.inf), where=demand > 0)
+
+    results = []
+    for i in np.lexsort((np.arange(len(ids)), days_left)):
+        results.append({
+            'id': ids[i],
+            'name': names[i],
+            'current_stock': int(stock[i]),
+            'reorder_level': levels[i],
+            'avg_daily': round(float(demand[i]), 2),
+            'std_daily': round(float(sigma[i]), 2),
+            'safety_stock': int(safety[i]),
+            'suggested_reorder_level': int(reorder[i]),
+            'suggested_order_quantity': int(order[i]),
+            'days_of_stock': round(float(days_left[i]), 1) if np.isfinite(days_left[i]) else None,
+        })
+    return results
+
+
+def _update_reorder_levels(ids, levels):
+    """One UPDATE ... FROM over (id, level) pairs, returning the ids whose level changed."""
+    table = connection.ops.quote_name(Medicine._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    if connection.vendor == 'postgresql':
+        pairs = 'unnest(%s::bigint[], %s::integer[]) AS v(id, level)'
+        params = [ids, levels]
+    else:
+        # sqlite in development (3.35+): the pairs travel as one JSON array
+        pairs = "(SELECT json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS level FROM json_each(%s)) AS v"
+        params = [json.dumps(list(zip(ids, levels)))]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET reorder_level = v.level, updated_at = %s FROM {pairs} '
+            f'WHERE {table}.id = v.id AND {table}.reorder_level <> v.level RETURNING {table}.id',
+            [now, *params],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def apply_reorder_levels(levels, batch_size=1000):
+    """
+    Set ``reorder_level`` from {medicine_id: level} in one UPDATE (only rows
+    that change) and resync their stock alerts. Returns the changed ids.
+    """
+    levels = {int(pk): int(level) for pk, level in levels.items()}
+    if not levels:
+        return []
+    ids = sorted(levels)
+    with transaction.atomic():
+        changed = _update_reorder_levels(ids, [levels[pk] for pk in ids])
+        # The UPDATE holds the medicine locks until commit, so stock changes wait for the new levels
+        flagged = Q(is_active=True, current_stock__lte=F('reorder_level')) | Q(stock_alert__isnull=False)
+        for i in range(0, len(changed), batch_size):
+            StockAlert.sync(Medicine.objects.filter(flagged, pk__in=changed[i:i + batch_size]))
+    if changed:
+        # The raw UPDATE sends no post_save signals
+        dashboard.invalidate_for(Medicine)
+    return changed
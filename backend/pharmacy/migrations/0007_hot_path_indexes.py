@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_hot_path_indexes'),
+        ('pharmacy', '0006_alter_inventorytransaction_prescription_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['transaction_type', 'created_at'], name='invtx_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['medicine', 'transaction_type', 'created_at'], name='invtx_med_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['-created_at', '-id'], name='invtx_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['current_stock', 'reorder_level'], name='medicine_active_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescriptiondispense',
+            index=models.Index(fields=['-dispensed_at', '-id'], name='dispense_dispensed_id_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:45
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def populate_ledger(apps, schema_editor):
+    InventoryTransaction = apps.get_model('pharmacy', 'InventoryTransaction')
+    DailyMedicineLedger = apps.get_model('pharmacy', 'DailyMedicineLedger')
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+    zero = Decimal('0.00')
+    dispensed = Q(transaction_type='DISPENSED')
+    stock_in = Q(transaction_type='STOCK_IN')
+    grouped = (
+        InventoryTransaction.objects.annotate(day=TruncDate('created_at'))
+        .values('day', 'medicine_id', 'created_by_id')
+        .annotate(
+            qty_in=Coalesce(Sum('quantity', filter=stock_in), 0),
+            qty_out=Coalesce(Sum('quantity', filter=Q(transaction_type__in=['STOCK_OUT', 'DISPENSED'])), 0),
+            qty_adjusted=Coalesce(Sum('quantity', filter=Q(transaction_type='ADJUSTMENT')), 0),
+            revenue=Coalesce(Sum(ExpressionWrapper(F('quantity') * F('medicine__selling_price'), output_field=money), filter=dispensed), zero, output_field=money),
+            cogs=Coalesce(Sum(ExpressionWrapper(F('quantity') * F('medicine__buying_price'), output_field=money), filter=dispensed), zero, output_field=money),
+            spend=Coalesce(Sum(ExpressionWrapper(F('quantity') * F('medicine__buying_price'), output_field=money), filter=stock_in), zero, output_field=money),
+            dispensed_count=Count('id', filter=dispensed),
+            stock_in_count=Count('id', filter=stock_in),
+        )
+        .order_by()
+    )
+    batch = []
+    for g in grouped.iterator(chunk_size=1000):
+        g['pharmacist_id'] = g.pop('created_by_id')
+        batch.append(DailyMedicineLedger(**g))
+        if len(batch) >= 1000:
+            DailyMedicineLedger.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        DailyMedicineLedger.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0007_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMedicineLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('qty_in', models.IntegerField(default=0)),
+                ('qty_out', models.IntegerField(default=0)),
+                ('qty_adjusted', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('cogs', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('spend', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('dispensed_count', models.IntegerField(default=0)),
+                ('stock_in_count', models.IntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_ledger', to='pharmacy.medicine')),
+                ('pharmacist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_medicine_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='ledger_day_idx'), models.Index(fields=['medicine', 'day'], name='ledger_med_day_idx'), models.Index(fields=['pharmacist', 'day'], name='ledger_pharm_day_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('pharmacist__isnull', False)), fields=('day', 'medicine', 'pharmacist'), name='ledger_day_med_pharm_uniq'), models.UniqueConstraint(condition=models.Q(('pharmacist__isnull', True)), fields=('day', 'medicine'), name='ledger_day_med_unattributed_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_ledger, migrations.RunPython.noop),
+    ]
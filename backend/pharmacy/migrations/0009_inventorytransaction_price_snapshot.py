@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_hot_path_indexes'),
+        ('pharmacy', '0008_dailymedicineledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['transaction_type', 'created_at'], include=('quantity', 'unit_cost', 'unit_price'), name='invtx_type_created_cov_idx'),
+        ),
+        # Drop the old index only once the covering one exists.
+        migrations.RemoveIndex(
+            model_name='inventorytransaction',
+            name='invtx_type_created_idx',
+        ),
+    ]
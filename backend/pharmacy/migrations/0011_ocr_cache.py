@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0010_ocrjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrjob',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='OCRCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('provider', models.CharField(max_length=30)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('text', models.TextField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='ocrcache_last_used_idx')],
+                'constraints': [models.UniqueConstraint(fields=('digest', 'provider', 'model'), name='uniq_ocr_cache_key')],
+            },
+        ),
+    ]
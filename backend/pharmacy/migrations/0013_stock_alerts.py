@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_stock_alerts(apps, schema_editor):
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    StockAlert = apps.get_model('pharmacy', 'StockAlert')
+    flagged = Medicine.objects.filter(is_active=True, current_stock__lte=models.F('reorder_level'))
+    StockAlert.objects.bulk_create(
+        [
+            StockAlert(
+                medicine_id=m.pk,
+                status='OUT_OF_STOCK' if m.current_stock <= 0 else 'LOW_STOCK',
+                current_stock=m.current_stock,
+                reorder_level=m.reorder_level,
+            )
+            for m in flagged.only('id', 'current_stock', 'reorder_level').iterator(chunk_size=2000)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0012_medicine_trigram_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('LOW_STOCK', 'Low stock'), ('OUT_OF_STOCK', 'Out of stock')], max_length=20)),
+                ('current_stock', models.IntegerField()),
+                ('reorder_level', models.IntegerField()),
+                ('since', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medicine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alert', to='pharmacy.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status'], name='stockalert_status_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('status', models.CharField(max_length=20)),
+                ('previous_status', models.CharField(max_length=20)),
+                ('current_stock', models.IntegerField()),
+                ('reorder_level', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_events', to='pharmacy.medicine')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['created_at'], name='stockevent_created_idx')],
+            },
+        ),
+        migrations.RunPython(seed_stock_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:38
+
+from collections import defaultdict
+from datetime import date
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+
+def seed_batches(apps, schema_editor):
+    """
+    Spread each medicine's current stock over the batches it was received in.
+    Stock is assumed to have left first-expiry-first-out, so what is left is
+    the latest-expiring stock (undated receipts last of all); whatever the
+    stock-in history doesn't cover goes into one undated batch.
+    """
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    InventoryTransaction = apps.get_model('pharmacy', 'InventoryTransaction')
+    StockBatch = apps.get_model('pharmacy', 'StockBatch')
+
+    received = defaultdict(list)
+    rows = (
+        InventoryTransaction.objects.filter(transaction_type='STOCK_IN', medicine__current_stock__gt=0)
+        .values('medicine_id', 'batch_number', 'expiry_date')
+        .annotate(quantity=Sum('quantity'), received_at=Max('created_at'))
+        .order_by()
+    )
+    for row in rows:
+        received[row['medicine_id']].append(row)
+
+    now = timezone.now()
+    batches = []
+    for medicine_id, stock in Medicine.objects.filter(current_stock__gt=0).values_list('id', 'current_stock').iterator():
+        remaining = stock
+        kept = {}
+        # Last to be used first: undated, then latest expiry
+        for row in sorted(received[medicine_id], key=lambda r: (r['expiry_date'] is not None, -(r['expiry_date'] or date.min).toordinal())):
+            if remaining <= 0:
+                break
+            take = min(row['quantity'], remaining)
+            if take <= 0:
+                continue
+            kept[(row['batch_number'], row['expiry_date'])] = [take, row['received_at']]
+            remaining -= take
+        if remaining > 0:
+            kept.setdefault(('', None), [0, now])[0] += remaining
+        batches.extend(
+            StockBatch(medicine_id=medicine_id, batch_number=batch_number, expiry_date=expiry_date, on_hand=on_hand, received_at=received_at or now)
+            for (batch_number, expiry_date), (on_hand, received_at) in kept.items()
+        )
+    StockBatch.objects.bulk_create(batches, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0013_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(blank=True, max_length=100)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('on_hand', models.PositiveIntegerField(default=0)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='pharmacy.medicine')),
+            ],
+            options={
+                'ordering': ['medicine', 'expiry_date'],
+                'indexes': [models.Index(condition=models.Q(('expiry_date__isnull', False)), fields=['expiry_date'], name='stockbatch_expiry_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('expiry_date__isnull', False)), fields=('medicine', 'batch_number', 'expiry_date'), name='stockbatch_med_batch_exp_uniq'), models.UniqueConstraint(condition=models.Q(('expiry_date__isnull', True)), fields=('medicine', 'batch_number'), name='stockbatch_med_batch_undated_uniq')],
+            },
+        ),
+        migrations.RunPython(seed_batches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_qty_dispensed(apps, schema_editor):
+    InventoryTransaction = apps.get_model('pharmacy', 'InventoryTransaction')
+    DailyMedicineLedger = apps.get_model('pharmacy', 'DailyMedicineLedger')
+
+    dispensed = (
+        InventoryTransaction.objects.filter(transaction_type='DISPENSED')
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'medicine_id', 'created_by_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    units = {(g['day'], g['medicine_id'], g['created_by_id']): g['units'] for g in dispensed.iterator(chunk_size=1000)}
+    batch = []
+    for row in DailyMedicineLedger.objects.filter(dispensed_count__gt=0).iterator(chunk_size=1000):
+        row.qty_dispensed = units.get((row.day, row.medicine_id, row.pharmacist_id), 0)
+        batch.append(row)
+        if len(batch) >= 1000:
+            DailyMedicineLedger.objects.bulk_update(batch, ['qty_dispensed'])
+            batch = []
+    if batch:
+        DailyMedicineLedger.objects.bulk_update(batch, ['qty_dispensed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0015_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailymedicineledger',
+            name='qty_dispensed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_qty_dispensed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:25
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations
+
+from core.operations import PostgresAddIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0016_ledger_qty_dispensed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='medicine',
+            name='medicine_mfr_trgm_idx',
+        ),
+        PostgresAddIndex(
+            model_name='medicine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='medicine_name_upper_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='medicine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('generic_name'), name='gin_trgm_ops'), name='medicine_generic_upper_idx'),
+        ),
+        PostgresAddIndex(
+            model_name='medicine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('manufacturer'), name='gin_trgm_ops'), name='medicine_mfr_upper_idx'),
+        ),
+    ]
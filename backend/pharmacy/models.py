@@ -1,9 +1,14 @@
 from django.db import models, transaction as db_transaction
-from django.db.models import F
+from django.db.models import F, Q, Sum, Count, Case, When, Value, IntegerField, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce, TruncDate, Upper
+from django.utils import timezone
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from decimal import Decimal
+from datetime import date, datetime, time, timedelta
+from collections import defaultdict
 
 
 class Medicine(models.Model):
@@ -38,9 +43,38 @@ class Medicine(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # low_stock / out_of_stock only look at active medicines
+            models.Index(fields=['current_stock', 'reorder_level'], name='medicine_active_stock_idx', condition=models.Q(is_active=True)),
+            # Trigram indexes serve the catalog search without a sequential scan. Django compiles
+            # icontains / istartswith to UPPER(col) LIKE UPPER(...), which only an index on
+            # UPPER(col) can answer; the bare-column ones serve trigram_similar (%).
+            GinIndex(fields=['name'], name='medicine_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['generic_name'], name='medicine_generic_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='medicine_name_upper_idx'),
+            GinIndex(OpClass(Upper('generic_name'), name='gin_trgm_ops'), name='medicine_generic_upper_idx'),
+            GinIndex(OpClass(Upper('manufacturer'), name='gin_trgm_ops'), name='medicine_mfr_upper_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.category})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_alert_state = instance._alert_state()
+        return instance
+
+    def _alert_state(self):
+        return tuple(self.__dict__.get(name) for name in ('current_stock', 'reorder_level', 'is_active'))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Only stock, reorder_level and is_active can move a medicine in or out of the flagged set
+        state = self._alert_state()
+        if state != getattr(self, '_stored_alert_state', None):
+            StockAlert.sync([self])
+            self._stored_alert_state = state
     
     @property
     def is_low_stock(self):
@@ -70,11 +104,28 @@ class InventoryTransaction(models.Model):
     notes = models.TextField(blank=True)
     batch_number = models.CharField(max_length=100, blank=True)
     expiry_date = models.DateField(null=True, blank=True)
+    # Prices snapshotted from the medicine when the row is written, so historical
+    # reports use the prices in force at the time and need no join on Medicine.
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='inventory_transactions')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # profit/spend/finance summaries filter by type over a date range; the
+            # included columns let PostgreSQL answer them with an index-only scan
+            models.Index(
+                fields=['transaction_type', 'created_at'],
+                include=['quantity', 'unit_cost', 'unit_price'],
+                name='invtx_type_created_cov_idx',
+            ),
+            # per-medicine history and medicine-scoped summaries
+            models.Index(fields=['medicine', 'transaction_type', 'created_at'], name='invtx_med_type_created_idx'),
+            # default list ordering (keyset pagination)
+            models.Index(fields=['-created_at', '-id'], name='invtx_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.transaction_type} - {self.medicine.name} ({self.quantity})"
@@ -91,6 +142,12 @@ class InventoryTransaction(models.Model):
         with db_transaction.atomic():
             if is_new:
                 medicine = Medicine.objects.select_for_update().get(pk=self.medicine.pk)
+                if self.unit_cost is None:
+                    self.unit_cost = medicine.buying_price
+                if self.unit_price is None:
+                    self.unit_price = medicine.selling_price
+                # Before the insert: outgoing rows record the batches they were taken from
+                StockBatch.apply([self])
             super().save(*args, **kwargs)
             if is_new:
                 if self.transaction_type == 'STOCK_IN':
@@ -104,7 +161,655 @@ class InventoryTransaction(models.Model):
                         raise ValidationError(f'Insufficient stock for {medicine.name}.')
                 elif self.transaction_type == 'ADJUSTMENT':
                     Medicine.objects.filter(pk=medicine.pk).update(current_stock=F('current_stock') + self.quantity)
+                previous_stock = medicine.current_stock
                 medicine.refresh_from_db()
+                # Same transaction and medicine lock as the stock update, so the
+                # ledger can never disagree with the committed transactions.
+                DailyMedicineLedger.record(self)
+                StockAlert.record([(medicine, previous_stock)])
+
+    @classmethod
+    def bulk_apply(cls, transactions, batch_size=500):
+        """Insert many new transactions and apply their stock effects set-based.
+
+        Equivalent to calling save() on each transaction, but takes the medicine
+        locks once (in id order, so concurrent bulk writers cannot deadlock),
+        inserts with bulk_create, adjusts every affected medicine's stock with a
+        single CASE update and folds the batch into the daily ledger.
+        Raises ValidationError if any medicine would go below zero stock.
+        """
+        if not transactions:
+            return []
+        with db_transaction.atomic():
+            medicine_ids = sorted({t.medicine_id for t in transactions})
+            medicines = {
+                m.pk: m for m in Medicine.objects.select_for_update().filter(pk__in=medicine_ids).order_by('pk')
+            }
+
+            deltas = defaultdict(int)
+            for t in transactions:
+                medicine = medicines[t.medicine_id]
+                if t.unit_cost is None:
+                    t.unit_cost = medicine.buying_price
+                if t.unit_price is None:
+                    t.unit_price = medicine.selling_price
+                if t.transaction_type in ['STOCK_OUT', 'DISPENSED']:
+                    deltas[t.medicine_id] -= t.quantity
+                else:
+                    deltas[t.medicine_id] += t.quantity
+
+            short = [medicines[pk].name for pk, d in deltas.items() if d < 0 and medicines[pk].current_stock + d < 0]
+            if short:
+                raise ValidationError(f"Insufficient stock for {', '.join(sorted(short))}.")
+
+            StockBatch.apply(transactions)
+            created = cls.objects.bulk_create(transactions, batch_size=batch_size)
+
+            changed = {pk: d for pk, d in deltas.items() if d}
+            if changed:
+                Medicine.objects.filter(pk__in=changed.keys()).update(
+                    current_stock=F('current_stock') + Case(
+                        *[When(pk=pk, then=Value(d)) for pk, d in changed.items()],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                )
+            DailyMedicineLedger.record_many(created)
+
+            for pk, d in changed.items():
+                medicines[pk].current_stock += d
+            StockAlert.record((medicines[pk], medicines[pk].current_stock - d) for pk, d in changed.items())
+            # bulk_create / update() send no post_save signals
+            from core import dashboard
+            dashboard.invalidate_for(cls, Medicine)
+        return created
+
+
+class DailyMedicineLedger(models.Model):
+    """
+    Daily rollup of inventory transactions per medicine and pharmacist.
+
+    Maintained incrementally by InventoryTransaction.save and rebuilt from the
+    transaction history by the ``rebuild_medicine_ledger`` command. The finance
+    summaries read from here so their cost follows the number of days in the
+    requested range rather than the number of transactions.
+    """
+    day = models.DateField()
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='daily_ledger')
+    pharmacist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_medicine_ledger')
+
+    qty_in = models.IntegerField(default=0)
+    qty_out = models.IntegerField(default=0)  # STOCK_OUT and DISPENSED
+    qty_dispensed = models.IntegerField(default=0)
+    qty_adjusted = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    cogs = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    spend = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    dispensed_count = models.IntegerField(default=0)
+    stock_in_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            # NULLs are distinct in unique indexes, so unattributed rows need their own constraint.
+            models.UniqueConstraint(fields=['day', 'medicine', 'pharmacist'], name='ledger_day_med_pharm_uniq', condition=Q(pharmacist__isnull=False)),
+            models.UniqueConstraint(fields=['day', 'medicine'], name='ledger_day_med_unattributed_uniq', condition=Q(pharmacist__isnull=True)),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='ledger_day_idx'),
+            models.Index(fields=['medicine', 'day'], name='ledger_med_day_idx'),
+            models.Index(fields=['pharmacist', 'day'], name='ledger_pharm_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.medicine_id} ({self.pharmacist_id})"
+
+    @staticmethod
+    def _deltas(txn):
+        qty = txn.quantity
+        unit_cost = txn.unit_cost or Decimal('0.00')
+        unit_price = txn.unit_price or Decimal('0.00')
+        if txn.transaction_type == 'STOCK_IN':
+            return {'qty_in': qty, 'spend': qty * unit_cost, 'stock_in_count': 1}
+        if txn.transaction_type == 'DISPENSED':
+            return {
+                'qty_out': qty,
+                'qty_dispensed': qty,
+                'revenue': qty * unit_price,
+                'cogs': qty * unit_cost,
+                'dispensed_count': 1,
+            }
+        if txn.transaction_type == 'STOCK_OUT':
+            return {'qty_out': qty}
+        return {'qty_adjusted': qty}
+
+    @classmethod
+    def record(cls, txn):
+        """Fold a newly saved transaction into its day's row. Caller must hold the medicine lock."""
+        deltas = cls._deltas(txn)
+        key = {
+            'day': timezone.localdate(txn.created_at),
+            'medicine_id': txn.medicine_id,
+            'pharmacist_id': txn.created_by_id,
+        }
+        updated = cls.objects.filter(**key).update(**{f: F(f) + v for f, v in deltas.items()})
+        if not updated:
+            cls.objects.create(**key, **deltas)
+
+    @classmethod
+    def record_many(cls, transactions):
+        """Fold a batch of new transactions into the ledger with one read and bulk writes.
+
+        Caller must hold the locks on every medicine in the batch.
+        """
+        totals = {}
+        for txn in transactions:
+            key = (timezone.localdate(txn.created_at), txn.medicine_id, txn.created_by_id)
+            row = totals.setdefault(key, defaultdict(int))
+            for field, value in cls._deltas(txn).items():
+                row[field] += value
+        if not totals:
+            return
+
+        existing = {
+            (r.day, r.medicine_id, r.pharmacist_id): r
+            for r in cls.objects.filter(
+                day__in={k[0] for k in totals},
+                medicine_id__in={k[1] for k in totals},
+            )
+        }
+        to_create, to_update, fields = [], [], set()
+        for (day, medicine_id, pharmacist_id), deltas in totals.items():
+            row = existing.get((day, medicine_id, pharmacist_id))
+            if row is None:
+                to_create.append(cls(day=day, medicine_id=medicine_id, pharmacist_id=pharmacist_id, **deltas))
+                continue
+            for field, value in deltas.items():
+                setattr(row, field, getattr(row, field) + value)
+                fields.add(field)
+            to_update.append(row)
+        if to_create:
+            cls.objects.bulk_create(to_create)
+        if to_update:
+            cls.objects.bulk_update(to_update, sorted(fields))
+
+    @classmethod
+    def rebuild(cls, start=None, end=None, batch_size=1000):
+        """Recompute ledger rows for [start, end] (inclusive dates) from InventoryTransaction.
+
+        Returns the number of ledger rows written.
+        """
+        txns = InventoryTransaction.objects.all()
+        rows = cls.objects.all()
+        tz = timezone.get_current_timezone()
+        if start:
+            txns = txns.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min), tz))
+            rows = rows.filter(day__gte=start)
+        if end:
+            txns = txns.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz))
+            rows = rows.filter(day__lte=end)
+
+        money = DecimalField(max_digits=14, decimal_places=2)
+        zero = Decimal('0.00')
+        dispensed = Q(transaction_type='DISPENSED')
+        stock_in = Q(transaction_type='STOCK_IN')
+        # Rows written before price snapshots existed fall back to the medicine's
+        # current prices until backfill_price_snapshots has been run.
+        unit_cost = Coalesce('unit_cost', 'medicine__buying_price')
+        unit_price = Coalesce('unit_price', 'medicine__selling_price')
+        grouped = (
+            txns.annotate(day=TruncDate('created_at'))
+            .values('day', 'medicine_id', 'created_by_id')
+            .annotate(
+                qty_in=Coalesce(Sum('quantity', filter=stock_in), 0),
+                qty_out=Coalesce(Sum('quantity', filter=Q(transaction_type__in=['STOCK_OUT', 'DISPENSED'])), 0),
+                qty_dispensed=Coalesce(Sum('quantity', filter=dispensed), 0),
+                qty_adjusted=Coalesce(Sum('quantity', filter=Q(transaction_type='ADJUSTMENT')), 0),
+                revenue=Coalesce(Sum(ExpressionWrapper(F('quantity') * unit_price, output_field=money), filter=dispensed), zero, output_field=money),
+                cogs=Coalesce(Sum(ExpressionWrapper(F('quantity') * unit_cost, output_field=money), filter=dispensed), zero, output_field=money),
+                spend=Coalesce(Sum(ExpressionWrapper(F('quantity') * unit_cost, output_field=money), filter=stock_in), zero, output_field=money),
+                dispensed_count=Count('id', filter=dispensed),
+                stock_in_count=Count('id', filter=stock_in),
+            )
+            .order_by()
+        )
+
+        written = 0
+        with db_transaction.atomic():
+            rows.delete()
+            batch = []
+            for g in grouped.iterator(chunk_size=batch_size):
+                g['pharmacist_id'] = g.pop('created_by_id')
+                batch.append(cls(**g))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch)
+                written += len(batch)
+        return written
+
+
+class StockBatch(models.Model):
+    """
+    Units on hand per medicine, batch number and expiry date.
+
+    Kept next to Medicine.current_stock by InventoryTransaction.save and
+    bulk_apply: stock-ins add to their batch, dispenses and stock-outs take
+    from the batches that expire first (FEFO). Empty batches are deleted, so
+    the table only holds what is on the shelf. Stock received before batches
+    were tracked, or without a batch number, sits in a batch with no number or
+    expiry date and is used after the dated ones.
+    """
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='batches')
+    batch_number = models.CharField(max_length=100, blank=True)
+    expiry_date = models.DateField(null=True, blank=True)
+    on_hand = models.PositiveIntegerField(default=0)
+    received_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['medicine', 'expiry_date']
+        constraints = [
+            # NULLs are distinct in unique indexes, so undated batches need their own constraint.
+            models.UniqueConstraint(fields=['medicine', 'batch_number', 'expiry_date'], name='stockbatch_med_batch_exp_uniq', condition=Q(expiry_date__isnull=False)),
+            models.UniqueConstraint(fields=['medicine', 'batch_number'], name='stockbatch_med_batch_undated_uniq', condition=Q(expiry_date__isnull=True)),
+        ]
+        indexes = [
+            # expiring report: a range scan on expiry across all medicines
+            models.Index(fields=['expiry_date'], name='stockbatch_expiry_idx', condition=Q(expiry_date__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine_id} batch {self.batch_number or '-'} exp {self.expiry_date or '-'} ({self.on_hand})"
+
+    def as_dict(self, today):
+        """The expiring-report row for this batch; ``medicine`` must be loaded (select_related)."""
+        return {
+            'id': self.id,
+            'medicine': self.medicine_id,
+            'medicine_name': self.medicine.name,
+            'batch_number': self.batch_number,
+            'expiry_date': self.expiry_date,
+            'days_left': (self.expiry_date - today).days,
+            'on_hand': self.on_hand,
+            'value_at_cost': self.on_hand * self.medicine.buying_price,
+        }
+
+    @classmethod
+    def expired_on_hand(cls, medicine_ids, today=None):
+        """{medicine_id: units in batches past their expiry date}, for the dispense stock checks."""
+        rows = (
+            cls.objects.filter(medicine_id__in=medicine_ids, expiry_date__lt=today or timezone.localdate())
+            .values('medicine_id').annotate(units=Sum('on_hand')).order_by()
+        )
+        return {row['medicine_id']: row['units'] for row in rows}
+
+    @staticmethod
+    def _pick_order(batches, preferred, today=None):
+        """
+        Batches in the order stock is taken from them: the one named on the
+        transaction, then by expiry date (undated last). With ``today``
+        (dispensing), expired batches go after everything else.
+        """
+        def key(batch):
+            expired = bool(today and batch.expiry_date and batch.expiry_date < today)
+            return (
+                not (preferred and batch.batch_number == preferred),
+                expired,
+                batch.expiry_date is None,
+                batch.expiry_date or date.max,
+                batch.received_at,
+            )
+        return sorted(batches, key=key)
+
+    @classmethod
+    def apply(cls, transactions):
+        """Move batch stock for new, unsaved transactions, in order.
+
+        Incoming stock (STOCK_IN, positive ADJUSTMENT) is added to its batch.
+        Outgoing stock is taken in _pick_order, and the transaction's
+        batch_number / expiry_date are set to the batches it came from (the
+        earliest expiry). Stock that batches don't account for is taken as
+        untracked. Caller must hold the locks on every medicine involved.
+        """
+        batches = defaultdict(list)
+        for batch in cls.objects.filter(medicine_id__in={t.medicine_id for t in transactions}):
+            batches[batch.medicine_id].append(batch)
+        today = timezone.localdate()
+        changed = {}
+
+        for txn in transactions:
+            medicine_batches = batches[txn.medicine_id]
+            incoming = txn.transaction_type == 'STOCK_IN' or (txn.transaction_type == 'ADJUSTMENT' and txn.quantity > 0)
+            if incoming:
+                batch = next(
+                    (b for b in medicine_batches if b.batch_number == txn.batch_number and b.expiry_date == txn.expiry_date),
+                    None,
+                )
+                if batch is None:
+                    batch = cls(medicine_id=txn.medicine_id, batch_number=txn.batch_number, expiry_date=txn.expiry_date)
+                    medicine_batches.append(batch)
+                batch.on_hand += txn.quantity
+                changed[id(batch)] = batch
+                continue
+
+            needed = abs(txn.quantity)
+            picked = []
+            order = cls._pick_order(
+                medicine_batches, txn.batch_number, today if txn.transaction_type == 'DISPENSED' else None
+            )
+            for batch in order:
+                if needed <= 0:
+                    break
+                take = min(batch.on_hand, needed)
+                if take <= 0:
+                    continue
+                batch.on_hand -= take
+                needed -= take
+                changed[id(batch)] = batch
+                picked.append(batch)
+            if picked:
+                txn.batch_number = ', '.join(b.batch_number or '-' for b in picked)[:100]
+                txn.expiry_date = min((b.expiry_date for b in picked if b.expiry_date), default=None)
+
+        now = timezone.now()
+        to_create, to_update, emptied = [], [], []
+        for batch in changed.values():
+            batch.updated_at = now
+            if batch.on_hand <= 0:
+                if batch.pk:
+                    emptied.append(batch.pk)
+            elif batch.pk:
+                to_update.append(batch)
+            else:
+                to_create.append(batch)
+        if emptied:
+            cls.objects.filter(pk__in=emptied).delete()
+        if to_update:
+            cls.objects.bulk_update(to_update, ['on_hand', 'updated_at'])
+        if to_create:
+            cls.objects.bulk_create(to_create)
+
+
+class StockSnapshot(models.Model):
+    """
+    Units on hand per medicine at the end of a (local) day, so point-in-time
+    stock is a read of the nearest snapshot plus the transactions between it
+    and the day asked about, instead of a sum over all history. Written
+    nightly for the day before by ``snapshot_stock`` (and on demand); only
+    medicines with stock are stored, so a missing row means zero.
+    """
+    day = models.DateField()
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_snapshots')
+    on_hand = models.IntegerField()
+    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'medicine'], name='stocksnapshot_day_med_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.medicine_id} ({self.on_hand})"
+
+    @staticmethod
+    def end_of(day):
+        """Aware start of the day after ``day``: the cut-off of that day's snapshot."""
+        return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+    @staticmethod
+    def _net(transactions):
+        """{medicine_id: units in minus units out} over a transaction queryset, one grouped query."""
+        rows = (
+            transactions.values('medicine_id')
+            .annotate(net=Sum(Case(
+                When(transaction_type__in=['STOCK_OUT', 'DISPENSED'], then=-F('quantity')),
+                default=F('quantity'),
+            )))
+            .order_by()
+        )
+        return {row['medicine_id']: row['net'] or 0 for row in rows}
+
+    @classmethod
+    def on_hand_as_of(cls, day, medicine_ids=None, recompute=False):
+        """
+        ({medicine_id: units on hand at the end of ``day``}, anchor) where the
+        anchor is the snapshot day the figures were worked out from, or None
+        for current stock. Uses whichever of the nearest earlier snapshot, the
+        nearest later one and current stock is closest to ``day``, so only the
+        transactions between the two are summed. ``recompute`` ignores a
+        snapshot of ``day`` itself, so it can be rebuilt from its neighbours.
+        """
+        today = timezone.localdate()
+        scope = {} if medicine_ids is None else {'medicine_id__in': medicine_ids}
+        medicines = Medicine.objects.all() if medicine_ids is None else Medicine.objects.filter(pk__in=medicine_ids)
+        if day >= today:
+            return dict(medicines.values_list('pk', 'current_stock')), None
+
+        before = Q(day__lt=day) if recompute else Q(day__lte=day)
+        nearest = cls.objects.aggregate(before=models.Max('day', filter=before), after=models.Min('day', filter=Q(day__gt=day)))
+        options = [(today - day, None)]
+        if nearest['after']:
+            options.append(((nearest['after'] - day), nearest['after']))
+        if nearest['before']:
+            options.append(((day - nearest['before']), nearest['before']))
+        # Closest wins; ties go to the earlier snapshot, then the later one
+        anchor = min(reversed(options), key=lambda option: option[0])[1]
+
+        if anchor is None:
+            stock = dict(medicines.values_list('pk', 'current_stock'))
+            later = InventoryTransaction.objects.filter(created_at__gte=cls.end_of(day), **scope)
+            sign = -1
+        else:
+            stock = dict(cls.objects.filter(day=anchor, **scope).values_list('medicine_id', 'on_hand'))
+            lower, upper = sorted([cls.end_of(anchor), cls.end_of(day)])
+            later = InventoryTransaction.objects.filter(created_at__gte=lower, created_at__lt=upper, **scope)
+            sign = 1 if anchor <= day else -1
+        for medicine_id, net in cls._net(later).items():
+            stock[medicine_id] = stock.get(medicine_id, 0) + sign * net
+        return stock, anchor
+
+    @classmethod
+    def take(cls, day):
+        """Write the snapshot for the end of ``day`` (replacing any existing one). Returns rows written."""
+        stock, _ = cls.on_hand_as_of(day, recompute=True)
+        rows = [cls(day=day, medicine_id=pk, on_hand=units) for pk, units in stock.items() if units]
+        with db_transaction.atomic():
+            cls.objects.filter(day=day).delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+def stock_alert_status(current_stock, reorder_level, is_active=True):
+    """Medicine.stock_status for an active medicine; inactive medicines are never flagged."""
+    if not is_active:
+        return 'IN_STOCK'
+    if current_stock <= 0:
+        return 'OUT_OF_STOCK'
+    if current_stock <= reorder_level:
+        return 'LOW_STOCK'
+    return 'IN_STOCK'
+
+
+class StockAlert(models.Model):
+    """
+    The set of active medicines that are low on or out of stock.
+
+    Maintained as stock changes (InventoryTransaction.save / bulk_apply and
+    Medicine.save) instead of rescanning the catalog, so low_stock and
+    out_of_stock are a read of this small table. Every change to the set, or
+    to the stock of a medicine in it, is also appended to StockEvent for the
+    dashboards' event stream. ``rebuild_stock_alerts`` recomputes it from
+    Medicine after bulk data fixes.
+    """
+    STATUS_CHOICES = [
+        ('LOW_STOCK', 'Low stock'),
+        ('OUT_OF_STOCK', 'Out of stock'),
+    ]
+
+    medicine = models.OneToOneField(Medicine, on_delete=models.CASCADE, related_name='stock_alert')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    current_stock = models.IntegerField()
+    reorder_level = models.IntegerField()
+    # When the medicine entered the set (kept while it moves between LOW and OUT)
+    since = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='stockalert_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} - {self.medicine_id} ({self.current_stock}/{self.reorder_level})"
+
+    def as_dict(self):
+        """The low_stock row for this alert; ``medicine`` must be loaded (select_related)."""
+        return {
+            'id': self.medicine_id,
+            'name': self.medicine.name,
+            'category': self.medicine.category,
+            'current_stock': self.current_stock,
+            'reorder_level': self.reorder_level,
+            'stock_status': self.status,
+            'stock_deficit': self.reorder_level - self.current_stock,
+        }
+
+    @classmethod
+    def record(cls, changes):
+        """Update the set for ``(medicine, previous_stock)`` pairs; ``medicine`` already holds the new stock.
+
+        Medicines that were and still are comfortably in stock are skipped
+        without a query, which is the common case for a dispense or stock-in.
+        Caller must hold the medicine locks.
+        """
+        touched = []
+        for medicine, previous_stock in changes:
+            before = stock_alert_status(previous_stock, medicine.reorder_level, medicine.is_active)
+            after = stock_alert_status(medicine.current_stock, medicine.reorder_level, medicine.is_active)
+            if before == after == 'IN_STOCK':
+                continue
+            touched.append(medicine)
+        if touched:
+            cls.sync(touched)
+
+    @classmethod
+    def sync(cls, medicines):
+        """Bring the alerts for ``medicines`` (with current stock values) in line, publishing a StockEvent per change."""
+        medicines = list(medicines)
+        if not medicines:
+            return []
+        existing = {a.medicine_id: a for a in cls.objects.filter(medicine_id__in=[m.pk for m in medicines])}
+        now = timezone.now()
+        upserts, cleared, events = [], [], []
+        for medicine in medicines:
+            alert = existing.get(medicine.pk)
+            previous = alert.status if alert else 'IN_STOCK'
+            status = stock_alert_status(medicine.current_stock, medicine.reorder_level, medicine.is_active)
+            if status == 'IN_STOCK':
+                if alert:
+                    cleared.append(medicine.pk)
+            elif (
+                alert is None or previous != status
+                or alert.current_stock != medicine.current_stock or alert.reorder_level != medicine.reorder_level
+            ):
+                upserts.append(cls(
+                    medicine_id=medicine.pk,
+                    status=status,
+                    current_stock=medicine.current_stock,
+                    reorder_level=medicine.reorder_level,
+                    since=alert.since if alert else now,
+                    updated_at=now,
+                ))
+            else:
+                continue
+            events.append(StockEvent(
+                medicine_id=medicine.pk,
+                name=medicine.name,
+                status=status,
+                previous_status=previous,
+                current_stock=medicine.current_stock,
+                reorder_level=medicine.reorder_level,
+            ))
+
+        if cleared:
+            cls.objects.filter(medicine_id__in=cleared).delete()
+        if upserts:
+            cls.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['medicine'],
+                update_fields=['status', 'current_stock', 'reorder_level', 'since', 'updated_at'],
+            )
+        if events:
+            StockEvent.objects.bulk_create(events)
+        return events
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Recompute the set from Medicine. Returns the number of events published for corrections."""
+        flagged = Q(is_active=True, current_stock__lte=F('reorder_level'))
+        candidates = Medicine.objects.filter(flagged | Q(stock_alert__isnull=False)).order_by('pk')
+        published = 0
+        with db_transaction.atomic():
+            batch = []
+            for medicine in candidates.iterator(chunk_size=batch_size):
+                batch.append(medicine)
+                if len(batch) >= batch_size:
+                    published += len(cls.sync(batch))
+                    batch = []
+            published += len(cls.sync(batch))
+        return published
+
+
+class StockEvent(models.Model):
+    """
+    Append-only log of changes to the low/out-of-stock set, read by the
+    dashboards' event stream (and ``stock_events`` for catch-up). The id is the
+    event cursor; ``status`` IN_STOCK means the medicine left the set.
+    """
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_events')
+    name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20)
+    previous_status = models.CharField(max_length=20)
+    current_stock = models.IntegerField()
+    reorder_level = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at'], name='stockevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.previous_status} -> {self.status} - {self.name}"
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'medicine': self.medicine_id,
+            'name': self.name,
+            'status': self.status,
+            'previous_status': self.previous_status,
+            'current_stock': self.current_stock,
+            'reorder_level': self.reorder_level,
+            'stock_deficit': self.reorder_level - self.current_stock,
+            'created_at': self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def latest_id(cls):
+        return cls.objects.aggregate(last=models.Max('id'))['last'] or 0
+
+    @classmethod
+    def prune(cls, older_than_days):
+        """Delete events older than the retention window. Returns rows deleted."""
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        return cls.objects.filter(created_at__lt=cutoff).delete()[0]
 
 
 class Prescription(models.Model):
@@ -155,6 +860,9 @@ class PrescriptionDispense(models.Model):
 
     class Meta:
         ordering = ['-dispensed_at']
+        indexes = [
+            models.Index(fields=['-dispensed_at', '-id'], name='dispense_dispensed_id_idx'),
+        ]
     
     def __str__(self):
         return f"Dispensed: {self.medicine.name} for {self.prescription.patient.username}"
@@ -162,3 +870,73 @@ class PrescriptionDispense(models.Model):
     @property
     def final_amount(self):
         return (self.amount_charged or Decimal('0.00')) - (self.discount_amount or Decimal('0.00')) + (self.additional_charges or Decimal('0.00'))
+
+
+class OCRJob(models.Model):
+    """
+    An invoice upload waiting for (or done with) OCR.
+
+    parse_invoice queues one of these instead of calling the OCR provider inside
+    the request; pharmacy.ocr_jobs runs it in the background and the client polls
+    for the parsed lines.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    filename = models.CharField(max_length=255, blank=True)
+    # Upload bytes live here only until the job finishes.
+    content = models.BinaryField(blank=True, default=bytes)
+    provider = models.CharField(max_length=30, blank=True)
+    model = models.CharField(max_length=100, blank=True)
+    lines = models.JSONField(default=list, blank=True)
+    error = models.JSONField(default=dict, blank=True)
+    attempts = models.IntegerField(default=0)
+    # True when the text came from OCRCacheEntry instead of the provider
+    cached = models.BooleanField(default=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='ocr_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # workers claim the oldest pending job
+            models.Index(fields=['status', 'created_at'], name='ocrjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"OCR job #{self.id} {self.filename} ({self.status})"
+
+
+class OCRCacheEntry(models.Model):
+    """
+    Extracted text for a document, keyed on the SHA-256 of its bytes and the
+    provider/model that read it. Re-uploading the same invoice is served from
+    here instead of paying for another OCR call (see pharmacy.ocr_cache).
+    """
+    digest = models.CharField(max_length=64)
+    provider = models.CharField(max_length=30)
+    model = models.CharField(max_length=100, blank=True)
+    text = models.TextField()
+    size = models.PositiveIntegerField(default=0)  # bytes of text, for the size bound
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['digest', 'provider', 'model'], name='uniq_ocr_cache_key'),
+        ]
+        indexes = [
+            # LRU eviction walks entries oldest-used first
+            models.Index(fields=['last_used_at'], name='ocrcache_last_used_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.model or '-'} {self.digest[:12]}"
@@ -2,7 +2,7 @@ import os
 import io
 import tempfile
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 
 def _decode_bytes(content: bytes) -> str:
@@ -28,6 +28,38 @@ class OCRService:
     Returns extracted text or None if unsupported/unconfigured.
     """
 
+    @staticmethod
+    def provider_for(filename: str) -> Tuple[str, Optional[str]]:
+        """Return (provider, model) that extract_text will try first for this file."""
+        lower = (filename or '').lower()
+        if lower.endswith('.csv') or lower.endswith('.txt'):
+            return 'passthrough', None
+        if os.getenv('USE_AWS_TEXTRACT') == '1':
+            return 'aws_textract', None
+        if os.getenv('USE_GEMINI') == '1' and os.getenv('GEMINI_API_KEY'):
+            return 'gemini', os.getenv('GEMINI_VISION_MODEL', 'gemini-1.5-flash')
+        return 'unconfigured', None
+
+    @staticmethod
+    def diagnose(filename: str) -> Dict:
+        """Explain why extraction produced no text, for API error responses."""
+        provider, model = OCRService.provider_for(filename)
+        if provider == 'passthrough':
+            hint = 'File appears to be text/CSV but decoding failed. Ensure UTF-8 or CSV formatting.'
+        elif provider == 'gemini':
+            hint = 'Gemini OCR returned no text. Try clearer image/PDF or adjust GEMINI_VISION_MODEL to gemini-1.5-pro.'
+        elif provider == 'aws_textract':
+            hint = 'AWS Textract returned no text. Verify AWS credentials and document quality.'
+        else:
+            hint = 'OCR not configured. Provide CSV/TXT or set USE_GEMINI=1 with GEMINI_API_KEY.'
+        return {
+            'detail': 'Unable to extract text.',
+            'provider': provider,
+            'model': model,
+            'filename': filename,
+            'hint': hint,
+        }
+
     @staticmethod
     def extract_text(content: bytes, filename: str) -> Optional[str]:
         # Quick path: CSV/TXT passthrough
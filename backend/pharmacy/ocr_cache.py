@@ -0,0 +1,96 @@
+"""
+Content-addressed cache for OCR results.
+
+Pharmacists often upload the same supplier invoice several times while they
+reconcile it. Text extracted by Textract/Gemini is stored under
+(SHA-256 of the bytes, provider, model), so a repeat upload skips the provider
+entirely. The cache lives in the database so every web worker and
+run_ocr_worker process shares it.
+
+Bounds (settings):
+- OCR_CACHE_TTL: seconds an entry stays valid after it was extracted.
+- OCR_CACHE_MAX_BYTES: total size of cached text; least recently used entries
+  are evicted past it.
+"""
+import hashlib
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import OCRCacheEntry
+
+# Providers worth caching; passthrough is already free.
+CACHED_PROVIDERS = ('aws_textract', 'gemini')
+
+
+def digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'OCR_CACHE_TTL', 30 * 24 * 3600)))
+
+
+def _max_bytes() -> int:
+    return int(getattr(settings, 'OCR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+
+def lookup(content: bytes, provider: str, model: Optional[str]) -> Optional[str]:
+    """Return cached text for these bytes, or None on a miss or expired entry."""
+    if provider not in CACHED_PROVIDERS:
+        return None
+    now = timezone.now()
+    entry = (
+        OCRCacheEntry.objects
+        .filter(digest=digest(content), provider=provider, model=model or '', created_at__gte=now - _ttl())
+        .only('id', 'text')
+        .first()
+    )
+    if entry is None:
+        return None
+    OCRCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now, hits=F('hits') + 1)
+    return entry.text
+
+
+def store(content: bytes, provider: str, model: Optional[str], text: str) -> None:
+    """Cache extracted text, then evict expired and least recently used entries."""
+    if provider not in CACHED_PROVIDERS or not text:
+        return
+    now = timezone.now()
+    size = len(text.encode('utf-8'))
+    if size > _max_bytes():
+        return
+    key = {'digest': digest(content), 'provider': provider, 'model': model or ''}
+    try:
+        OCRCacheEntry.objects.update_or_create(
+            **key,
+            defaults={'text': text, 'size': size, 'created_at': now, 'last_used_at': now},
+        )
+    except IntegrityError:
+        # Another worker stored the same document concurrently; theirs is as good as ours.
+        pass
+    evict()
+
+
+def evict() -> int:
+    """Drop expired entries, then the least recently used ones until under OCR_CACHE_MAX_BYTES."""
+    removed, _ = OCRCacheEntry.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+
+    limit = _max_bytes()
+    total = OCRCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= limit:
+        return removed
+
+    doomed = []
+    for pk, size in OCRCacheEntry.objects.order_by('last_used_at').values_list('id', 'size').iterator():
+        if total <= limit:
+            break
+        doomed.append(pk)
+        total -= size
+    deleted, _ = OCRCacheEntry.objects.filter(pk__in=doomed).delete()
+    return removed + deleted
+
@@ -0,0 +1,231 @@
+"""
+Background execution of OCR jobs.
+
+parse_invoice stores the upload as an OCRJob and returns immediately. Jobs are
+run either by a thread pool inside the web process (OCR_WORKER_MODE=thread, the
+default) or by ``manage.py run_ocr_worker`` (OCR_WORKER_MODE=external). Both
+claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can
+share the queue.
+
+In thread mode each web process also runs a sweeper (started with the process
+and on the first upload) that requeues jobs left RUNNING by a worker that died,
+e.g. in a restart or deploy, and picks up PENDING jobs nobody is running, the
+same way run_ocr_worker does.
+
+Provider calls are bounded per provider (OCR_PROVIDER_CONCURRENCY) and given a
+deadline (OCR_PROVIDER_TIMEOUT); a job whose provider misses the deadline fails
+instead of pinning a worker. Documents already in the OCR cache never touch a
+provider slot.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import ocr_cache
+from .models import OCRJob
+from .ocr import OCRService, naive_line_parser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30.0
+
+_lock = threading.Lock()
+_job_executor: Optional[ThreadPoolExecutor] = None
+_call_executor: Optional[ThreadPoolExecutor] = None
+_provider_slots = {}
+_sweeper: Optional[threading.Thread] = None
+_in_flight = 0
+
+
+def _worker_threads() -> int:
+    return max(1, int(getattr(settings, 'OCR_WORKER_THREADS', 4)))
+
+
+def _executors():
+    global _job_executor, _call_executor
+    with _lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=_worker_threads(), thread_name_prefix='ocr-job')
+            # Provider calls run on their own pool so a job can stop waiting on a
+            # call that overruns its timeout.
+            _call_executor = ThreadPoolExecutor(max_workers=_worker_threads() * 2, thread_name_prefix='ocr-call')
+        return _job_executor, _call_executor
+
+
+def _slot(provider: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if provider not in _provider_slots:
+            limits = getattr(settings, 'OCR_PROVIDER_CONCURRENCY', {})
+            _provider_slots[provider] = threading.BoundedSemaphore(max(1, int(limits.get(provider, _worker_threads()))))
+        return _provider_slots[provider]
+
+
+def _timeout(provider: str) -> float:
+    return float(getattr(settings, 'OCR_PROVIDER_TIMEOUT', {}).get(provider, DEFAULT_TIMEOUT))
+
+
+def _in_process() -> bool:
+    return getattr(settings, 'OCR_WORKER_MODE', 'thread') == 'thread'
+
+
+def enqueue(job: OCRJob) -> None:
+    """Schedule a freshly created job once the surrounding transaction commits."""
+    if not _in_process():
+        return
+    start_sweeper()
+    job_id = job.pk
+    transaction.on_commit(lambda: _submit(job_id))
+
+
+def _submit(job_id: int, claimed: bool = False) -> None:
+    global _in_flight
+    with _lock:
+        _in_flight += 1
+    _executors()[0].submit(_run_in_thread, job_id, claimed)
+
+
+def _run_in_thread(job_id: int, claimed: bool = False) -> None:
+    global _in_flight
+    try:
+        run_job(job_id, claimed=claimed)
+    except Exception:
+        logger.exception('OCR job %s crashed', job_id)
+    finally:
+        with _lock:
+            _in_flight -= 1
+        close_old_connections()
+
+
+def sweep() -> int:
+    """Requeue stale jobs, then claim pending ones while this process has idle threads. Returns jobs claimed."""
+    requeued = requeue_stale()
+    if requeued:
+        logger.warning('Requeued %s stale OCR jobs', requeued)
+    claimed = 0
+    # Only claim what can start now: a claimed job waiting in the pool would look stale elsewhere
+    while _in_flight < _worker_threads():
+        job_id = claim_next()
+        if job_id is None:
+            break
+        _submit(job_id, claimed=True)
+        claimed += 1
+    return claimed
+
+
+def _sweep_forever() -> None:
+    interval = float(getattr(settings, 'OCR_SWEEP_INTERVAL', 60))
+    while True:
+        try:
+            sweep()
+        except Exception:
+            logger.exception('OCR sweep failed')
+        finally:
+            close_old_connections()
+        time.sleep(interval)
+
+
+def start_sweeper() -> None:
+    """Start this process's sweeper thread (thread mode only; once per process)."""
+    global _sweeper
+    if not _in_process():
+        return
+    with _lock:
+        if _sweeper is not None and _sweeper.is_alive():
+            return
+        _sweeper = threading.Thread(target=_sweep_forever, name='ocr-sweeper', daemon=True)
+        _sweeper.start()
+
+
+def claim_next() -> Optional[int]:
+    """Mark the oldest pending job RUNNING and return its id, or None if the queue is empty."""
+    with transaction.atomic():
+        job = (
+            OCRJob.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('created_at')
+            .only('id')
+            .first()
+        )
+        if job is None:
+            return None
+        OCRJob.objects.filter(pk=job.pk).update(status='RUNNING', started_at=timezone.now(), attempts=F('attempts') + 1)
+        return job.pk
+
+
+def _claim(job_id: int) -> bool:
+    claimed = OCRJob.objects.filter(pk=job_id, status='PENDING').update(
+        status='RUNNING', started_at=timezone.now(), attempts=F('attempts') + 1
+    )
+    return bool(claimed)
+
+
+def _call_provider(job_id: int, provider: str, model: Optional[str], content: bytes, filename: str):
+    """Run extract_text under the provider's concurrency slot and deadline. Returns (text, error)."""
+    slot = _slot(provider)
+    timeout = _timeout(provider)
+    if not slot.acquire(timeout=timeout):
+        return None, {'detail': f'Timed out waiting for a free {provider} slot.', 'provider': provider, 'model': model}
+
+    future = _executors()[1].submit(OCRService.extract_text, content, filename)
+    # The slot is held until the call really returns, even if we stop waiting.
+    future.add_done_callback(lambda _f: slot.release())
+    try:
+        return future.result(timeout=timeout), {}
+    except FutureTimeout:
+        return None, {'detail': f'OCR provider {provider} did not respond within {timeout:g}s.', 'provider': provider, 'model': model}
+    except Exception as exc:
+        logger.exception('OCR job %s failed', job_id)
+        return None, {'detail': f'OCR failed: {exc}', 'provider': provider, 'model': model}
+
+
+def run_job(job_id: int, claimed: bool = False) -> None:
+    """Run one job to completion. Set ``claimed`` when the caller already marked it RUNNING."""
+    if not claimed and not _claim(job_id):
+        return  # another worker got it first
+
+    job = OCRJob.objects.get(pk=job_id)
+    provider, model = OCRService.provider_for(job.filename)
+    OCRJob.objects.filter(pk=job_id).update(provider=provider, model=model or '')
+    content = bytes(job.content)
+    text = ocr_cache.lookup(content, provider, model)
+    cached = text is not None
+    error = {}
+    if not cached:
+        text, error = _call_provider(job_id, provider, model, content, job.filename)
+
+    if text:
+        if not cached:
+            try:
+                ocr_cache.store(content, provider, model, text)
+            except Exception:
+                logger.exception('Could not cache OCR result for job %s', job_id)
+        OCRJob.objects.filter(pk=job_id).update(
+            status='SUCCEEDED', lines=naive_line_parser(text), cached=cached, content=b'', finished_at=timezone.now()
+        )
+        return
+    if not error:
+        error = OCRService.diagnose(job.filename)
+    OCRJob.objects.filter(pk=job_id).update(status='FAILED', error=error, content=b'', finished_at=timezone.now())
+
+
+def requeue_stale(max_attempts: int = 3) -> int:
+    """Return RUNNING jobs abandoned by a dead worker to the queue (or fail them after max_attempts)."""
+    stale_after = getattr(settings, 'OCR_JOB_STALE_AFTER', 600)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = OCRJob.objects.filter(status='RUNNING', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='FAILED',
+        error={'detail': 'OCR job was abandoned by its worker too many times.'},
+        content=b'',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status='PENDING', started_at=None)
+    return requeued + failed
@@ -0,0 +1,125 @@
+"""
+Stock reconciliation: Medicine.current_stock against the inventory ledger.
+
+The ledger (InventoryTransaction) is the record of what happened; a
+medicine's stock should equal its stock-ins and adjustments minus its
+stock-outs and dispenses, and its StockBatch rows should add up to the same
+number. Admin edits, scripts that ``update()`` stock directly or a failure
+halfway through a write can make them disagree.
+
+``find_drift`` splits the medicine ids into chunks and sums each chunk's
+ledger with one grouped query (plus one each for the stock and batch totals),
+running the chunks in a process pool. ``repair`` sets drifted medicines back
+to their ledger total under the medicine lock.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import Case, F, Sum, When
+
+from core import dashboard
+
+from .models import InventoryTransaction, Medicine, StockAlert, StockBatch
+
+OUTGOING = ('STOCK_OUT', 'DISPENSED')
+
+
+def _ledger_net():
+    return Sum(Case(When(transaction_type__in=OUTGOING, then=-F('quantity')), default=F('quantity')))
+
+
+def ledger_totals(medicines):
+    """{medicine_id: stock implied by the ledger} for a Medicine queryset/filter."""
+    rows = (
+        InventoryTransaction.objects.filter(medicine__in=medicines)
+        .values('medicine_id').annotate(net=_ledger_net()).order_by()
+    )
+    return {row['medicine_id']: row['net'] or 0 for row in rows}
+
+
+def check_range(lo, hi):
+    """
+    Drift for medicines with lo <= id < hi, as (id, name, current_stock,
+    ledger, batches) tuples. Three queries; safe to run in a worker process.
+    A ledger below zero (history that predates the stock checks) counts as 0.
+    """
+    id_range = {'medicine_id__gte': lo, 'medicine_id__lt': hi}
+    ledger = {
+        row['medicine_id']: row['net'] or 0
+        for row in InventoryTransaction.objects.filter(**id_range)
+        .values('medicine_id').annotate(net=_ledger_net()).order_by()
+    }
+    batches = {
+        row['medicine_id']: row['units'] or 0
+        for row in StockBatch.objects.filter(**id_range)
+        .values('medicine_id').annotate(units=Sum('on_hand')).order_by()
+    }
+    drift = []
+    for pk, name, stock in Medicine.objects.filter(pk__gte=lo, pk__lt=hi).values_list('pk', 'name', 'current_stock'):
+        expected = ledger.get(pk, 0)
+        in_batches = batches.get(pk, 0)
+        if stock != max(0, expected) or in_batches != stock:
+            drift.append((pk, name, stock, expected, in_batches))
+    return drift
+
+
+def _check_range_in_worker(bounds):
+    try:
+        return check_range(*bounds)
+    finally:
+        # Forked workers must not leave their connections to the parent's teardown
+        connections.close_all()
+
+
+def _chunks(chunk_size):
+    """[lo, hi) id bounds holding ``chunk_size`` medicines each (ids can be sparse)."""
+    ids = list(Medicine.objects.order_by('pk').values_list('pk', flat=True))
+    return [(ids[i], ids[min(i + chunk_size, len(ids)) - 1] + 1) for i in range(0, len(ids), chunk_size)]
+
+
+def find_drift(workers=1, chunk_size=2000):
+    """Every drifted medicine, checking ``chunk_size`` medicine ids per task across ``workers`` processes."""
+    chunks = _chunks(chunk_size)
+    if workers <= 1 or len(chunks) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        drift = [row for bounds in chunks for row in check_range(*bounds)]
+    else:
+        # Children must open their own connections rather than share the parent's socket
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            drift = [row for rows in pool.map(_check_range_in_worker, chunks) for row in rows]
+    return sorted(drift)
+
+
+def repair(medicine_ids):
+    """
+    Set each medicine's current_stock to its ledger total (never below zero)
+    and its batches to match, one medicine lock at a time, re-checking under
+    the lock. Returns the number of medicines changed.
+    """
+    fixed = 0
+    for pk in sorted(medicine_ids):
+        with transaction.atomic():
+            medicine = Medicine.objects.select_for_update().filter(pk=pk).first()
+            if medicine is None:
+                continue
+            expected = max(0, ledger_totals([pk]).get(pk, 0))
+            previous = medicine.current_stock
+            if expected != previous:
+                Medicine.objects.filter(pk=pk).update(current_stock=expected)
+                medicine.current_stock = expected
+                StockAlert.record([(medicine, previous)])
+            in_batches = StockBatch.objects.filter(medicine_id=pk).aggregate(units=Sum('on_hand'))['units'] or 0
+            if in_batches != expected:
+                # An unsaved adjustment moves the batches only: untracked units go
+                # to the undated batch, surplus units leave earliest-expiry first.
+                StockBatch.apply([InventoryTransaction(
+                    medicine_id=pk, transaction_type='ADJUSTMENT', quantity=expected - in_batches,
+                )])
+            if expected != previous or in_batches != expected:
+                fixed += 1
+    if fixed:
+        # update() sends no post_save signals
+        dashboard.invalidate_for(Medicine)
+    return fixed
@@ -0,0 +1,89 @@
+"""
+Medicine catalog autocomplete.
+
+Matches are ranked exact name > name prefix > name substring > generic name /
+manufacturer match, then by trigram similarity (PostgreSQL) so near-misses
+like "amoxicilin" still find Amoxicillin. Every arm of the filter is indexed:
+icontains / istartswith compile to UPPER(col) LIKE UPPER(...) and are served
+by the medicine_*_upper_idx trigram indexes, the % operator by the bare-column
+medicine_*_trgm_idx ones, so PostgreSQL can combine them with a BitmapOr. One- and two-character queries can't use trigrams and match
+almost everything, so they are restricted to prefixes and their results are
+cached for MEDICINE_AUTOCOMPLETE_CACHE_TTL seconds.
+"""
+from typing import Dict, List
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Medicine
+
+AUTOCOMPLETE_LIMIT = 20
+MAX_AUTOCOMPLETE_LIMIT = 50
+# Queries up to this length are prefix-only and cached
+SHORT_QUERY = 2
+
+FIELDS = ('id', 'name', 'category', 'current_stock', 'selling_price')
+
+
+def _uses_trigrams() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def autocomplete_queryset(q: str, limit: int, in_stock: bool):
+    qs = Medicine.objects.filter(is_active=True)
+    if in_stock:
+        qs = qs.filter(current_stock__gt=0)
+
+    rank = Case(
+        When(name__iexact=q, then=Value(3)),
+        When(name__istartswith=q, then=Value(2)),
+        When(name__icontains=q, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+    order = ['-rank', 'name']
+    if len(q) <= SHORT_QUERY:
+        qs = qs.filter(Q(name__istartswith=q) | Q(generic_name__istartswith=q))
+    else:
+        match = Q(name__icontains=q) | Q(generic_name__icontains=q) | Q(manufacturer__icontains=q)
+        if _uses_trigrams():
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            # trigram_similar (the % operator) is what the GIN index can answer; the
+            # similarity score is only computed for rows that already matched.
+            match |= Q(name__trigram_similar=q) | Q(generic_name__trigram_similar=q)
+            qs = qs.filter(match).annotate(
+                similarity=Greatest(TrigramSimilarity('name', q), TrigramSimilarity('generic_name', q))
+            )
+            order = ['-rank', '-similarity', 'name']
+        else:
+            qs = qs.filter(match)
+
+    return qs.annotate(rank=rank).order_by(*order).values(*FIELDS)[:limit]
+
+
+def _search(q: str, limit: int, in_stock: bool) -> List[Dict]:
+    rows = autocomplete_queryset(q, limit, in_stock)
+    return [{**row, 'selling_price': str(row['selling_price'])} for row in rows]
+
+
+def medicine_autocomplete(q: str, limit: int = AUTOCOMPLETE_LIMIT, in_stock: bool = False) -> List[Dict]:
+    """Ranked [{id, name, category, current_stock, selling_price}] for the search box."""
+    q = (q or '').strip()
+    if not q:
+        return []
+    limit = max(1, min(limit, MAX_AUTOCOMPLETE_LIMIT))
+    if len(q) > SHORT_QUERY:
+        return _search(q, limit, in_stock)
+
+    key = f'medicine-autocomplete:{int(in_stock)}:{limit}:{quote(q.lower())}'
+    results = cache.get(key)
+    if results is None:
+        results = _search(q, limit, in_stock)
+        cache.set(key, results, getattr(settings, 'MEDICINE_AUTOCOMPLETE_CACHE_TTL', 30))
+    return results
@@ -2,8 +2,10 @@ import re
 import logging
 from decimal import Decimal
 from django.db import transaction as db_transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Medicine, InventoryTransaction, PrescriptionDispense
+from core import dashboard
+from .models import Medicine, InventoryTransaction, PrescriptionDispense, StockBatch
 from patients.models import Prescription
 from Finance.models import Invoice
 
@@ -34,13 +36,11 @@ class MedicineSerializer(serializers.ModelSerializer):
         # Accept optional initial quantity on creation
         request = self.context.get('request')
         quantity = validated_data.pop('quantity', None)
-        if quantity is not None:
-            # Set initial current_stock from quantity
-            validated_data['current_stock'] = quantity
 
         medicine = super().create(validated_data)
 
-        # Create an initial stock transaction for audit trail
+        # The initial STOCK_IN sets current_stock (and the batch), so stock and
+        # ledger agree from the start
         try:
             if quantity and quantity > 0:
                 InventoryTransaction.objects.create(
@@ -64,7 +64,8 @@ class InventoryTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryTransaction
         fields = '__all__'
-        read_only_fields = ['created_at', 'created_by']
+        # Prices are snapshotted from the medicine when the row is written (InventoryTransaction.save)
+        read_only_fields = ['created_at', 'created_by', 'unit_cost', 'unit_price']
 
 
 class PrescriptionDispenseSerializer(serializers.ModelSerializer):
@@ -117,51 +118,27 @@ class PrescriptionDispenseSerializer(serializers.ModelSerializer):
         except Exception:
             raise serializers.ValidationError('Invalid monetary amount supplied.')
 
-    def validate(self, data):
-        prescription = data.get('prescription')
-        medicine = data.get('medicine')
-
-        if prescription.status != 'PENDING':
-            raise serializers.ValidationError(
-                f"Cannot dispense a prescription with status '{prescription.status}'."
-            )
-
-        # Finance gating: require a PAID invoice linked to this prescription
-        has_paid_invoice = Invoice.objects.filter(prescription=prescription, status='PAID').exists()
-        if not has_paid_invoice:
-            raise serializers.ValidationError({
-                'prescription': 'Payment not approved. Dispensing requires a PAID invoice.'
-            })
-
+    def _dispense_quantity(self, prescription, medicine, requested_qty, available):
+        """Quantity to dispense (computed from the dosage for tablets/capsules), checked against ``available``."""
         # Category-based quantity logic
-        requires_calc = medicine.category in {'TABLET', 'CAPSULE'}
-        if requires_calc:
-            total_qty = self._calculate_total_quantity(prescription)
-        else:
-            total_qty = None
-
-        if not medicine.is_active:
-            raise serializers.ValidationError("This medicine is inactive.")
-
-        # Stock checks
-        requested_qty = data.get('quantity_dispensed')
-        if requires_calc:
-            total_qty = total_qty or 1
-            if medicine.current_stock < total_qty:
+        if medicine.category in {'TABLET', 'CAPSULE'}:
+            total_qty = self._calculate_total_quantity(prescription) or 1
+            if available < total_qty:
                 raise serializers.ValidationError({
-                    "medicine": f"Insufficient stock. Available: {medicine.current_stock}, Needed: {total_qty}"
-                })
-            if not requested_qty:
-                data['quantity_dispensed'] = total_qty
-        else:
-            # For unit-sale categories, require quantity and validate against stock
-            if not requested_qty or requested_qty < 1:
-                raise serializers.ValidationError({'quantity_dispensed': 'Quantity is required for this medicine category.'})
-            if medicine.current_stock < requested_qty:
-                raise serializers.ValidationError({
-                    "medicine": f"Insufficient stock. Available: {medicine.current_stock}, Needed: {requested_qty}"
+                    "medicine": f"Insufficient stock. Available: {available}, Needed: {total_qty}"
                 })
+            return requested_qty or total_qty
+
+        # For unit-sale categories, require quantity and validate against stock
+        if not requested_qty or requested_qty < 1:
+            raise serializers.ValidationError({'quantity_dispensed': 'Quantity is required for this medicine category.'})
+        if available < requested_qty:
+            raise serializers.ValidationError({
+                "medicine": f"Insufficient stock. Available: {available}, Needed: {requested_qty}"
+            })
+        return requested_qty
 
+    def _normalize_charges(self, data):
         discount = self._normalize_decimal(data.get('discount_amount', Decimal('0.00')))
         additional = self._normalize_decimal(data.get('additional_charges', Decimal('0.00')))
         base_amount = self._normalize_decimal(data.get('amount_charged', Decimal('0.00')))
@@ -181,7 +158,33 @@ class PrescriptionDispenseSerializer(serializers.ModelSerializer):
             data['additional_charges_note'] = note or 'Additional Charges'
         else:
             data['additional_charges_note'] = ''
+        return data
+
+    def validate(self, data):
+        prescription = data.get('prescription')
+        medicine = data.get('medicine')
+
+        if prescription.status != 'PENDING':
+            raise serializers.ValidationError(
+                f"Cannot dispense a prescription with status '{prescription.status}'."
+            )
+
+        # Finance gating: require a PAID invoice linked to this prescription
+        has_paid_invoice = Invoice.objects.filter(prescription=prescription, status='PAID').exists()
+        if not has_paid_invoice:
+            raise serializers.ValidationError({
+                'prescription': 'Payment not approved. Dispensing requires a PAID invoice.'
+            })
+
+        if not medicine.is_active:
+            raise serializers.ValidationError("This medicine is inactive.")
 
+        # Expired batches stay on hand until written off, but are never dispensed
+        expired = StockBatch.expired_on_hand([medicine.pk]).get(medicine.pk, 0)
+        data['quantity_dispensed'] = self._dispense_quantity(
+            prescription, medicine, data.get('quantity_dispensed'), medicine.current_stock - expired
+        )
+        self._normalize_charges(data)
         return data
 
 
@@ -199,11 +202,14 @@ class PrescriptionDispenseSerializer(serializers.ModelSerializer):
             # Logging stock before dispensing
             logger.info(f"[DISPENSE START] Prescription #{dispense.prescription.id} | Medicine: {medicine.name} | Quantity: {qty} | Current stock: {medicine.current_stock}")
 
-            # Create inventory transaction (automatically updates stock)
+            # Create inventory transaction (automatically updates stock and takes
+            # the units from the earliest-expiring batches)
             inv_trans = InventoryTransaction.objects.create(
                 medicine=medicine,
                 transaction_type='DISPENSED',
                 quantity=qty,
+                unit_cost=medicine.buying_price,
+                unit_price=medicine.selling_price,
                 prescription=dispense.prescription,
                 notes=f"Dispensed for prescription #{dispense.prescription.id}",
                 created_by=request.user
@@ -211,7 +217,7 @@ class PrescriptionDispenseSerializer(serializers.ModelSerializer):
 
             # Refresh stock after transaction and log
             medicine.refresh_from_db()
-            logger.info(f"[DISPENSE END] Updated stock for {medicine.name}: {medicine.current_stock} | Transaction ID: {inv_trans.id}")
+            logger.info(f"[DISPENSE END] Updated stock for {medicine.name}: {medicine.current_stock} | Batches: {inv_trans.batch_number or '-'} | Transaction ID: {inv_trans.id}")
 
             # Update prescription status
             prescription = dispense.prescription
@@ -254,6 +260,189 @@ class PrescriptionDispenseSerializer(serializers.ModelSerializer):
 
 
 
+class DispenseBatchItemSerializer(PrescriptionDispenseSerializer):
+    """One entry of a batch dispense. Only field-level checks; the batch does the lookups set-based."""
+    prescription = serializers.IntegerField(min_value=1)
+    medicine = serializers.IntegerField(min_value=1)
+    quantity_dispensed = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    class Meta(PrescriptionDispenseSerializer.Meta):
+        fields = [
+            'prescription', 'medicine', 'quantity_dispensed', 'amount_charged', 'discount_amount',
+            'additional_charges', 'additional_charges_note', 'notes',
+        ]
+
+    def validate(self, data):
+        return self._normalize_charges(data)
+
+
+class PrescriptionDispenseBatchSerializer(serializers.Serializer):
+    """
+    Dispense many paid prescriptions in one request.
+
+    Items are validated individually; every valid one is applied in a single
+    transaction with a fixed number of queries regardless of batch size:
+    prescriptions and medicines are locked once (in id order), the PAID-invoice
+    gate is one query for the whole batch, and stock is checked per medicine
+    across the batch (earlier items get the stock first, expired units don't
+    count) before InventoryTransaction.bulk_apply writes it and takes the
+    units from the earliest-expiring batches. Prescriptions that already have
+    a dispense record are found in the same set-based pass. Invalid items are skipped and
+    reported; they never block the rest.
+    """
+    MAX_ITEMS = 200
+
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=MAX_ITEMS)
+
+    def create(self, validated_data):
+        request = self.context['request']
+        items = validated_data['items']
+        results = [None] * len(items)
+
+        def fail(index, errors, prescription_id=None):
+            if isinstance(errors, serializers.ValidationError):
+                errors = errors.detail
+            results[index] = {'index': index, 'prescription': prescription_id, 'status': 'failed', 'errors': errors}
+
+        parsed = []
+        for index, item in enumerate(items):
+            item_serializer = DispenseBatchItemSerializer(data=item)
+            if item_serializer.is_valid():
+                parsed.append((index, item_serializer.validated_data))
+            else:
+                fail(index, item_serializer.errors, item.get('prescription'))
+
+        dispenses = []
+        with db_transaction.atomic():
+            prescription_ids = sorted({data['prescription'] for _, data in parsed})
+            prescriptions = {
+                p.pk: p for p in Prescription.objects.select_for_update(of=('self',))
+                .select_related('patient').filter(pk__in=prescription_ids).order_by('pk')
+            }
+            paid = set(
+                Invoice.objects.filter(prescription_id__in=prescription_ids, status='PAID')
+                .values_list('prescription_id', flat=True)
+            )
+            # A PENDING prescription can still carry a dispense record (e.g. one reset by hand);
+            # another would violate the one-to-one and roll back the whole batch.
+            recorded = set(
+                PrescriptionDispense.objects.filter(prescription_id__in=prescription_ids)
+                .values_list('prescription_id', flat=True)
+            )
+            medicines = {
+                m.pk: m for m in Medicine.objects.select_for_update()
+                .filter(pk__in={data['medicine'] for _, data in parsed}).order_by('pk')
+            }
+            # Expired batches are never dispensed (StockBatch picks unexpired ones first)
+            expired = StockBatch.expired_on_hand(medicines.keys())
+            remaining = {pk: m.current_stock - expired.get(pk, 0) for pk, m in medicines.items()}
+            claimed = set()
+
+            accepted = []
+            for index, data in parsed:
+                prescription = prescriptions.get(data['prescription'])
+                medicine = medicines.get(data['medicine'])
+                if prescription is None:
+                    fail(index, {'prescription': 'Prescription not found.'}, data['prescription'])
+                    continue
+                if medicine is None:
+                    fail(index, {'medicine': 'Medicine not found.'}, prescription.pk)
+                    continue
+                if prescription.pk in claimed:
+                    fail(index, {'prescription': 'Listed more than once in this batch.'}, prescription.pk)
+                    continue
+                if prescription.status != 'PENDING':
+                    fail(index, [f"Cannot dispense a prescription with status '{prescription.status}'."], prescription.pk)
+                    continue
+                if prescription.pk in recorded:
+                    fail(index, {'prescription': 'This prescription already has a dispense record.'}, prescription.pk)
+                    continue
+                if prescription.pk not in paid:
+                    fail(index, {'prescription': 'Payment not approved. Dispensing requires a PAID invoice.'}, prescription.pk)
+                    continue
+                if not medicine.is_active:
+                    fail(index, ['This medicine is inactive.'], prescription.pk)
+                    continue
+                try:
+                    qty = self._item_quantity(prescription, medicine, data.get('quantity_dispensed'), remaining[medicine.pk])
+                except serializers.ValidationError as exc:
+                    fail(index, exc, prescription.pk)
+                    continue
+
+                remaining[medicine.pk] -= qty
+                claimed.add(prescription.pk)
+                accepted.append((index, prescription, medicine, qty))
+                dispenses.append(PrescriptionDispense(
+                    prescription=prescription,
+                    medicine=medicine,
+                    quantity_dispensed=qty,
+                    pharmacist=request.user,
+                    amount_charged=data['amount_charged'],
+                    discount_amount=data['discount_amount'],
+                    additional_charges=data['additional_charges'],
+                    additional_charges_note=data['additional_charges_note'],
+                    notes=data.get('notes', ''),
+                ))
+
+            if dispenses:
+                dispenses = PrescriptionDispense.objects.bulk_create(dispenses)
+                InventoryTransaction.bulk_apply([
+                    InventoryTransaction(
+                        medicine=medicine,
+                        transaction_type='DISPENSED',
+                        quantity=qty,
+                        unit_cost=medicine.buying_price,
+                        unit_price=medicine.selling_price,
+                        prescription=prescription,
+                        notes=f"Dispensed for prescription #{prescription.id}",
+                        created_by=request.user,
+                    )
+                    for _, prescription, medicine, qty in accepted
+                ])
+                Prescription.objects.filter(pk__in=claimed).update(
+                    status='DISPENSED', pharmacist=request.user, updated_at=timezone.now()
+                )
+
+        if dispenses:
+            # bulk_create / update() send no post_save signals
+            dashboard.invalidate_for(Prescription, PrescriptionDispense)
+
+        for (index, prescription, medicine, qty), dispense in zip(accepted, dispenses):
+            results[index] = {
+                'index': index,
+                'prescription': prescription.pk,
+                'status': 'dispensed',
+                'id': dispense.pk,
+                'medicine': medicine.pk,
+                'medicine_name': medicine.name,
+                'patient_name': prescription.patient.name,
+                'quantity_dispensed': qty,
+                'final_amount': str(dispense.final_amount),
+                'medicine_remaining_stock': remaining[medicine.pk] + expired.get(medicine.pk, 0),
+            }
+        if dispenses:
+            logger.info(f"[DISPENSE BATCH] {len(dispenses)} prescriptions dispensed by {request.user.username}")
+
+        return {
+            'dispensed': len(dispenses),
+            'failed': len(items) - len(dispenses),
+            'results': results,
+        }
+
+    def _item_quantity(self, prescription, medicine, requested_qty, available):
+        qty = PrescriptionDispenseSerializer()._dispense_quantity(prescription, medicine, requested_qty, available)
+        if qty > available:
+            raise serializers.ValidationError({
+                "medicine": f"Insufficient stock. Available: {available}, Needed: {qty}"
+            })
+        return qty
+
+
+class ReorderLevelSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    reorder_level = serializers.IntegerField(min_value=0)
+
+
 class LowStockAlertSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
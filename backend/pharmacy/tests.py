@@ -1,3 +1,773 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+import io
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from core.testing import QueryBudgetTestMixin, make_patient
+from Finance.models import Invoice
+from patients.models import Prescription
+from users.models import User
+
+from . import forecast, ocr_cache, ocr_jobs, reconcile
+from .models import (
+    DailyMedicineLedger, InventoryTransaction, Medicine, OCRCacheEntry, OCRJob, PrescriptionDispense, StockAlert, StockBatch,
+    StockEvent, StockSnapshot,
+)
+from .ocr import OCRService
+from .serializers import PrescriptionDispenseBatchSerializer
+
+
+def make_medicine(name, stock=0, category='SYRUP', **fields):
+    """A medicine with ``stock`` units received as one dated batch (through the model, so ledger and batches agree)."""
+    fields.setdefault('buying_price', Decimal('10.00'))
+    fields.setdefault('selling_price', Decimal('15.00'))
+    medicine = Medicine.objects.create(name=name, category=category, **fields)
+    if stock:
+        receive(medicine, stock, 'B-1', timezone.localdate() + timedelta(days=365))
+    return medicine
+
+
+def receive(medicine, quantity, batch_number='', expiry_date=None, user=None):
+    txn = InventoryTransaction(
+        medicine=medicine, transaction_type='STOCK_IN', quantity=quantity,
+        batch_number=batch_number, expiry_date=expiry_date, created_by=user,
+    )
+    txn.save()
+    medicine.refresh_from_db()
+    return txn
+
+
+def make_paid_prescription(username, doctor, medication='Cough syrup'):
+    """A PENDING prescription whose invoice is PAID, ready to dispense."""
+    patient = make_patient(username)
+    prescription = Prescription.objects.create(patient=patient, doctor=doctor, medication=medication, dosage='10ml', duration='5')
+    Invoice.objects.create(patient=patient, prescription=prescription, status='PAID')
+    return prescription
+
+
+class PharmacyApiQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """List, retrieve and the bulk actions stay within the views' query_budget however many rows they touch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        doctor = User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+        cls.medicines = [make_medicine(f'Syrup {i}', stock=50) for i in range(3)]
+        for i, medicine in enumerate(cls.medicines):
+            prescription = make_paid_prescription(f'patient{i}', doctor)
+            PrescriptionDispense.objects.create(
+                prescription=prescription, medicine=medicine, quantity_dispensed=1,
+                pharmacist=cls.pharmacist, amount_charged=Decimal('15.00'),
+            )
+        cls.pending = [make_paid_prescription(f'waiting{i}', doctor) for i in range(3)]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacist)
+
+    def test_medicines(self):
+        self.assertListAndRetrieve('/api/pharmacy/medicines/')
+
+    def test_inventory_transactions(self):
+        self.assertListAndRetrieve('/api/pharmacy/inventory-transactions/')
+
+    def test_dispenses(self):
+        self.assertListAndRetrieve('/api/pharmacy/dispense/')
+
+    def test_expiring(self):
+        response = self.client.get('/api/pharmacy/medicines/expiring/?within=400')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_units'], 150)
+
+    def test_stock_as_of(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        response = self.client.get(f'/api/pharmacy/medicines/stock_as_of/?date={yesterday}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_dispense(self):
+        items = [
+            {'prescription': p.pk, 'medicine': m.pk, 'quantity_dispensed': 2, 'amount_charged': '30.00'}
+            for p, m in zip(self.pending, self.medicines)
+        ]
+        response = self.client.post('/api/pharmacy/dispense/batch/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['dispensed'], 3)
+
+
+class StockBatchTests(TestCase):
+    """Outgoing stock leaves the batches that expire first (FEFO)."""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.medicine = make_medicine('Amoxicillin syrup')
+        receive(self.medicine, 10, 'LATE', self.today + timedelta(days=60))
+        receive(self.medicine, 10, 'SOON', self.today + timedelta(days=30))
+        receive(self.medicine, 5)
+
+    def on_hand(self):
+        return dict(StockBatch.objects.filter(medicine=self.medicine).values_list('batch_number', 'on_hand'))
+
+    def take(self, quantity, transaction_type='DISPENSED', batch_number=''):
+        txn = InventoryTransaction(
+            medicine=self.medicine, transaction_type=transaction_type, quantity=quantity, batch_number=batch_number,
+        )
+        txn.save()
+        return txn
+
+    def test_earliest_expiry_first_and_empty_batches_removed(self):
+        txn = self.take(12)
+        self.assertEqual(self.on_hand(), {'LATE': 8, '': 5})
+        self.assertEqual(txn.batch_number, 'SOON, LATE')
+        self.assertEqual(txn.expiry_date, self.today + timedelta(days=30))
+
+    def test_undated_stock_goes_last(self):
+        self.take(22)
+        self.assertEqual(self.on_hand(), {'': 3})
+
+    def test_named_batch_is_taken_first(self):
+        txn = self.take(4, 'STOCK_OUT', batch_number='LATE')
+        self.assertEqual(self.on_hand(), {'LATE': 6, 'SOON': 10, '': 5})
+        self.assertEqual(txn.batch_number, 'LATE')
+
+    def test_dispensing_skips_expired_batches(self):
+        receive(self.medicine, 3, 'OLD', self.today - timedelta(days=1))
+        self.take(5)
+        self.assertEqual(self.on_hand(), {'OLD': 3, 'LATE': 10, 'SOON': 5, '': 5})
+        # A write-off takes the expired batch first
+        self.take(3, 'STOCK_OUT')
+        self.assertNotIn('OLD', self.on_hand())
+
+    def test_batches_follow_current_stock(self):
+        self.take(7)
+        self.medicine.refresh_from_db()
+        self.assertEqual(sum(self.on_hand().values()), self.medicine.current_stock)
+
+
+def ledger_rows():
+    return list(
+        DailyMedicineLedger.objects.order_by('day', 'medicine_id', 'pharmacist_id').values_list(
+            'day', 'medicine_id', 'pharmacist_id', 'qty_in', 'qty_out', 'qty_dispensed', 'qty_adjusted',
+            'revenue', 'cogs', 'spend', 'dispensed_count', 'stock_in_count',
+        )
+    )
+
+
+class DailyMedicineLedgerTests(TestCase):
+    """InventoryTransaction.save folds each new row into the rollup, matching a rebuild from the transactions."""
+
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.medicine = make_medicine('Ibuprofen syrup')
+
+    def test_record_matches_rebuild(self):
+        receive(self.medicine, 30, user=self.pharmacist)
+        InventoryTransaction(medicine=self.medicine, transaction_type='DISPENSED', quantity=4, created_by=self.pharmacist).save()
+        InventoryTransaction(medicine=self.medicine, transaction_type='DISPENSED', quantity=3, created_by=self.pharmacist).save()
+        InventoryTransaction(medicine=self.medicine, transaction_type='STOCK_OUT', quantity=2, created_by=self.pharmacist).save()
+        InventoryTransaction(medicine=self.medicine, transaction_type='ADJUSTMENT', quantity=-1).save()
+        live = ledger_rows()
+        DailyMedicineLedger.rebuild()
+        self.assertEqual(live, ledger_rows())
+
+        row = DailyMedicineLedger.objects.get(medicine=self.medicine, pharmacist=self.pharmacist)
+        self.assertEqual((row.qty_in, row.qty_out, row.qty_dispensed), (30, 9, 7))
+        self.assertEqual(row.revenue, Decimal('105.00'))
+        self.assertEqual(row.cogs, Decimal('70.00'))
+        self.assertEqual(row.spend, Decimal('300.00'))
+        self.assertEqual((row.dispensed_count, row.stock_in_count), (2, 1))
+        self.assertEqual(DailyMedicineLedger.objects.get(medicine=self.medicine, pharmacist=None).qty_adjusted, -1)
+
+
+class InventoryTransactionApiTests(APITestCase):
+    """Transactions can't be edited or deleted through the API, so the ledger never falls behind them."""
+
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.client.force_authenticate(self.pharmacist)
+        self.medicine = make_medicine('Ledger syrup', stock=20)
+        self.txn = InventoryTransaction.objects.get(medicine=self.medicine)
+        self.url = f'/api/pharmacy/inventory-transactions/{self.txn.pk}/'
+
+    def test_update_is_not_allowed(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.patch(self.url, {'quantity': 99}, format='json')
+            self.assertEqual(response.status_code, 405)
+            response = self.client.put(
+                self.url, {'medicine': self.medicine.pk, 'transaction_type': 'STOCK_IN', 'quantity': 99}, format='json'
+            )
+            self.assertEqual(response.status_code, 405)
+        self.txn.refresh_from_db()
+        self.assertEqual(self.txn.quantity, 20)
+
+    def test_delete_is_not_allowed(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.delete(self.url).status_code, 405)
+        self.assertTrue(InventoryTransaction.objects.filter(pk=self.txn.pk).exists())
+        self.assertEqual(DailyMedicineLedger.objects.get(medicine=self.medicine).qty_in, 20)
+
+    def test_create_updates_the_ledger(self):
+        response = self.client.post(
+            '/api/pharmacy/inventory-transactions/',
+            {'medicine': self.medicine.pk, 'transaction_type': 'DISPENSED', 'quantity': 5},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        row = DailyMedicineLedger.objects.get(medicine=self.medicine, pharmacist=self.pharmacist)
+        self.assertEqual((row.qty_dispensed, row.revenue), (5, Decimal('75.00')))
+
+    def test_prices_come_from_the_medicine(self):
+        response = self.client.post(
+            '/api/pharmacy/inventory-transactions/',
+            {'medicine': self.medicine.pk, 'transaction_type': 'DISPENSED', 'quantity': 1,
+             'unit_cost': '0.01', 'unit_price': '9999.00'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        txn = InventoryTransaction.objects.get(pk=response.data['id'])
+        self.assertEqual((txn.unit_cost, txn.unit_price), (Decimal('10.00'), Decimal('15.00')))
+
+
+class BulkApplyTests(TestCase):
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.a = make_medicine('Paracetamol syrup', stock=20, reorder_level=5)
+        self.b = make_medicine('Cough syrup', stock=8, reorder_level=5)
+
+    def txn(self, medicine, transaction_type, quantity):
+        return InventoryTransaction(
+            medicine=medicine, transaction_type=transaction_type, quantity=quantity, created_by=self.pharmacist,
+        )
+
+    def test_applies_stock_batches_ledger_and_alerts(self):
+        created = InventoryTransaction.bulk_apply([
+            self.txn(self.a, 'DISPENSED', 6),
+            self.txn(self.a, 'STOCK_IN', 4),
+            self.txn(self.b, 'DISPENSED', 5),
+            self.txn(self.a, 'DISPENSED', 3),
+        ])
+        self.assertEqual(len(created), 4)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.current_stock, self.b.current_stock), (15, 3))
+        for medicine in (self.a, self.b):
+            on_hand = sum(StockBatch.objects.filter(medicine=medicine).values_list('on_hand', flat=True))
+            self.assertEqual(on_hand, medicine.current_stock)
+        # Prices are snapshotted from the medicine
+        self.assertTrue(all(t.unit_price == Decimal('15.00') and t.unit_cost == Decimal('10.00') for t in created))
+        self.assertEqual(StockAlert.objects.get(medicine=self.b).status, 'LOW_STOCK')
+        self.assertFalse(StockAlert.objects.filter(medicine=self.a).exists())
+
+    def test_insufficient_stock_writes_nothing(self):
+        with self.assertRaises(ValidationError):
+            InventoryTransaction.bulk_apply([
+                self.txn(self.a, 'DISPENSED', 5),
+                self.txn(self.b, 'DISPENSED', 5),
+                self.txn(self.b, 'DISPENSED', 5),
+            ])
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.current_stock, self.b.current_stock), (20, 8))
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='DISPENSED').count(), 0)
+
+    def test_record_many_matches_rebuild(self):
+        InventoryTransaction.bulk_apply([
+            self.txn(self.a, 'DISPENSED', 6),
+            self.txn(self.a, 'STOCK_IN', 4),
+            self.txn(self.a, 'STOCK_OUT', 1),
+            InventoryTransaction(medicine=self.b, transaction_type='DISPENSED', quantity=2),
+        ])
+        live = ledger_rows()
+        DailyMedicineLedger.rebuild()
+        self.assertEqual(live, ledger_rows())
+        row = DailyMedicineLedger.objects.get(medicine=self.a, pharmacist=self.pharmacist)
+        self.assertEqual((row.qty_in, row.qty_out, row.qty_dispensed), (4, 7, 6))
+
+
+class ApplyInvoiceTests(APITestCase):
+    url = '/api/pharmacy/inventory-transactions/apply_invoice/'
+
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.client.force_authenticate(self.pharmacist)
+        self.a = make_medicine('Invoice syrup A')
+        self.b = make_medicine('Invoice syrup B')
+
+    def test_applies_lines_and_prices(self):
+        response = self.client.post(self.url, {'lines': [
+            {'medicine': self.a.pk, 'quantity': 10, 'buying_price': '12.345', 'batch_number': 'X1', 'expiry_date': '2099-01-31'},
+            {'medicine': self.b.pk, 'quantity': 5},
+            {'medicine': self.a.pk, 'quantity': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(response.data['price_updates'], [{'medicine': self.a.pk, 'name': self.a.name, 'buying_price': '12.35'}])
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.current_stock, self.a.buying_price), (10, Decimal('12.35')))
+        self.assertEqual(InventoryTransaction.objects.get(medicine=self.a).unit_cost, Decimal('12.35'))
+
+    def test_bad_values_are_reported_not_500(self):
+        lines = [
+            {'medicine': self.a.pk, 'quantity': 1, 'buying_price': price}
+            for price in ('NaN', 'Infinity', '-Infinity', '1e20', '-5', 'abc', '1e400')
+        ]
+        lines += [
+            {'medicine': self.b.pk, 'quantity': 10 ** 12},
+            {'medicine': self.b.pk, 'quantity': 3, 'batch_number': 'B' * 101},
+            {'medicine': self.b.pk, 'quantity': 2, 'buying_price': '11.50'},
+        ]
+        response = self.client.post(self.url, {'lines': lines}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Bad prices still stock the line; oversized quantity and batch drop it
+        self.assertEqual(response.data['created_count'], 8)
+        self.assertEqual([s['line'] for s in response.data['skipped']], list(range(9)))
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.current_stock, self.a.buying_price), (7, Decimal('10.00')))
+        self.assertEqual((self.b.current_stock, self.b.buying_price), (2, Decimal('11.50')))
+
+
+INVOICE_TEXT = 'Amoxicillin,10,12.50,LOT1,2099-01-31'
+
+
+@override_settings(OCR_WORKER_MODE='external')
+class OCRJobTests(APITestCase):
+    """parse_invoice queues OCR uploads; workers claim, run and requeue them."""
+
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.client.force_authenticate(self.pharmacist)
+        provider = mock.patch.object(OCRService, 'provider_for', return_value=('gemini', 'gemini-test'))
+        provider.start()
+        self.addCleanup(provider.stop)
+
+    def job(self, content=b'%PDF scan', **fields):
+        return OCRJob.objects.create(filename='invoice.pdf', content=content, provider='gemini', **fields)
+
+    def test_upload_is_queued_and_polled(self):
+        upload = SimpleUploadedFile('invoice.pdf', b'%PDF scan', content_type='application/pdf')
+        response = self.client.post('/api/pharmacy/inventory-transactions/parse_invoice/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        status_url = f'/api/pharmacy/inventory-transactions/ocr_jobs/{job_id}/'
+        self.assertEqual(self.client.get(status_url).data['status'], 'PENDING')
+
+        self.assertEqual(ocr_jobs.claim_next(), job_id)
+        with mock.patch.object(OCRService, 'extract_text', return_value=INVOICE_TEXT):
+            ocr_jobs.run_job(job_id, claimed=True)
+        data = self.client.get(status_url).data
+        self.assertEqual(data['status'], 'SUCCEEDED')
+        self.assertEqual(data['lines'][0]['name'], 'Amoxicillin')
+        self.assertEqual(data['lines'][0]['quantity'], 10)
+        # The upload is dropped once the job is done
+        self.assertEqual(bytes(OCRJob.objects.get(pk=job_id).content), b'')
+
+    def test_provider_failure_fails_the_job(self):
+        job = self.job()
+        with mock.patch.object(OCRService, 'extract_text', side_effect=RuntimeError('quota exceeded')), \
+                self.assertLogs('pharmacy.ocr_jobs', 'ERROR'):
+            ocr_jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('quota exceeded', job.error['detail'])
+        self.assertEqual(job.attempts, 1)
+
+    def test_provider_timeout_fails_the_job(self):
+        job = self.job()
+        with override_settings(OCR_PROVIDER_TIMEOUT={'gemini': 0.05}), \
+                mock.patch.object(OCRService, 'extract_text', side_effect=lambda *args: time.sleep(0.5)):
+            ocr_jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('did not respond', job.error['detail'])
+
+    def test_a_job_runs_once(self):
+        job = self.job()
+        self.assertEqual(ocr_jobs.claim_next(), job.pk)
+        self.assertIsNone(ocr_jobs.claim_next())
+        with mock.patch.object(OCRService, 'extract_text') as extract:
+            # Another worker already holds it
+            ocr_jobs.run_job(job.pk)
+        extract.assert_not_called()
+
+    def test_claims_oldest_first(self):
+        first, second = self.job(), self.job()
+        OCRJob.objects.filter(pk=second.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(ocr_jobs.claim_next(), second.pk)
+        self.assertEqual(ocr_jobs.claim_next(), first.pk)
+
+    def test_requeue_stale(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        stale = self.job(status='RUNNING', started_at=long_ago, attempts=1)
+        exhausted = self.job(status='RUNNING', started_at=long_ago, attempts=3)
+        running = self.job(status='RUNNING', started_at=timezone.now(), attempts=1)
+        self.assertEqual(ocr_jobs.requeue_stale(), 2)
+        statuses = dict(OCRJob.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (statuses[stale.pk], statuses[exhausted.pk], statuses[running.pk]), ('PENDING', 'FAILED', 'RUNNING')
+        )
+
+
+class OCRCacheTests(TestCase):
+    def test_hit_counts_use(self):
+        self.assertIsNone(ocr_cache.lookup(b'scan', 'gemini', 'm'))
+        ocr_cache.store(b'scan', 'gemini', 'm', INVOICE_TEXT)
+        self.assertEqual(ocr_cache.lookup(b'scan', 'gemini', 'm'), INVOICE_TEXT)
+        self.assertEqual(OCRCacheEntry.objects.get().hits, 1)
+        # Keyed on the bytes, provider and model
+        self.assertIsNone(ocr_cache.lookup(b'other scan', 'gemini', 'm'))
+        self.assertIsNone(ocr_cache.lookup(b'scan', 'gemini', 'other-model'))
+        self.assertIsNone(ocr_cache.lookup(b'scan', 'aws_textract', None))
+
+    def test_passthrough_is_not_cached(self):
+        ocr_cache.store(b'a,1', 'passthrough', None, 'a,1')
+        self.assertFalse(OCRCacheEntry.objects.exists())
+
+    @override_settings(OCR_CACHE_TTL=60)
+    def test_expired_entries_miss_and_are_evicted(self):
+        ocr_cache.store(b'scan', 'gemini', 'm', INVOICE_TEXT)
+        OCRCacheEntry.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertIsNone(ocr_cache.lookup(b'scan', 'gemini', 'm'))
+        self.assertEqual(ocr_cache.evict(), 1)
+
+    @override_settings(OCR_CACHE_MAX_BYTES=25)
+    def test_least_recently_used_evicted_past_the_cap(self):
+        ocr_cache.store(b'first', 'gemini', 'm', 'x' * 10)
+        ocr_cache.store(b'second', 'gemini', 'm', 'y' * 10)
+        OCRCacheEntry.objects.filter(text__startswith='x').update(last_used_at=timezone.now() + timedelta(seconds=1))
+        ocr_cache.store(b'third', 'gemini', 'm', 'z' * 10)
+        self.assertEqual(sorted(OCRCacheEntry.objects.values_list('text', flat=True)), ['x' * 10, 'z' * 10])
+
+
+@override_settings(OCR_WORKER_MODE='external')
+class OCRCachedUploadTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST))
+        provider = mock.patch.object(OCRService, 'provider_for', return_value=('gemini', 'gemini-test'))
+        provider.start()
+        self.addCleanup(provider.stop)
+
+    def test_repeat_upload_skips_the_provider(self):
+        job = OCRJob.objects.create(filename='invoice.pdf', content=b'%PDF scan', provider='gemini')
+        with mock.patch.object(OCRService, 'extract_text', return_value=INVOICE_TEXT) as extract:
+            ocr_jobs.run_job(job.pk)
+            # Same bytes again: answered from the cache, inline, with no job
+            upload = SimpleUploadedFile('again.pdf', b'%PDF scan', content_type='application/pdf')
+            response = self.client.post('/api/pharmacy/inventory-transactions/parse_invoice/', {'file': upload}, format='multipart')
+            # A job for the same bytes queued before the first finished is also served from the cache
+            second = OCRJob.objects.create(filename='invoice.pdf', content=b'%PDF scan', provider='gemini')
+            ocr_jobs.run_job(second.pk)
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['cached'])
+        self.assertEqual(response.data['lines'][0]['name'], 'Amoxicillin')
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.cached), ('SUCCEEDED', True))
+
+
+class MedicineAutocompleteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_authenticate(User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST))
+        self.exact = make_medicine('Amox', stock=5)
+        self.prefix = make_medicine('Amoxicillin 250mg', stock=5)
+        self.substring = make_medicine('Co-Amoxiclav', stock=0)
+        self.generic = make_medicine('Moxypen', stock=5, generic_name='Amoxicillin')
+        self.maker = make_medicine('Panadol', stock=5, manufacturer='Amoxa Labs')
+        make_medicine('Amoxil retired', stock=5, is_active=False)
+
+    def suggest(self, query):
+        response = self.client.get(f'/api/pharmacy/medicines/autocomplete/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_ranks_exact_then_prefix_then_substring_then_other_fields(self):
+        self.assertEqual(self.suggest('?q=amox'), ['Amox', 'Amoxicillin 250mg', 'Co-Amoxiclav', 'Moxypen', 'Panadol'])
+
+    def test_in_stock_and_limit(self):
+        self.assertEqual(self.suggest('?q=amox&in_stock=1'), ['Amox', 'Amoxicillin 250mg', 'Moxypen', 'Panadol'])
+        self.assertEqual(self.suggest('?q=amox&limit=2'), ['Amox', 'Amoxicillin 250mg'])
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/api/pharmacy/medicines/autocomplete/?q=amox&limit=x').status_code, 400)
+        self.assertEqual(self.suggest('?q=%20'), [])
+
+    def test_short_query_matches_prefixes_only(self):
+        self.assertEqual(self.suggest('?q=am'), ['Amox', 'Amoxicillin 250mg', 'Moxypen'])
+
+    def test_short_query_is_cached(self):
+        self.assertEqual(self.suggest('?q=am'), ['Amox', 'Amoxicillin 250mg', 'Moxypen'])
+        make_medicine('Amlodipine', stock=5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('?q=AM'), ['Amox', 'Amoxicillin 250mg', 'Moxypen'])
+        self.assertIn('Amlodipine', self.suggest('?q=am&limit=10'))
+        self.assertIn('Amlodipine', self.suggest('?q=aml'))
+
+
+class BatchDispenseTests(TestCase):
+    def setUp(self):
+        self.pharmacist = User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST)
+        self.doctor = User.objects.create_user('doctor', password='x', role=User.Role.DOCTOR)
+        self.medicine = make_medicine('Cough syrup', stock=10)
+        request = APIRequestFactory().post('/api/pharmacy/dispense/batch/')
+        request.user = self.pharmacist
+        self.context = {'request': request}
+
+    def dispense(self, items):
+        serializer = PrescriptionDispenseBatchSerializer(data={'items': items}, context=self.context)
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def item(self, prescription, quantity, medicine=None):
+        return {
+            'prescription': prescription.pk, 'medicine': (medicine or self.medicine).pk,
+            'quantity_dispensed': quantity, 'amount_charged': '15.00',
+        }
+
+    def test_valid_items_are_dispensed_and_the_rest_reported(self):
+        first = make_paid_prescription('first', self.doctor)
+        second = make_paid_prescription('second', self.doctor)
+        unpaid = make_paid_prescription('unpaid', self.doctor)
+        Invoice.objects.filter(prescription=unpaid).update(status='DUE')
+        late = make_paid_prescription('late', self.doctor)
+
+        result = self.dispense([
+            self.item(first, 6),
+            self.item(first, 1),
+            self.item(unpaid, 1),
+            self.item(second, 3),
+            # Earlier items got the stock first: one unit left
+            self.item(late, 2),
+        ])
+        self.assertEqual((result['dispensed'], result['failed']), (2, 3))
+        self.assertEqual(
+            [r['status'] for r in result['results']],
+            ['dispensed', 'failed', 'failed', 'dispensed', 'failed'],
+        )
+        self.assertIn('more than once', str(result['results'][1]['errors']))
+        self.assertIn('PAID invoice', str(result['results'][2]['errors']))
+        self.assertIn('Insufficient stock', str(result['results'][4]['errors']))
+        self.assertEqual(result['results'][3]['medicine_remaining_stock'], 1)
+
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 1)
+        self.assertEqual(PrescriptionDispense.objects.count(), 2)
+        statuses = dict(Prescription.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[first.pk], 'DISPENSED')
+        self.assertEqual(statuses[late.pk], 'PENDING')
+        self.assertEqual(
+            InventoryTransaction.objects.filter(transaction_type='DISPENSED', prescription=second).get().quantity, 3
+        )
+
+    def test_expired_units_are_not_dispensed(self):
+        receive(self.medicine, 5, 'OLD', timezone.localdate() - timedelta(days=1))
+        result = self.dispense([self.item(make_paid_prescription('patient', self.doctor), 12)])
+        self.assertEqual(result['dispensed'], 0)
+        self.assertIn('Available: 10', str(result['results'][0]['errors']))
+
+    def test_prescription_with_a_dispense_record_fails_alone(self):
+        reset = make_paid_prescription('reset', self.doctor)
+        PrescriptionDispense.objects.create(
+            prescription=reset, medicine=self.medicine, quantity_dispensed=1,
+            pharmacist=self.pharmacist, amount_charged=Decimal('15.00'),
+        )
+        other = make_paid_prescription('other', self.doctor)
+        result = self.dispense([self.item(reset, 1), self.item(other, 2)])
+        self.assertEqual([r['status'] for r in result['results']], ['failed', 'dispensed'])
+        self.assertIn('already has a dispense record', str(result['results'][0]['errors']))
+        self.assertEqual(PrescriptionDispense.objects.filter(prescription=other).count(), 1)
+
+    def test_invalidates_dashboards(self):
+        prescription = make_paid_prescription('patient', self.doctor)
+        with mock.patch('pharmacy.serializers.dashboard.invalidate_for') as invalidate_for:
+            self.dispense([self.item(prescription, 1)])
+        invalidate_for.assert_any_call(Prescription, PrescriptionDispense)
+
+
+
+@mock.patch('pharmacy.views.close_old_connections')
+@override_settings(STOCK_STREAM_POLL_INTERVAL=0.01, STOCK_STREAM_MAX_SECONDS=0.05, STOCK_STREAM_MAX_STREAMS=1)
+class StockStreamTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('pharmacist', password='x', role=User.Role.PHARMACIST))
+        self.low = make_medicine('Cough syrup', stock=5, reorder_level=10)
+
+    def test_streams_events_after_the_cursor(self, close_old_connections):
+        make_medicine('Eye drops', stock=1, reorder_level=10)
+        response = self.client.get('/api/pharmacy/medicines/stock_stream/', HTTP_LAST_EVENT_ID='0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: 3000\n\n'))
+        self.assertEqual(body.count('event: stock'), StockEvent.objects.count())
+        self.assertIn(f'id: {StockEvent.latest_id()}\n', body)
+        self.assertIn('"name": "Eye drops"', body)
+        # The connection is released while the stream sleeps
+        close_old_connections.assert_called()
+
+    def test_streams_beyond_the_cap_are_turned_away(self, close_old_connections):
+        first = self.client.get('/api/pharmacy/medicines/stock_stream/')
+        self.assertEqual(first.status_code, 200)
+        with self.assertLogs('django.request', 'ERROR'):
+            refused = self.client.get('/api/pharmacy/medicines/stock_stream/')
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused['Retry-After'], '30')
+        self.assertEqual(refused.content, b'retry: 30000\n\n')
+
+        # Finishing the first stream frees its slot
+        b''.join(first.streaming_content)
+        # ... and so does a response closed before it was read (client went away)
+        second = self.client.get('/api/pharmacy/medicines/stock_stream/')
+        self.assertEqual(second.status_code, 200)
+        second.close()
+        third = self.client.get('/api/pharmacy/medicines/stock_stream/')
+        self.assertEqual(third.status_code, 200)
+        third.close()
+
+    def test_low_stock_etag_changes_with_the_set(self, close_old_connections):
+        def low_stock(etag=None):
+            headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+            return self.client.get('/api/pharmacy/medicines/low_stock/', **headers)
+
+        response = low_stock()
+        self.assertEqual([row['name'] for row in response.data], ['Cough syrup'])
+        etag = response['ETag']
+        self.assertEqual(low_stock(etag).status_code, 304)
+
+        self.low.name = 'Cough syrup 100ml'
+        self.low.save()
+        response = low_stock(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data], ['Cough syrup 100ml'])
+
+        other = make_medicine('Eye drops', stock=1, reorder_level=10)
+        etag = low_stock()['ETag']
+        other.delete()
+        response = low_stock(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data], ['Cough syrup 100ml'])
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.good = make_medicine('Good syrup', stock=10)
+        self.drifted = make_medicine('Drifted syrup', stock=10, reorder_level=5)
+        InventoryTransaction(medicine=self.drifted, transaction_type='DISPENSED', quantity=4).save()
+
+    def test_finds_and_repairs_drift(self):
+        self.assertEqual(reconcile.find_drift(), [])
+        Medicine.objects.filter(pk=self.drifted.pk).update(current_stock=2)
+        StockBatch.objects.filter(medicine=self.good).update(on_hand=7)
+
+        drift = reconcile.find_drift(chunk_size=1)
+        self.assertEqual(drift, sorted([
+            (self.good.pk, 'Good syrup', 10, 10, 7),
+            (self.drifted.pk, 'Drifted syrup', 2, 6, 6),
+        ]))
+
+        self.assertEqual(reconcile.repair([pk for pk, *_ in drift]), 2)
+        self.assertEqual(reconcile.find_drift(), [])
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.current_stock, 6)
+        # The stock alert follows the repaired stock
+        self.assertFalse(StockAlert.objects.filter(medicine=self.drifted).exists())
+        self.assertEqual(reconcile.repair([self.good.pk]), 0)
+
+
+class StockSnapshotTests(TestCase):
+    """on_hand_as_of agrees with the transaction history whichever anchor it starts from."""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.medicine = make_medicine('Snapshot syrup')
+        # Stock on hand at the end of each of the last ten days: +10 ten days ago, then -1 a day
+        self.expected = {}
+        self.moves = [(10, 'STOCK_IN', 10)] + [(days, 'DISPENSED', 1) for days in range(9, 0, -1)]
+        stock = 0
+        for days, transaction_type, quantity in self.moves:
+            txn = InventoryTransaction(medicine=self.medicine, transaction_type=transaction_type, quantity=quantity)
+            txn.save()
+            InventoryTransaction.objects.filter(pk=txn.pk).update(created_at=timezone.now() - timedelta(days=days))
+            stock += quantity if transaction_type == 'STOCK_IN' else -quantity
+            self.expected[self.today - timedelta(days=days)] = stock
+
+    def on_hand(self, day, **kwargs):
+        stock, anchor = StockSnapshot.on_hand_as_of(day, [self.medicine.pk], **kwargs)
+        return stock.get(self.medicine.pk, 0), anchor
+
+    def test_without_snapshots_works_back_from_current_stock(self):
+        for day, units in self.expected.items():
+            self.assertEqual(self.on_hand(day), (units, None))
+        self.assertEqual(self.on_hand(self.today - timedelta(days=20)), (0, None))
+
+    def test_uses_the_nearest_snapshot(self):
+        anchor = self.today - timedelta(days=8)
+        StockSnapshot.take(anchor)
+        self.assertEqual(StockSnapshot.objects.get(day=anchor).on_hand, self.expected[anchor])
+        for days in (9, 8, 7, 6):
+            day = self.today - timedelta(days=days)
+            self.assertEqual(self.on_hand(day), (self.expected[day], anchor))
+
+    def test_take_recomputes_a_corrupted_snapshot(self):
+        day = self.today - timedelta(days=5)
+        StockSnapshot.objects.create(day=day, medicine=self.medicine, on_hand=999)
+        self.assertEqual(self.on_hand(day), (999, day))
+        StockSnapshot.take(day)
+        self.assertEqual(StockSnapshot.objects.get(day=day).on_hand, self.expected[day])
+
+    def test_command_snapshots_yesterday_and_backfills(self):
+        call_command('snapshot_stock', '--days', '3', stdout=io.StringIO())
+        for days in (1, 2, 3):
+            day = self.today - timedelta(days=days)
+            self.assertEqual(StockSnapshot.objects.get(day=day, medicine=self.medicine).on_hand, self.expected[day])
+        with self.assertRaises(CommandError):
+            call_command('snapshot_stock', '--date', self.today.isoformat(), stdout=io.StringIO())
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.busy = make_medicine('Busy syrup', stock=100, reorder_level=5)
+        self.idle = make_medicine('Idle syrup', stock=40, reorder_level=12)
+        # Two units a day for each of the last 28 complete days
+        for days in range(1, 29):
+            txn = InventoryTransaction(medicine=self.busy, transaction_type='DISPENSED', quantity=2)
+            txn.save()
+            InventoryTransaction.objects.filter(pk=txn.pk).update(created_at=timezone.now() - timedelta(days=days))
+        self.params = forecast.parse_params({'days': 28, 'window': 28, 'lead_time': 7, 'cover_days': 30})
+
+    def test_suggest(self):
+        results = {row['id']: row for row in forecast.suggest(self.params)}
+        busy = results[self.busy.pk]
+        self.assertEqual(busy['avg_daily'], 2.0)
+        self.assertEqual(busy['std_daily'], 0.0)
+        self.assertEqual(busy['suggested_reorder_level'], 14)
+        # 14 + 60 units of cover, less the 44 in stock
+        self.assertEqual(busy['current_stock'], 44)
+        self.assertEqual(busy['suggested_order_quantity'], 30)
+        self.assertEqual(busy['days_of_stock'], 22.0)
+        # No history: the level is kept and nothing is ordered
+        idle = results[self.idle.pk]
+        self.assertEqual((idle['suggested_reorder_level'], idle['days_of_stock']), (12, None))
+        # Most urgent first
+        self.assertEqual([row['id'] for row in forecast.suggest(self.params)], [self.busy.pk, self.idle.pk])
+
+    def test_parse_params_rejects_bad_values(self):
+        for data in ({'days': 'x'}, {'lead_time': -1}, {'days': 10, 'window': 20}):
+            with self.assertRaises(ValueError):
+                forecast.parse_params(data)
+
+    def test_apply_reorder_levels(self):
+        changed = forecast.apply_reorder_levels({self.busy.pk: 50, self.idle.pk: 12})
+        self.assertEqual(changed, [self.busy.pk])
+        self.busy.refresh_from_db()
+        self.assertEqual(self.busy.reorder_level, 50)
+        self.assertEqual(StockAlert.objects.get(medicine=self.busy).status, 'LOW_STOCK')
@@ -1,24 +1,134 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import F, Q, Sum, DecimalField, ExpressionWrapper
-from django.db import transaction
-from .models import Medicine, InventoryTransaction, PrescriptionDispense
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.db.models import Count, F, Max, Q, Sum
+from django.db import close_old_connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from .models import (
+    Medicine, InventoryTransaction, PrescriptionDispense, DailyMedicineLedger, OCRJob, StockAlert, StockEvent,
+    StockBatch, StockSnapshot,
+)
 from .serializers import (
     MedicineSerializer,
     InventoryTransactionSerializer,
     PrescriptionDispenseSerializer,
-    LowStockAlertSerializer
+    PrescriptionDispenseBatchSerializer,
+    LowStockAlertSerializer,
+    ReorderLevelSerializer,
 )
 from .permissions import IsPharmacyStaff, CanDispensePrescription, CanImportInvoices
 from .ocr import OCRService, naive_line_parser
-from datetime import date
+from . import forecast, ocr_cache, ocr_jobs
+from .search import medicine_autocomplete, AUTOCOMPLETE_LIMIT
+from core.pagination import NamePagination, InventoryTransactionPagination, DispensedAtPagination
+from core.renderers import EventStreamRenderer
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+import json
+import threading
+import time
+
+STOCK_EVENTS_LIMIT = 500
+EXPIRING_DEFAULT_DAYS = 30
+EXPIRING_MAX_DAYS = 3650
+REORDER_SUGGESTIONS_LIMIT = 100
+MAX_REORDER_SUGGESTIONS_LIMIT = 5000
+
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+class StockStreamSlot:
+    """
+    One of the STOCK_STREAM_MAX_STREAMS stream slots of this process.
+
+    A stream holds a worker thread for up to STOCK_STREAM_MAX_SECONDS, so only
+    a few may be open at once; the rest of the threads stay free for ordinary
+    requests. Wraps the event generator as the response's streaming content:
+    Django calls close() when the response is done, which gives the slot back
+    even if the generator never started.
+    """
+
+    def __init__(self):
+        self._events = None
+        self._held = False
+
+    def acquire(self):
+        global _open_streams
+        with _open_streams_lock:
+            if _open_streams >= getattr(settings, 'STOCK_STREAM_MAX_STREAMS', 2):
+                return False
+            _open_streams += 1
+        self._held = True
+        return True
+
+    def stream(self, events):
+        self._events = events
+        return self
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def close(self):
+        global _open_streams
+        try:
+            if self._events is not None:
+                self._events.close()
+        finally:
+            if self._held:
+                self._held = False
+                with _open_streams_lock:
+                    _open_streams -= 1
+
+
+def stock_event_stream(last_id):
+    """Server-sent events for every StockEvent after ``last_id``.
+
+    Checks the event log every STOCK_STREAM_POLL_INTERVAL seconds (an index
+    range scan on the primary key) and ends after STOCK_STREAM_MAX_SECONDS;
+    clients reconnect with Last-Event-ID and pick up where they left off.
+    Between polls the database connection is released (close_old_connections
+    closes it when CONN_MAX_AGE is 0, which hands it back to the pool in
+    ``native`` pool mode), so a sleeping stream doesn't hold a pool slot.
+    """
+    poll = getattr(settings, 'STOCK_STREAM_POLL_INTERVAL', 2)
+    deadline = time.monotonic() + getattr(settings, 'STOCK_STREAM_MAX_SECONDS', 300)
+    # Tell EventSource-style clients how long to wait before reconnecting
+    yield 'retry: 3000\n\n'
+    idle = 0.0
+    while time.monotonic() < deadline:
+        events = list(StockEvent.objects.filter(id__gt=last_id).order_by('id')[:100])
+        for event in events:
+            last_id = event.id
+            yield f"id: {event.id}\nevent: stock\ndata: {json.dumps(event.as_dict())}\n\n"
+        if events:
+            idle = 0.0
+            continue
+        if idle >= 15:
+            # Comment line keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+            idle = 0.0
+        close_old_connections()
+        time.sleep(poll)
+        idle += poll
 
 
 class MedicineViewSet(viewsets.ModelViewSet):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
+    query_budget = {'list': 4, 'retrieve': 4, 'expiring': 2, 'stock_as_of': 5,
+                    'reorder_suggestions': 2, 'apply_reorder_levels': 12}
     permission_classes = [IsPharmacyStaff]
+    pagination_class = NamePagination
+    # OrderingFilter lets the cursor paginator honour ?ordering= as its key.
+    filter_backends = [filters.OrderingFilter]
     filterset_fields = ['category', 'is_active']
     search_fields = ['name', 'generic_name', 'manufacturer']
     ordering_fields = ['name', 'current_stock', 'created_at']
@@ -35,35 +145,200 @@ class MedicineViewSet(viewsets.ModelViewSet):
                 Q(generic_name__icontains=search) |
                 Q(manufacturer__icontains=search)
             )
-        ordering = self.request.query_params.get('ordering')
-        if ordering:
-            qs = qs.order_by(ordering)
         return qs
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Ranked medicine suggestions for search boxes.
+        Query params: q (required), limit (default 20, max 50), in_stock=1 to hide items with no stock.
+        Returns: [{ id, name, category, current_stock, selling_price }]
+        """
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            return Response({'detail': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        in_stock = request.query_params.get('in_stock') in ('1', 'true')
+        return Response(medicine_autocomplete(request.query_params.get('q', ''), limit=limit, in_stock=in_stock))
+
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
-        meds = Medicine.objects.filter(current_stock__lte=F('reorder_level'), is_active=True)
-        alerts = [{
-            'id': m.id,
-            'name': m.name,
-            'category': m.category,
-            'current_stock': m.current_stock,
-            'reorder_level': m.reorder_level,
-            'stock_status': m.stock_status,
-            'stock_deficit': m.reorder_level - m.current_stock
-        } for m in meds]
-        serializer = LowStockAlertSerializer(alerts, many=True)
-        return Response(serializer.data)
+        """Active medicines at or below their reorder level, read from the maintained StockAlert set.
+        The ETag covers the latest stock event id, the size of the set and the last change to any
+        medicine in it (renames, deletions); a matching If-None-Match gets 304 Not Modified.
+        """
+        state = StockAlert.objects.aggregate(count=Count('pk'), changed=Max('medicine__updated_at'))
+        changed = int(state['changed'].timestamp() * 1_000_000) if state['changed'] else 0
+        etag = f'"stock-{StockEvent.latest_id()}-{state["count"]}-{changed}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        alerts = StockAlert.objects.select_related('medicine').order_by('medicine__name')
+        data = [a.as_dict() for a in alerts]
+        serializer = LowStockAlertSerializer(data, many=True)
+        return Response(serializer.data, headers=headers)
+
+    @action(detail=False, methods=['get'])
+    def expiring(self, request):
+        """Batches on hand that expire within ?within=<days> (default 30), soonest first.
+        Already-expired batches are included (negative days_left) unless ?include_expired=0.
+        Returns: { as_of, within, total_units, results: [{ id, medicine, medicine_name, batch_number,
+                   expiry_date, days_left, on_hand, value_at_cost }] }
+        """
+        try:
+            within = int(request.query_params.get('within', EXPIRING_DEFAULT_DAYS))
+        except ValueError:
+            return Response({'detail': 'within must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= within <= EXPIRING_MAX_DAYS:
+            return Response({'detail': f'within must be between 0 and {EXPIRING_MAX_DAYS}.'}, status=status.HTTP_400_BAD_REQUEST)
+        today = timezone.localdate()
+        batches = StockBatch.objects.filter(expiry_date__lte=today + timedelta(days=within))
+        if request.query_params.get('include_expired') in ('0', 'false'):
+            batches = batches.filter(expiry_date__gte=today)
+        batches = batches.select_related('medicine').only(
+            'medicine_id', 'batch_number', 'expiry_date', 'on_hand', 'medicine__name', 'medicine__buying_price'
+        ).order_by('expiry_date', 'medicine__name')
+        results = [batch.as_dict(today) for batch in batches]
+        return Response({
+            'as_of': today,
+            'within': within,
+            'total_units': sum(row['on_hand'] for row in results),
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'])
+    def stock_as_of(self, request):
+        """Units on hand per medicine at the end of ?date=YYYY-MM-DD (optionally ?medicine=<id>).
+        Worked out from the nearest StockSnapshot (or current stock) plus the transactions in between.
+        Returns: { date, source, results: [{ id, name, category, on_hand }] }
+        """
+        day = parse_day(request.query_params, 'date')
+        if day is None:
+            return Response({'detail': 'date is required (YYYY-MM-DD).'}, status=status.HTTP_400_BAD_REQUEST)
+        medicine_ids = None
+        if request.query_params.get('medicine'):
+            try:
+                medicine_ids = [int(request.query_params['medicine'])]
+            except ValueError:
+                return Response({'detail': 'medicine must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        stock, anchor = StockSnapshot.on_hand_as_of(day, medicine_ids)
+        # Medicines that existed by the end of that day
+        medicines = Medicine.objects.filter(created_at__lt=StockSnapshot.end_of(day)).order_by('name')
+        if medicine_ids is not None:
+            medicines = medicines.filter(pk__in=medicine_ids)
+        results = [
+            {'id': pk, 'name': name, 'category': category, 'on_hand': stock.get(pk, 0)}
+            for pk, name, category in medicines.values_list('pk', 'name', 'category')
+        ]
+        return Response({
+            'date': day,
+            'source': f'snapshot {anchor.isoformat()}' if anchor else 'current stock',
+            'results': results,
+        })
 
     @action(detail=False, methods=['get'])
     def out_of_stock(self, request):
-        meds = Medicine.objects.filter(current_stock=0, is_active=True)
+        meds = Medicine.objects.filter(stock_alert__status='OUT_OF_STOCK')
         serializer = self.get_serializer(meds, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def stock_events(self, request):
+        """Changes to the low/out-of-stock set after ?after=<event id> (oldest first, at most 500).
+        Returns: { last_event_id, events: [{ id, medicine, name, status, previous_status, current_stock, ... }] }
+        """
+        try:
+            after = int(request.query_params.get('after') or 0)
+        except ValueError:
+            return Response({'detail': 'after must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        events = [e.as_dict() for e in StockEvent.objects.filter(id__gt=after).order_by('id')[:STOCK_EVENTS_LIMIT]]
+        last = events[-1]['id'] if events else max(after, StockEvent.latest_id())
+        return Response({'last_event_id': last, 'events': events})
+
+    @action(detail=False, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def stock_stream(self, request):
+        """Server-sent events (event: stock) as medicines enter, move within or leave the low/out-of-stock set.
+        Resumes after the Last-Event-ID header (or ?last_event_id=); otherwise starts with new events only.
+        """
+        raw = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        try:
+            last_id = int(raw) if raw else StockEvent.latest_id()
+        except ValueError:
+            return Response({'detail': 'Last-Event-ID must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        slot = StockStreamSlot()
+        if not slot.acquire():
+            # Too many open streams in this process; EventSource clients retry after the delay
+            retry = getattr(settings, 'STOCK_STREAM_RETRY_SECONDS', 30)
+            response = HttpResponse(f'retry: {retry * 1000}\n\n', content_type='text/event-stream', status=503)
+            response['Retry-After'] = str(retry)
+            response['Cache-Control'] = 'no-cache'
+            return response
+        response = StreamingHttpResponse(slot.stream(stock_event_stream(last_id)), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx-style proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def reorder_suggestions(self, request):
+        """Reorder levels and order quantities forecast from dispensing history, most urgent first.
+        Query params: days (history, default 90), window (moving average, default 28), lead_time (default 7),
+        service_level (default 0.95), cover_days (default 30), medicine=<id>, changed_only=1, limit (default 100).
+        Returns: { params, count, results: [{ id, name, current_stock, reorder_level, avg_daily, std_daily,
+                   safety_stock, suggested_reorder_level, suggested_order_quantity, days_of_stock }] }
+        """
+        try:
+            params = forecast.parse_params(request.query_params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', REORDER_SUGGESTIONS_LIMIT))
+            medicine_ids = [int(request.query_params['medicine'])] if request.query_params.get('medicine') else None
+        except ValueError:
+            return Response({'detail': 'limit and medicine must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, MAX_REORDER_SUGGESTIONS_LIMIT))
+        results = forecast.suggest(params, medicine_ids)
+        if request.query_params.get('changed_only') in ('1', 'true'):
+            results = [row for row in results if row['suggested_reorder_level'] != row['reorder_level']]
+        return Response({'params': params, 'count': len(results), 'results': results[:limit]})
+
+    @action(detail=False, methods=['post'])
+    def apply_reorder_levels(self, request):
+        """Set reorder levels in bulk, with one UPDATE.
+        Body: { levels: [{ id, reorder_level }] }, or no levels to apply the current suggestions
+        (same parameters as reorder_suggestions) to medicine_ids: [...] or, with all: true, to the
+        whole catalog.
+        Returns: { updated, medicine_ids }
+        """
+        if 'levels' in request.data:
+            serializer = ReorderLevelSerializer(data=request.data['levels'], many=True)
+            serializer.is_valid(raise_exception=True)
+            levels = {row['id']: row['reorder_level'] for row in serializer.validated_data}
+        else:
+            try:
+                params = forecast.parse_params(request.data)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            medicine_ids = request.data.get('medicine_ids')
+            if medicine_ids is not None:
+                try:
+                    medicine_ids = [int(pk) for pk in medicine_ids]
+                except (TypeError, ValueError):
+                    return Response({'detail': 'medicine_ids must be a list of integers.'}, status=status.HTTP_400_BAD_REQUEST)
+            elif str(request.data.get('all', '')).lower() not in ('true', '1'):
+                # Rewriting every reorder level in the catalog has to be asked for
+                return Response(
+                    {'detail': 'Send levels, medicine_ids, or all: true to apply the suggestions to every medicine.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            levels = {row['id']: row['suggested_reorder_level'] for row in forecast.suggest(params, medicine_ids)}
+        changed = forecast.apply_reorder_levels(levels)
+        return Response({'updated': len(changed), 'medicine_ids': changed})
+
     @action(detail=True, methods=['get'])
     def transaction_history(self, request, pk=None):
         medicine = self.get_object()
@@ -96,6 +371,8 @@ class MedicineViewSet(viewsets.ModelViewSet):
             quantity=qty,
             batch_number=batch,
             expiry_date=exp_date,
+            unit_cost=medicine.buying_price,
+            unit_price=medicine.selling_price,
             notes='Manual stock-in via add_stock endpoint',
             created_by=request.user,
         )
@@ -103,12 +380,68 @@ class MedicineViewSet(viewsets.ModelViewSet):
         return Response({'medicine': medicine.id, 'name': medicine.name, 'current_stock': medicine.current_stock, 'added': qty})
 
 
+# Largest quantity an IntegerField holds on every supported database
+MAX_INVOICE_QUANTITY = 2 ** 31 - 1
+
+
+def invoice_price(value):
+    """A buying price from an invoice line rounded to cents, or None unless it is a finite, non-negative amount that fits Medicine.buying_price."""
+    try:
+        price = Decimal(str(value))
+        if not price.is_finite():
+            return None
+        price = price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except ArithmeticError:
+        # InvalidOperation: not a number, or beyond the context precision
+        return None
+    if price < 0 or len(price.as_tuple().digits) > Medicine._meta.get_field('buying_price').max_digits:
+        return None
+    return price
+
+
+def parse_day(params, name):
+    """The YYYY-MM-DD query param ``name`` as a date, or None if absent. Malformed or impossible dates are a 400."""
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        day = parse_date(raw)
+    except ValueError:
+        # Well-formed but not a real date, e.g. 2024-02-30
+        day = None
+    if day is None:
+        raise ValidationError({name: 'Enter a valid date (YYYY-MM-DD).'})
+    return day
+
+
+def filter_ledger(qs, params):
+    """Apply the start/end/medicine/pharmacist filters shared by the finance summaries to ledger rows."""
+    start = parse_day(params, 'start')
+    end = parse_day(params, 'end')
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+    for name in ('medicine', 'pharmacist'):
+        if params.get(name):
+            try:
+                qs = qs.filter(**{f'{name}_id': int(params[name])})
+            except ValueError:
+                raise ValidationError({name: 'Must be an integer.'})
+    return qs
+
+
 class InventoryTransactionViewSet(viewsets.ModelViewSet):
-    queryset = InventoryTransaction.objects.all()
+    queryset = InventoryTransaction.objects.select_related('medicine', 'created_by')
     serializer_class = InventoryTransactionSerializer
+    query_budget = {'list': 4, 'retrieve': 4}
     permission_classes = [IsPharmacyStaff]
+    pagination_class = InventoryTransactionPagination
     filterset_fields = ['medicine', 'transaction_type', 'created_by']
     ordering_fields = ['created_at']
+    # Transactions are an append-only ledger: stock, batches and DailyMedicineLedger
+    # are applied when a row is written, so corrections are new ADJUSTMENT rows.
+    http_method_names = ['get', 'post', 'head', 'options']
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -117,33 +450,11 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
     def profit_summary(self, request):
         """Gross profit from dispensed items: revenue - cost of goods sold.
         Optional filters: start (YYYY-MM-DD), end (YYYY-MM-DD), medicine, pharmacist.
+        Served from DailyMedicineLedger.
         """
-        qs = InventoryTransaction.objects.filter(transaction_type='DISPENSED')
-
-        start = request.query_params.get('start')
-        end = request.query_params.get('end')
-        medicine = request.query_params.get('medicine')
-        pharmacist = request.query_params.get('pharmacist')
-
-        if start:
-            qs = qs.filter(created_at__date__gte=start)
-        if end:
-            qs = qs.filter(created_at__date__lte=end)
-        if medicine:
-            qs = qs.filter(medicine_id=medicine)
-        if pharmacist:
-            qs = qs.filter(created_by_id=pharmacist)
-
-        revenue_expr = ExpressionWrapper(
-            F('quantity') * F('medicine__selling_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
+        agg = filter_ledger(DailyMedicineLedger.objects.all(), request.query_params).aggregate(
+            revenue=Sum('revenue'), cogs=Sum('cogs'), count=Sum('dispensed_count')
         )
-        cogs_expr = ExpressionWrapper(
-            F('quantity') * F('medicine__buying_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
-        )
-
-        agg = qs.aggregate(revenue=Sum(revenue_expr), cogs=Sum(cogs_expr))
         revenue = agg.get('revenue') or 0
         cogs = agg.get('cogs') or 0
         profit = revenue - cogs
@@ -152,40 +463,23 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
             'revenue': str(revenue),
             'cogs': str(cogs),
             'profit': str(profit),
-            'count': qs.count(),
+            'count': agg.get('count') or 0,
         })
 
     @action(detail=False, methods=['get'])
     def spend_summary(self, request):
         """Total money spent acquiring stock: sum(quantity * buying_price) for STOCK_IN.
         Optional filters: start (YYYY-MM-DD), end (YYYY-MM-DD), medicine, pharmacist.
+        Served from DailyMedicineLedger.
         """
-        qs = InventoryTransaction.objects.filter(transaction_type='STOCK_IN')
-
-        start = request.query_params.get('start')
-        end = request.query_params.get('end')
-        medicine = request.query_params.get('medicine')
-        pharmacist = request.query_params.get('pharmacist')
-
-        if start:
-            qs = qs.filter(created_at__date__gte=start)
-        if end:
-            qs = qs.filter(created_at__date__lte=end)
-        if medicine:
-            qs = qs.filter(medicine_id=medicine)
-        if pharmacist:
-            qs = qs.filter(created_by_id=pharmacist)
-
-        spent_expr = ExpressionWrapper(
-            F('quantity') * F('medicine__buying_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
+        agg = filter_ledger(DailyMedicineLedger.objects.all(), request.query_params).aggregate(
+            spent=Sum('spend'), count=Sum('stock_in_count')
         )
-        agg = qs.aggregate(spent=Sum(spent_expr))
         spent = agg.get('spent') or 0
 
         return Response({
             'spent': str(spent),
-            'count': qs.count(),
+            'count': agg.get('count') or 0,
         })
 
     @action(detail=False, methods=['get'])
@@ -193,51 +487,27 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
         """Combined overview: revenue, cost of goods sold (COGS), profit, and money spent on stock.
         Uses DISPENSED transactions for revenue/COGS and STOCK_IN for spend.
         Optional filters: start (YYYY-MM-DD), end (YYYY-MM-DD), medicine, pharmacist.
+        Served from DailyMedicineLedger in a single aggregate query.
         """
-        start = request.query_params.get('start')
-        end = request.query_params.get('end')
-        medicine = request.query_params.get('medicine')
-        pharmacist = request.query_params.get('pharmacist')
-
-        dispensed = InventoryTransaction.objects.filter(transaction_type='DISPENSED')
-        stock_in = InventoryTransaction.objects.filter(transaction_type='STOCK_IN')
-
-        for qs in (dispensed, stock_in):
-            if start:
-                qs = qs.filter(created_at__date__gte=start)
-            if end:
-                qs = qs.filter(created_at__date__lte=end)
-            if medicine:
-                qs = qs.filter(medicine_id=medicine)
-            if pharmacist:
-                qs = qs.filter(created_by_id=pharmacist)
-
-        revenue_expr = ExpressionWrapper(
-            F('quantity') * F('medicine__selling_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
+        agg = filter_ledger(DailyMedicineLedger.objects.all(), request.query_params).aggregate(
+            revenue=Sum('revenue'),
+            cogs=Sum('cogs'),
+            spent=Sum('spend'),
+            dispensed_count=Sum('dispensed_count'),
+            stock_in_count=Sum('stock_in_count'),
         )
-        cogs_expr = ExpressionWrapper(
-            F('quantity') * F('medicine__buying_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
-        )
-        spent_expr = cogs_expr
-
-        rev_agg = dispensed.aggregate(revenue=Sum(revenue_expr))
-        cogs_agg = dispensed.aggregate(cogs=Sum(cogs_expr))
-        spent_agg = stock_in.aggregate(spent=Sum(spent_expr))
-
-        revenue = rev_agg.get('revenue') or 0
-        cogs = cogs_agg.get('cogs') or 0
+        revenue = agg.get('revenue') or 0
+        cogs = agg.get('cogs') or 0
         profit = revenue - cogs
-        spent = spent_agg.get('spent') or 0
+        spent = agg.get('spent') or 0
 
         return Response({
             'revenue': str(revenue),
             'cogs': str(cogs),
             'profit': str(profit),
             'spent': str(spent),
-            'dispensed_count': dispensed.count(),
-            'stock_in_count': stock_in.count(),
+            'dispensed_count': agg.get('dispensed_count') or 0,
+            'stock_in_count': agg.get('stock_in_count') or 0,
         })
 
     @action(detail=False, methods=['post'], url_path='stock_in')
@@ -290,6 +560,8 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
             quantity=qty,
             batch_number=batch,
             expiry_date=exp_date,
+            unit_cost=med.buying_price,
+            unit_price=med.selling_price,
             notes='Manual stock-in via stock_in endpoint',
             created_by=request.user,
         )
@@ -310,7 +582,10 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'], url_path='parse_invoice', permission_classes=[CanImportInvoices])
     def parse_invoice(self, request):
         """Parse an uploaded invoice file (CSV/TXT passthrough or OCR) into structured lines.
-        Returns: { lines: [{ name, quantity, buying_price, batch_number, expiry_date }] }
+        CSV/TXT, or a document already in the OCR cache:
+            returns { lines: [{ name, quantity, buying_price, batch_number, expiry_date }], cached }
+        Anything else needing OCR is queued and answered with 202: { job_id, status, status_url };
+        poll ocr_jobs/<job_id>/ for the lines.
         """
         file_obj = request.FILES.get('file')
         if not file_obj:
@@ -318,54 +593,89 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
 
         content = file_obj.read()
         filename = getattr(file_obj, 'name', '')
-        text = OCRService.extract_text(content, filename)
-        if not text:
-            # Provide more actionable diagnostics
-            import os
-            lower = (filename or '').lower()
-            if lower.endswith('.csv') or lower.endswith('.txt'):
-                hint = 'File appears to be text/CSV but decoding failed. Ensure UTF-8 or CSV formatting.'
-                provider = 'passthrough'
-                model = None
-            elif os.getenv('USE_GEMINI') == '1' and os.getenv('GEMINI_API_KEY'):
-                provider = 'gemini'
-                model = os.getenv('GEMINI_VISION_MODEL', 'gemini-1.5-flash')
-                hint = 'Gemini OCR returned no text. Try clearer image/PDF or adjust GEMINI_VISION_MODEL to gemini-1.5-pro.'
-            elif os.getenv('USE_AWS_TEXTRACT') == '1':
-                provider = 'aws_textract'
-                model = None
-                hint = 'AWS Textract returned no text. Verify AWS credentials and document quality.'
-            else:
-                provider = 'unconfigured'
-                model = None
-                hint = 'OCR not configured. Provide CSV/TXT or set USE_GEMINI=1 with GEMINI_API_KEY.'
-
-            return Response({
-                'detail': 'Unable to extract text.',
-                'provider': provider,
-                'model': model,
-                'filename': filename,
-                'hint': hint,
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        lines = naive_line_parser(text)
-        return Response({'lines': lines})
+        provider, model = OCRService.provider_for(filename)
+
+        if provider == 'passthrough':
+            text = OCRService.extract_text(content, filename)
+            if not text:
+                return Response(OCRService.diagnose(filename), status=status.HTTP_400_BAD_REQUEST)
+            return Response({'lines': naive_line_parser(text), 'cached': False})
+
+        if provider == 'unconfigured':
+            return Response(OCRService.diagnose(filename), status=status.HTTP_400_BAD_REQUEST)
+
+        # Re-uploads of a document we have already read skip the queue entirely.
+        text = ocr_cache.lookup(content, provider, model)
+        if text is not None:
+            return Response({'lines': naive_line_parser(text), 'cached': True, 'provider': provider, 'model': model})
+
+        job = OCRJob.objects.create(
+            filename=filename,
+            content=content,
+            provider=provider,
+            model=model or '',
+            created_by=request.user,
+        )
+        ocr_jobs.enqueue(job)
+        return Response({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': request.build_absolute_uri(
+                reverse('inventory-transaction-ocr-job', kwargs={'job_id': job.id})
+            ),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'ocr_jobs/(?P<job_id>\d+)', url_name='ocr-job', permission_classes=[CanImportInvoices])
+    def ocr_job(self, request, job_id=None):
+        """Status of a queued invoice OCR job.
+        Returns: { job_id, status, cached, filename, provider, model, lines?, detail?, hint? }
+        """
+        jobs = OCRJob.objects.defer('content')
+        if getattr(request.user, 'role', None) != 'ADMIN':
+            jobs = jobs.filter(created_by=request.user)
+        try:
+            job = jobs.get(pk=job_id)
+        except OCRJob.DoesNotExist:
+            return Response({'detail': 'OCR job not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            'job_id': job.id,
+            'status': job.status,
+            'cached': job.cached,
+            'filename': job.filename,
+            'provider': job.provider,
+            'model': job.model or None,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+        if job.status == 'SUCCEEDED':
+            data['lines'] = job.lines
+        elif job.status == 'FAILED':
+            data.update(job.error)
+        return Response(data)
 
     @action(detail=False, methods=['post'], url_path='apply_invoice', permission_classes=[CanImportInvoices])
     def apply_invoice(self, request):
         """Apply parsed invoice lines as STOCK_IN transactions and optionally update buying prices.
         Expects: { lines: [{ medicine, quantity, buying_price?, batch_number?, expiry_date? }] }
-        Returns: { created_count, price_updates: [{ medicine, name, buying_price }] }
+        Returns: { created_count, price_updates: [{ medicine, name, buying_price }], skipped: [{ line, detail }] }
+
+        All lines are applied in one transaction with a fixed number of queries:
+        medicines are fetched and locked in id order once, prices are written
+        with one bulk update and stock with InventoryTransaction.bulk_apply.
+        Values the database can't store are caught while parsing: such a line
+        is skipped, and a bad buying price only drops the price update. Both
+        are listed in ``skipped``.
         """
         payload = request.data or {}
         lines = payload.get('lines') or []
         if not isinstance(lines, list):
             return Response({'detail': 'Invalid payload: lines must be a list.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_count = 0
-        price_updates = []
-
-        for l in lines:
+        parsed = []
+        skipped = []
+        for index, l in enumerate(lines):
             try:
                 med_id = int(l.get('medicine'))
                 qty = int(l.get('quantity') or 0)
@@ -374,27 +684,23 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
 
             if med_id <= 0 or qty <= 0:
                 continue
-
-            try:
-                med = Medicine.objects.get(pk=med_id)
-            except Medicine.DoesNotExist:
+            if qty > MAX_INVOICE_QUANTITY:
+                skipped.append({'line': index, 'detail': f'Quantity {qty} is too large.'})
                 continue
 
             # Optional buying price update
+            new_bp = None
             bp = l.get('buying_price')
             if bp not in (None, ''):
-                try:
-                    from decimal import Decimal
-                    new_bp = Decimal(str(bp))
-                    if med.buying_price != new_bp:
-                        med.buying_price = new_bp
-                        med.save(update_fields=['buying_price'])
-                        price_updates.append({'medicine': med.id, 'name': med.name, 'buying_price': str(new_bp)})
-                except Exception:
-                    pass
+                new_bp = invoice_price(bp)
+                if new_bp is None:
+                    skipped.append({'line': index, 'detail': f'Buying price {bp!r} is not a valid amount; price not updated.'})
 
             # Optional batch and expiry
-            batch = l.get('batch_number') or ''
+            batch = str(l.get('batch_number') or '')
+            if len(batch) > InventoryTransaction._meta.get_field('batch_number').max_length:
+                skipped.append({'line': index, 'detail': 'Batch number is too long.'})
+                continue
             exp = l.get('expiry_date') or None
             exp_date = None
             if exp:
@@ -403,27 +709,52 @@ class InventoryTransactionViewSet(viewsets.ModelViewSet):
                 except Exception:
                     exp_date = None
 
-            # Create STOCK_IN transaction (model will handle stock increment)
-            InventoryTransaction.objects.create(
-                medicine=med,
-                transaction_type='STOCK_IN',
-                quantity=qty,
-                batch_number=batch,
-                expiry_date=exp_date,
-                notes='Imported via invoice',
-                created_by=request.user,
-            )
-            created_count += 1
+            parsed.append((med_id, qty, new_bp, batch, exp_date))
 
-        return Response({'created_count': created_count, 'price_updates': price_updates})
+        price_updates = []
+        transactions = []
+        with transaction.atomic():
+            medicines = {
+                m.pk: m for m in Medicine.objects.select_for_update().filter(pk__in={p[0] for p in parsed}).order_by('pk')
+            }
+            repriced = {}
+            for med_id, qty, new_bp, batch, exp_date in parsed:
+                med = medicines.get(med_id)
+                if med is None:
+                    continue
+                if new_bp is not None and med.buying_price != new_bp:
+                    med.buying_price = new_bp
+                    repriced[med.pk] = med
+                    price_updates.append({'medicine': med.id, 'name': med.name, 'buying_price': str(new_bp)})
+
+                transactions.append(InventoryTransaction(
+                    medicine=med,
+                    transaction_type='STOCK_IN',
+                    quantity=qty,
+                    batch_number=batch,
+                    expiry_date=exp_date,
+                    unit_cost=med.buying_price,
+                    unit_price=med.selling_price,
+                    notes='Imported via invoice',
+                    created_by=request.user,
+                ))
+
+            if repriced:
+                Medicine.objects.bulk_update(list(repriced.values()), ['buying_price'])
+            InventoryTransaction.bulk_apply(transactions)
+
+        return Response({'created_count': len(transactions), 'price_updates': price_updates, 'skipped': skipped})
 
 
 class PrescriptionDispenseViewSet(viewsets.ModelViewSet):
     queryset = PrescriptionDispense.objects.select_related(
-        'medicine', 'pharmacist', 'prescription', 'prescription__patient', 'prescription__patient__patient_profile'
+        'medicine', 'pharmacist', 'prescription', 'prescription__patient', 'prescription__patient__user'
     ).all()
     serializer_class = PrescriptionDispenseSerializer
+    # batch is a fixed number of queries however many items it carries
+    query_budget = {'list': 4, 'retrieve': 4, 'batch': 20}
     permission_classes = [CanDispensePrescription]
+    pagination_class = DispensedAtPagination
     filterset_fields = ['medicine', 'pharmacist', 'prescription']
     ordering_fields = ['dispensed_at']
 
@@ -434,3 +765,15 @@ class PrescriptionDispenseViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """Dispense a list of paid prescriptions in one transaction.
+        Expects: { items: [{ prescription, medicine, quantity_dispensed?, amount_charged, discount_amount?,
+                             additional_charges?, additional_charges_note?, notes? }] }
+        Returns: { dispensed, failed, results: [{ index, prescription, status: dispensed|failed, ... }] }
+        """
+        serializer = PrescriptionDispenseBatchSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        result = serializer.save()
+        return Response(result, status=status.HTTP_201_CREATED if result['dispensed'] else status.HTTP_400_BAD_REQUEST)
@@ -1,3 +1,22 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from core.testing import QueryBudgetTestMixin
+
+from .models import User
+
+
+class UserApiQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+	"""List and retrieve stay within the view's query_budget however many users they return."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.admin = User.objects.create_user('admin', password='x', role=User.Role.ADMIN)
+		for role in (User.Role.DOCTOR, User.Role.PHARMACIST, User.Role.FINANCE):
+			User.objects.create_user(role.lower(), password='x', role=role)
+
+	def setUp(self):
+		super().setUp()
+		self.client.force_authenticate(self.admin)
+
+	def test_list_and_retrieve(self):
+		self.assertListAndRetrieve('/api/auth/users/', count=4)
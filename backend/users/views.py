@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from .serializers import UserSerializer, UserCreateSerializer, ChangePasswordSerializer
 from .models import User
 from .permissions import IsAdmin
+from core.pagination import DateJoinedPagination
 
 # Create your views here.
 
@@ -24,6 +25,8 @@ class UserViewSet(viewsets.ModelViewSet):
 	"""
 	queryset = User.objects.all().order_by('-date_joined')
 	permission_classes = [IsAuthenticated, IsAdmin]
+	pagination_class = DateJoinedPagination
+	query_budget = {'list': 4, 'retrieve': 4}
 	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
 	search_fields = ['username', 'email', 'first_name', 'last_name']
 	ordering_fields = ['date_joined', 'username']
@@ -79,6 +79,39 @@ async function refreshAccessToken() {
 	}
 }
 
+// List endpoints are cursor-paginated: { next, previous, results }, where next /
+// previous are full URLs carrying a `cursor` query param (null on the last page).
+
+// The `cursor` param of a next/previous URL, for passing back as `params.cursor`.
+export function cursorFrom(pageUrl) {
+	if (!pageUrl) return null;
+	try {
+		return new URL(pageUrl, API_BASE_URL).searchParams.get('cursor');
+	} catch {
+		return null;
+	}
+}
+
+// Every row of a list endpoint, following `next` cursors page by page.
+// Non-paginated responses (plain arrays) are returned as they are.
+// Pages are requested at FETCH_ALL_PAGE_SIZE rows (each endpoint caps it).
+const FETCH_ALL_PAGE_SIZE = 500;
+
+export async function fetchAll(url, config = {}) {
+	const rows = [];
+	const params = { page_size: FETCH_ALL_PAGE_SIZE, ...(config.params || {}) };
+	for (;;) {
+		const { data } = await api.get(url, { ...config, params });
+		if (!data || !Array.isArray(data.results)) {
+			return Array.isArray(data) ? data : rows;
+		}
+		rows.push(...data.results);
+		const cursor = cursorFrom(data.next);
+		if (!cursor) return rows;
+		params.cursor = cursor;
+	}
+}
+
 api.interceptors.response.use(
 	(res) => res,
 	async (error) => {
@@ -0,0 +1,98 @@
+import { onMounted, onUnmounted } from 'vue';
+import api from '../api/client';
+
+// Subscribes to the pharmacy stock event stream (server-sent events) and calls
+// `onChange(events)` when medicines enter, move within or leave the low/out-of-
+// stock set. EventSource can't send the Authorization header, so the stream is
+// read with fetch. The server closes the stream every few minutes; we reconnect
+// with Last-Event-ID so no events are missed.
+export function useStockEvents(onChange, { debounceMs = 500 } = {}) {
+  let controller = null;
+  let stopped = false;
+  let lastEventId = null;
+  let retryMs = 3000;
+  let pending = [];
+  let flushTimer = null;
+
+  function queue(event) {
+    pending.push(event);
+    clearTimeout(flushTimer);
+    // A batch dispense produces several events at once; refresh once for all of them.
+    flushTimer = setTimeout(() => {
+      const events = pending;
+      pending = [];
+      onChange(events);
+    }, debounceMs);
+  }
+
+  function handleBlock(block) {
+    let id = null;
+    let type = 'message';
+    const data = [];
+    for (const line of block.split('\n')) {
+      if (line.startsWith(':')) continue;
+      const idx = line.indexOf(':');
+      const field = idx === -1 ? line : line.slice(0, idx);
+      const value = idx === -1 ? '' : line.slice(idx + 1).replace(/^ /, '');
+      if (field === 'id') id = value;
+      else if (field === 'event') type = value;
+      else if (field === 'data') data.push(value);
+      else if (field === 'retry' && Number(value) > 0) retryMs = Number(value);
+    }
+    if (id) lastEventId = id;
+    if (type === 'stock' && data.length) {
+      try {
+        queue(JSON.parse(data.join('\n')));
+      } catch (e) {
+        console.error('Bad stock event:', e);
+      }
+    }
+  }
+
+  async function connect() {
+    while (!stopped) {
+      controller = new AbortController();
+      try {
+        const headers = { Accept: 'text/event-stream' };
+        const token = localStorage.getItem('access');
+        if (token) headers.Authorization = `Bearer ${token}`;
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+        const resp = await fetch(`${api.defaults.baseURL}/api/pharmacy/medicines/stock_stream/`, {
+          headers,
+          signal: controller.signal,
+        });
+        if (!resp.ok || !resp.body) throw new Error(`Stock stream failed: ${resp.status}`);
+
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let end;
+          while ((end = buffer.indexOf('\n\n')) !== -1) {
+            handleBlock(buffer.slice(0, end));
+            buffer = buffer.slice(end + 2);
+          }
+        }
+      } catch (e) {
+        if (stopped) return;
+        console.warn('Stock stream disconnected:', e.message);
+      }
+      if (!stopped) await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  }
+
+  onMounted(() => {
+    stopped = false;
+    connect();
+  });
+
+  onUnmounted(() => {
+    stopped = true;
+    clearTimeout(flushTimer);
+    if (controller) controller.abort();
+  });
+}